@@ -0,0 +1,263 @@
+"""Scale TorchServe's workers for the model with demand.
+
+Every ``interval`` seconds ``WorkerAutoscaler`` reads TorchServe's request
+counters from its metrics API (``metrics_mode=prometheus``). Over the last
+interval they give:
+
+* the average time a request waited in TorchServe's job queue;
+* the average number of requests being worked on (busy time per second of
+  wall time, Little's law). Every request of a batch reports the whole
+  batch's duration, so this is divided by the model's ``batchSize`` to give
+  the busy workers.
+
+``decide`` turns that into a worker count, and the controller applies it
+with ``PUT /models/{model}?min_worker=N&max_worker=N`` on the management
+API. Scaling up happens when requests queue or the workers are more than
+``scale_up_utilization`` busy, straight to the count that brings them to
+``target_utilization``. Scaling down happens one step at a time when they
+are below ``scale_down_utilization``. The band between the two thresholds
+and the separate cooldowns keep the count from flapping.
+
+Only one API process scales: the one holding a Postgres advisory lock
+(``AUTOSCALER_LOCK_KEY``) on a connection it keeps. The others try to take
+it every interval, so another process takes over within one interval of
+the scaler stopping.
+"""
+
+import asyncio
+import math
+import os
+import time
+from dataclasses import dataclass
+from typing import Any, Dict, Optional, Tuple
+
+import requests
+
+from api.health import TORCHSERVE_MANAGEMENT_URL
+from api.metrics import AUTOSCALER_DECISIONS, TORCHSERVE_WORKERS
+from api.repositories.locks import try_advisory_lock
+
+AUTOSCALER_ENABLED = os.getenv('AUTOSCALER_ENABLED', 'false').lower() in ('1', 'true', 'yes')
+TORCHSERVE_METRICS_URL = os.getenv('TORCHSERVE_METRICS_URL', 'http://localhost:8082')
+AUTOSCALER_INTERVAL = float(os.getenv('AUTOSCALER_INTERVAL', '5'))
+# Advisory lock that elects the one scaling process; any key no one else uses.
+AUTOSCALER_LOCK_KEY = int(os.getenv('AUTOSCALER_LOCK_KEY', '72430047'))
+
+QUEUE_LATENCY = "ts_queue_latency_microseconds"
+INFERENCE_LATENCY = "ts_inference_latency_microseconds"
+REQUESTS = "ts_inference_requests_total"
+
+
+@dataclass(frozen=True)
+class ScalingPolicy:
+    min_workers: int = 1
+    max_workers: int = os.cpu_count() or 1
+    # Aim for busy workers / workers after scaling up.
+    target_utilization: float = 0.6
+    scale_up_utilization: float = 0.85
+    scale_down_utilization: float = 0.3
+    # Average job queue wait that triggers scaling up.
+    scale_up_queue_ms: float = 50.0
+    # Seconds since the last change before scaling up or down again.
+    up_cooldown: float = 15.0
+    down_cooldown: float = 120.0
+
+    @classmethod
+    def from_env(cls) -> "ScalingPolicy":
+        default = cls()
+        return cls(
+            min_workers=int(os.getenv('AUTOSCALER_MIN_WORKERS', str(default.min_workers))),
+            max_workers=int(os.getenv('AUTOSCALER_MAX_WORKERS', str(default.max_workers))),
+            target_utilization=float(os.getenv('AUTOSCALER_TARGET_UTILIZATION', str(default.target_utilization))),
+            scale_up_queue_ms=float(os.getenv('AUTOSCALER_SCALE_UP_QUEUE_MS', str(default.scale_up_queue_ms))),
+            up_cooldown=float(os.getenv('AUTOSCALER_UP_COOLDOWN', str(default.up_cooldown))),
+            down_cooldown=float(os.getenv('AUTOSCALER_DOWN_COOLDOWN', str(default.down_cooldown))),
+        )
+
+
+@dataclass(frozen=True)
+class Observation:
+    workers: int
+    queue_ms: float  # average job queue wait per request
+    busy: float  # average busy workers
+
+
+@dataclass(frozen=True)
+class Decision:
+    workers: int
+    reason: str
+
+
+def decide(obs: Observation, policy: ScalingPolicy, since_last_change: float) -> Decision:
+    """The worker count for ``obs``; ``since_last_change`` is in seconds."""
+    workers = max(obs.workers, 1)
+    utilization = obs.busy / workers
+    needed = math.ceil(obs.busy / policy.target_utilization) if obs.busy > 0 else policy.min_workers
+
+    if obs.workers < policy.min_workers or obs.workers > policy.max_workers:
+        return Decision(min(max(obs.workers, policy.min_workers), policy.max_workers), "bounds")
+    if obs.queue_ms > policy.scale_up_queue_ms or utilization > policy.scale_up_utilization:
+        target = min(policy.max_workers, max(needed, obs.workers + 1))
+        if target > obs.workers and since_last_change >= policy.up_cooldown:
+            return Decision(target, "queueing" if obs.queue_ms > policy.scale_up_queue_ms else "busy")
+    elif utilization < policy.scale_down_utilization and obs.queue_ms <= policy.scale_up_queue_ms:
+        target = max(policy.min_workers, needed, obs.workers - 1)
+        if target < obs.workers and since_last_change >= policy.down_cooldown:
+            return Decision(target, "idle")
+    return Decision(obs.workers, "steady")
+
+
+def parse_counters(text: str, model: str) -> Dict[str, float]:
+    """Sum the request counters of ``model`` in Prometheus text format."""
+    totals = {QUEUE_LATENCY: 0.0, INFERENCE_LATENCY: 0.0, REQUESTS: 0.0}
+    label = f'model_name="{model}"'
+    for line in text.splitlines():
+        name, _, rest = line.partition("{")
+        if name in totals and label in rest:
+            try:
+                totals[name] += float(rest.rsplit(None, 1)[1])
+            except (IndexError, ValueError):
+                continue
+    return totals
+
+
+def observe(previous: Dict[str, float], current: Dict[str, float], seconds: float, workers: int,
+            batch_size: int = 1) -> Observation:
+    """Demand between two counter samples taken ``seconds`` apart.
+
+    A worker runs up to ``batch_size`` requests at once. The busy workers
+    are counted as if every batch were full, so partial batches under light
+    load read as less busy; queueing still scales up.
+    """
+    requests_done = current[REQUESTS] - previous[REQUESTS]
+    queued_us = current[QUEUE_LATENCY] - previous[QUEUE_LATENCY]
+    total_us = current[INFERENCE_LATENCY] - previous[INFERENCE_LATENCY]
+    if requests_done <= 0 or seconds <= 0 or total_us < 0:
+        # Idle, or TorchServe restarted and the counters started over.
+        return Observation(workers=workers, queue_ms=0.0, busy=0.0)
+    return Observation(
+        workers=workers,
+        queue_ms=queued_us / requests_done / 1000,
+        busy=max(0.0, total_us - queued_us) / 1e6 / seconds / max(batch_size, 1),
+    )
+
+
+class WorkerAutoscaler:
+    """Poll TorchServe and set the model's worker count with ``decide``."""
+
+    def __init__(self, model: str = "where", policy: Optional[ScalingPolicy] = None,
+                 management_url: str = TORCHSERVE_MANAGEMENT_URL, metrics_url: str = TORCHSERVE_METRICS_URL,
+                 interval: float = AUTOSCALER_INTERVAL, timeout: float = 3.0):
+        self.model = model
+        self.policy = policy or ScalingPolicy()
+        self.management_url = management_url.rstrip("/")
+        self.metrics_url = metrics_url.rstrip("/")
+        self.interval = interval
+        self.timeout = timeout
+        self.last_change = float("-inf")
+        self._sample: Optional[tuple] = None
+        self._task: Optional[asyncio.Task] = None
+        self._pool: Any = None
+        self._lock_conn: Any = None
+
+    def _describe(self) -> Tuple[int, int]:
+        """The model's worker count and batch size."""
+        response = requests.get(f"{self.management_url}/models/{self.model}", timeout=self.timeout)
+        response.raise_for_status()
+        model = response.json()[0]
+        return len(model.get("workers", [])), int(model.get("batchSize", 1) or 1)
+
+    def _counters(self) -> Dict[str, float]:
+        response = requests.get(f"{self.metrics_url}/metrics", timeout=self.timeout)
+        response.raise_for_status()
+        return parse_counters(response.text, self.model)
+
+    def _scale(self, workers: int) -> None:
+        response = requests.put(
+            f"{self.management_url}/models/{self.model}",
+            params={"min_worker": workers, "max_worker": workers, "synchronous": "false"},
+            timeout=self.timeout,
+        )
+        if response.status_code not in (200, 202):
+            raise RuntimeError(f"TorchServe answered {response.status_code}: {response.text}")
+
+    async def step(self) -> Optional[Decision]:
+        """Sample TorchServe once and scale if needed; the first call only takes a sample."""
+        counters, (workers, batch_size) = await asyncio.gather(
+            asyncio.to_thread(self._counters), asyncio.to_thread(self._describe))
+        now = time.monotonic()
+        previous, self._sample = self._sample, (now, counters)
+        TORCHSERVE_WORKERS.set(workers)
+        if previous is None:
+            return None
+        obs = observe(previous[1], counters, now - previous[0], workers, batch_size)
+        decision = decide(obs, self.policy, now - self.last_change)
+        if decision.workers != workers:
+            await asyncio.to_thread(self._scale, decision.workers)
+            self.last_change = now
+            AUTOSCALER_DECISIONS.labels("up" if decision.workers > workers else "down").inc()
+            print(f"Scaling {self.model} from {workers} to {decision.workers} workers "
+                  f"({decision.reason}: queue {obs.queue_ms:.1f} ms, {obs.busy:.2f} busy)")
+        return decision
+
+    async def _release_lock(self) -> None:
+        conn, self._lock_conn = self._lock_conn, None
+        if conn is not None:
+            try:
+                # Going back to the pool resets the session and its locks.
+                await self._pool.release(conn)
+            except Exception as e:
+                print(f"Autoscaler lock release failed: {e}")
+
+    async def is_leader(self) -> bool:
+        """Whether this process scales; takes the advisory lock if it is free.
+
+        Without a pool there is no election and this process always scales.
+        """
+        if self._pool is None:
+            return True
+        if self._lock_conn is not None:
+            if not self._lock_conn.is_closed():
+                return True
+            await self._release_lock()
+        conn = await self._pool.acquire()
+        try:
+            taken = await try_advisory_lock(conn, AUTOSCALER_LOCK_KEY)
+        except Exception:
+            await self._pool.release(conn)
+            raise
+        if not taken:
+            await self._pool.release(conn)
+            return False
+        self._lock_conn = conn
+        print(f"Autoscaler elected in process {os.getpid()}")
+        return True
+
+    async def _poll(self) -> None:
+        while True:
+            try:
+                if await self.is_leader():
+                    await self.step()
+                else:
+                    # A new leader starts from a fresh sample.
+                    self._sample = None
+            except Exception as e:
+                print(f"Autoscaler step failed: {e}")
+            await asyncio.sleep(self.interval)
+
+    def start(self, pool: Any = None) -> None:
+        if self._task is None:
+            self._pool = pool
+            if pool is None:
+                print("Autoscaler has no database to elect a leader; run it in one process only")
+            self._task = asyncio.create_task(self._poll(), name="torchserve-autoscaler")
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        await self._release_lock()
@@ -1,3 +1,6 @@
+from functools import lru_cache
+from typing import Optional
+
 from pydantic_settings import BaseSettings
 
 class Settings(BaseSettings):
@@ -12,4 +15,50 @@ class Settings(BaseSettings):
         case_sensitive = True
 
 
-settings = Settings()
+class DatabaseSettings(BaseSettings):
+    """asyncpg pool settings loaded from environment variables.
+
+    Size the pool per uvicorn worker: with N workers a host opens up to
+    ``N * DB_POOL_MAX_SIZE`` connections.
+    """
+
+    DB_POOL_MIN_SIZE: int = 2
+    DB_POOL_MAX_SIZE: int = 10
+    # Seconds to wait for a free connection before failing (unset waits forever).
+    DB_POOL_ACQUIRE_TIMEOUT: Optional[float] = None
+    # Prepared statements cached per connection (asyncpg's default is 100).
+    DB_STATEMENT_CACHE_SIZE: int = 100
+    # Idle connections are closed after this many seconds (0 keeps them forever).
+    DB_MAX_INACTIVE_CONNECTION_LIFETIME: float = 300.0
+    # Default timeout for a single query, in seconds.
+    DB_COMMAND_TIMEOUT: Optional[float] = 30.0
+    # Connect through PgBouncer in transaction pooling mode: no session state
+    # (search_path) and no prepared statement cache.
+    DB_PGBOUNCER_MODE: bool = False
+    # Comma-separated DSNs of read replicas for read-only queries.
+    DATABASE_REPLICA_URLS: str = ""
+    # A replica lagging further behind (seconds) is taken out of rotation.
+    DB_REPLICA_MAX_LAG: float = 5.0
+
+    class Config:
+        env_file = ".env"
+        case_sensitive = True
+        extra = "ignore"
+
+
+@lru_cache
+def get_settings() -> Settings:
+    return Settings()
+
+
+@lru_cache
+def get_database_settings() -> DatabaseSettings:
+    return DatabaseSettings()
+
+
+def __getattr__(name):
+    # ``settings`` is loaded on first use, so importing this module (e.g. for
+    # the database settings) does not require MODEL_PATH and MAPBOX_TOKEN.
+    if name == "settings":
+        return get_settings()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
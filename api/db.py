@@ -1,4 +1,8 @@
+import asyncio
 import os
+import time
+from typing import Dict, Optional
+
 import asyncpg
 from fastapi import FastAPI
 from dotenv import load_dotenv
@@ -6,41 +10,284 @@ from dotenv import load_dotenv
 # NEW → pgvector adapter
 from pgvector.asyncpg import register_vector
 
+from api.config import get_database_settings
+from api.health import pool_stats
+from api.metrics import (
+    DB_POOL_ACQUIRE_WAIT,
+    DB_QUERY_LATENCY,
+    DB_REPLICA_LAG,
+    DB_REPLICAS_IN_ROTATION,
+    set_pool_stats,
+)
+
 load_dotenv()
 
+# Weight of the newest sample in the moving averages reported by ``stats()``.
+_EWMA_ALPHA = 0.1
+
 
 async def init_connection(conn):
-    """Initialize each connection with pgvector and set correct schema."""
-    # Set search path to include whereisthisplace schema
-    await conn.execute("SET search_path TO whereisthisplace, public;")
+    """Initialize each connection with pgvector and set correct schema.
+
+    Behind PgBouncer in transaction pooling mode consecutive transactions may
+    run on different server connections, so nothing session-level is set.
+    The repositories' SQL names the ``whereisthisplace`` schema explicitly,
+    and the vector codec is client-side state of the asyncpg connection.
+    """
+    if not get_database_settings().DB_PGBOUNCER_MODE:
+        # Set search path to include whereisthisplace schema
+        await conn.execute("SET search_path TO whereisthisplace, public;")
     # Register pgvector types
     await register_vector(conn)
 
 
+def connection_options() -> dict:
+    """Per-connection asyncpg options shared by the pool and one-off connections."""
+    settings = get_database_settings()
+    return {
+        # PgBouncer in transaction mode cannot keep named prepared statements
+        # across transactions, so asyncpg must not cache them.
+        "statement_cache_size": 0 if settings.DB_PGBOUNCER_MODE else settings.DB_STATEMENT_CACHE_SIZE,
+        "command_timeout": settings.DB_COMMAND_TIMEOUT,
+    }
+
+
+class _AcquireContext:
+    """Result of ``InstrumentedPool.acquire()``: await it or use ``async with``."""
+
+    __slots__ = ("_pool", "_timeout", "_conn")
+
+    def __init__(self, pool: "InstrumentedPool", timeout):
+        self._pool = pool
+        self._timeout = timeout
+        self._conn = None
+
+    def __await__(self):
+        return self._pool._acquire(self._timeout).__await__()
+
+    async def __aenter__(self):
+        self._conn = await self._pool._acquire(self._timeout)
+        return self._conn
+
+    async def __aexit__(self, *exc_info):
+        conn, self._conn = self._conn, None
+        await self._pool.release(conn)
+
+
+class InstrumentedPool:
+    """Wrap an asyncpg pool to measure how it is used.
+
+    Records the time callers wait for a connection, the connections in use
+    and the callers waiting, and the duration of queries run through the
+    pool's ``execute``/``fetch*`` shortcuts. Gauges are updated on every
+    acquire and release, and ``stats()`` feeds the health snapshot. Anything
+    else is delegated to the wrapped pool.
+    """
+
+    def __init__(self, pool, acquire_timeout: float | None = None, name: str = "primary"):
+        self._pool = pool
+        self.acquire_timeout = acquire_timeout
+        self.name = name
+        self._acquire_wait = DB_POOL_ACQUIRE_WAIT.labels(name)
+        self.in_use = 0
+        self.waiting = 0
+        self.acquire_wait_avg = 0.0
+        self.query_avg = 0.0
+
+    def __getattr__(self, name):
+        return getattr(self._pool, name)
+
+    def stats(self) -> dict:
+        stats = pool_stats(self._pool)
+        stats["in_use"] = self.in_use
+        stats["waiting"] = self.waiting
+        stats["acquire_wait_ms_avg"] = round(self.acquire_wait_avg * 1000, 3)
+        stats["query_ms_avg"] = round(self.query_avg * 1000, 3)
+        return stats
+
+    def acquire(self, *, timeout: float | None = None) -> _AcquireContext:
+        return _AcquireContext(self, timeout if timeout is not None else self.acquire_timeout)
+
+    async def _acquire(self, timeout):
+        self.waiting += 1
+        start = time.perf_counter()
+        try:
+            if timeout is None:
+                conn = await self._pool.acquire()
+            else:
+                conn = await self._pool.acquire(timeout=timeout)
+        finally:
+            self.waiting -= 1
+        wait = time.perf_counter() - start
+        self._acquire_wait.observe(wait)
+        self.acquire_wait_avg += _EWMA_ALPHA * (wait - self.acquire_wait_avg)
+        self.in_use += 1
+        set_pool_stats(self.stats(), self.name)
+        return conn
+
+    async def release(self, conn, *, timeout: float | None = None):
+        try:
+            await self._pool.release(conn, timeout=timeout)
+        finally:
+            self.in_use -= 1
+            set_pool_stats(self.stats(), self.name)
+
+    async def _query(self, operation: str, query: str, args, **kwargs):
+        async with self.acquire() as conn:
+            start = time.perf_counter()
+            try:
+                return await getattr(conn, operation)(query, *args, **kwargs)
+            finally:
+                duration = time.perf_counter() - start
+                DB_QUERY_LATENCY.labels(self.name, operation).observe(duration)
+                self.query_avg += _EWMA_ALPHA * (duration - self.query_avg)
+
+    async def execute(self, query: str, *args, timeout: float | None = None):
+        return await self._query("execute", query, args, timeout=timeout)
+
+    async def executemany(self, command: str, args, *, timeout: float | None = None):
+        return await self._query("executemany", command, (args,), timeout=timeout)
+
+    async def fetch(self, query: str, *args, timeout: float | None = None):
+        return await self._query("fetch", query, args, timeout=timeout)
+
+    async def fetchrow(self, query: str, *args, timeout: float | None = None):
+        return await self._query("fetchrow", query, args, timeout=timeout)
+
+    async def fetchval(self, query: str, *args, column: int = 0, timeout: float | None = None):
+        return await self._query("fetchval", query, args, column=column, timeout=timeout)
+
+
+# 0 when the replica has replayed everything it received, else the age of the
+# last replayed transaction. A server that is not a standby reports 0.
+REPLICA_LAG_QUERY = """
+SELECT CASE
+    WHEN NOT pg_is_in_recovery() THEN 0
+    WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0
+    ELSE COALESCE(EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()), 0)
+END::float8
+"""
+
+
+class ReplicaSet:
+    """Route read-only queries to read replicas.
+
+    ``pool()`` picks the replica in rotation with the fewest outstanding
+    requests (connections in use plus callers waiting). If no replica is in
+    rotation, it returns the primary. ``check()`` is a health check: it
+    measures every replica's replay lag and takes a replica out of rotation
+    while it is unreachable or lags by more than ``max_lag`` seconds. The
+    check itself stays healthy, because reads fall back to the primary.
+    """
+
+    def __init__(self, primary, replicas: Optional[Dict[str, InstrumentedPool]] = None,
+                 max_lag: float = 5.0, check_timeout: float = 2.0):
+        self.primary = primary
+        self.replicas = dict(replicas or {})
+        self.max_lag = max_lag
+        self.check_timeout = check_timeout
+        self.in_rotation = set(self.replicas)
+
+    def pool(self):
+        best = None
+        best_load = None
+        for name in self.in_rotation:
+            replica = self.replicas[name]
+            load = replica.in_use + replica.waiting
+            if best is None or load < best_load:
+                best, best_load = replica, load
+        return best if best is not None else self.primary
+
+    def acquire(self, *, timeout: float | None = None):
+        return self.pool().acquire(timeout=timeout)
+
+    async def fetch(self, query: str, *args, timeout: float | None = None):
+        return await self.pool().fetch(query, *args, timeout=timeout)
+
+    async def fetchrow(self, query: str, *args, timeout: float | None = None):
+        return await self.pool().fetchrow(query, *args, timeout=timeout)
+
+    async def fetchval(self, query: str, *args, column: int = 0, timeout: float | None = None):
+        return await self.pool().fetchval(query, *args, column=column, timeout=timeout)
+
+    async def _check_replica(self, name: str, replica) -> Dict:
+        try:
+            lag = await asyncio.wait_for(replica.fetchval(REPLICA_LAG_QUERY), self.check_timeout)
+        except Exception as e:
+            self.in_rotation.discard(name)
+            return {"healthy": False, "status": f"unhealthy: {str(e) or type(e).__name__}"}
+        DB_REPLICA_LAG.labels(name).set(lag)
+        if lag > self.max_lag:
+            self.in_rotation.discard(name)
+            return {"healthy": False, "status": f"lagging {lag:.1f}s behind", "lag_seconds": round(lag, 3)}
+        self.in_rotation.add(name)
+        return {"healthy": True, "status": "healthy", "lag_seconds": round(lag, 3), "pool": replica.stats()}
+
+    async def check(self) -> Dict:
+        names = list(self.replicas)
+        results = await asyncio.gather(*(self._check_replica(n, self.replicas[n]) for n in names))
+        DB_REPLICAS_IN_ROTATION.set(len(self.in_rotation))
+        return {
+            "healthy": True,
+            "status": f"{len(self.in_rotation)} of {len(names)} replicas in rotation",
+            "replicas": dict(zip(names, results)),
+        }
+
+    async def close(self) -> None:
+        await asyncio.gather(*(replica.close() for replica in self.replicas.values()))
+
+
+async def _create_pool(dsn: str, name: str) -> InstrumentedPool:
+    settings = get_database_settings()
+    # `init=` is run once for every new connection in the pool
+    pool = await asyncpg.create_pool(
+        dsn=dsn,
+        init=init_connection,     # ← updated to use our custom init function
+        min_size=settings.DB_POOL_MIN_SIZE,
+        max_size=settings.DB_POOL_MAX_SIZE,
+        max_inactive_connection_lifetime=settings.DB_MAX_INACTIVE_CONNECTION_LIFETIME,
+        **connection_options(),
+    )
+    return InstrumentedPool(pool, acquire_timeout=settings.DB_POOL_ACQUIRE_TIMEOUT, name=name)
+
+
 async def init_db(app: FastAPI):
     """
     Initialise a connection pool and attach it to the FastAPI app.
 
     The `register_vector` callback tells asyncpg how to decode/encode
     the Postgres `vector` type (provided by the pgvector extension).
+    Pool sizing and timeouts come from ``DatabaseSettings``.
+
+    Writes use ``app.state.pool`` (the primary). Read-only queries use
+    ``app.state.read_pool``, which spreads them over the replicas in
+    ``DATABASE_REPLICA_URLS`` and falls back to the primary.
     """
     database_url = os.getenv("DATABASE_URL")
     if not database_url:
         raise RuntimeError("DATABASE_URL is not set")
 
-    # `init=` is run once for every new connection in the pool
-    app.state.pool = await asyncpg.create_pool(
-        dsn=database_url,
-        init=init_connection,     # ← updated to use our custom init function
-        # optional pool sizing (tweak to your needs)
-        # min_size=1,
-        # max_size=10,
-    )
+    settings = get_database_settings()
+    app.state.pool = await _create_pool(database_url, "primary")
+
+    replicas = {}
+    dsns = [dsn.strip() for dsn in settings.DATABASE_REPLICA_URLS.split(",") if dsn.strip()]
+    for i, dsn in enumerate(dsns):
+        name = f"replica{i}"
+        try:
+            replicas[name] = await _create_pool(dsn, name)
+        except Exception as e:
+            # Reads still work through the primary; a restart picks the replica up again.
+            print(f"Could not connect to read replica {name}: {e}")
+    app.state.read_pool = ReplicaSet(app.state.pool, replicas, max_lag=settings.DB_REPLICA_MAX_LAG)
     return app.state.pool
 
 
 async def close_db(app: FastAPI):
     """Close the connection pool stored on the FastAPI app."""
+    read_pool = getattr(app.state, "read_pool", None)
+    if read_pool is not None:
+        await read_pool.close()
     pool = getattr(app.state, "pool", None)
     if pool is not None:
         await pool.close()
@@ -1,23 +1,49 @@
 #!/usr/bin/env bash
 set -e
 
-# Start TorchServe in the background
-# Use the config file for model loading if possible, or specify models here
-# For simplicity, and since your config.properties has load_models=all,
-# we can rely on that, or be explicit here.
-# Let's be explicit to match your model file name 'where.mar'.
-echo "INFO: Starting TorchServe with model where=where.mar"
-torchserve --start \
-  --model-store /model-store \
-  --models where=where.mar \
-  --ncs & # ncs = no config snapshot
-TS_PID=$!
+# INFERENCE_BACKEND=local runs the model inside the API (LOCAL_MODEL_PATH),
+# so TorchServe and its JVM are not needed.
+if [ "${INFERENCE_BACKEND:-http}" != "local" ]; then
+  # Size workers, batching and queues to this host (TS_PROFILE: latency,
+  # balanced or throughput) on top of the mounted config.properties.
+  TS_CONFIG="${TS_CONFIG:-/tmp/torchserve/config.properties}"
+  python /app/scripts/torchserve_config.py \
+    --profile "${TS_PROFILE:-balanced}" \
+    --base "${TORCHSERVE_CONFIG_FILE:-/app/config/config.properties}" \
+    --model-store /model-store \
+    --output "$TS_CONFIG"
+  # Threads per worker process
+  . "$TS_CONFIG.env"
 
-# It's better to wait for TorchServe to be ready by polling its health endpoint
-# rather than a fixed sleep. However, for simplicity, we'll keep sleep for now
-# but acknowledge it's not the most robust way.
-echo "INFO: Waiting for TorchServe to initialize..."
-sleep 15 # Increased sleep slightly, adjust as needed or implement polling
+  # Start TorchServe in the background
+  # Let's be explicit to match your model file name 'where.mar'.
+  echo "INFO: Starting TorchServe with model where=where.mar"
+  torchserve --start \
+    --model-store /model-store \
+    --models where=where.mar \
+    --ts-config "$TS_CONFIG" \
+    --ncs & # ncs = no config snapshot
+  TS_PID=$!
+
+  # It's better to wait for TorchServe to be ready by polling its health endpoint
+  # rather than a fixed sleep. However, for simplicity, we'll keep sleep for now
+  # but acknowledge it's not the most robust way.
+  echo "INFO: Waiting for TorchServe to initialize..."
+  sleep 15 # Increased sleep slightly, adjust as needed or implement polling
+
+  # Optionally check that the generated config delivers; failures are only reported.
+  if [ "${TS_PROBE:-0}" = "1" ]; then
+    python /app/scripts/torchserve_config.py --probe-url http://localhost:8080 --plan "$TS_CONFIG" \
+      || echo "WARNING: TorchServe throughput probe failed"
+  fi
+fi
+
+# Prometheus multiprocess mode: every uvicorn worker writes its metrics to
+# this directory and /metrics aggregates them. Stale files from a previous
+# run would be summed in, so start from an empty directory.
+export PROMETHEUS_MULTIPROC_DIR="${PROMETHEUS_MULTIPROC_DIR:-/tmp/prometheus_multiproc}"
+rm -rf "$PROMETHEUS_MULTIPROC_DIR"
+mkdir -p "$PROMETHEUS_MULTIPROC_DIR"
 
 echo "INFO: Starting FastAPI on port 8000"
 # Run the API using Poetry's environment
@@ -0,0 +1,102 @@
+"""Embedding formats returned by TorchServe.
+
+The API asks for ``application/octet-stream`` and also accepts JSON:
+
+* binary: the body is the raw little-endian float32 vector. The
+  ``X-Embedding-Dim`` and ``X-Model-Version`` headers describe it;
+* JSON with ``embedding_b64``: the same bytes, base64 encoded, with optional
+  ``dim`` and ``model_version`` fields;
+* JSON with ``embedding`` (or a bare list): a list of floats, as older
+  handlers return it.
+
+gRPC responses have no content type; ``decode_embedding_bytes`` tells the
+formats apart by their first byte.
+
+Binary vectors are wrapped with ``np.frombuffer`` without copying. They go
+to Postgres through pgvector's binary codec, so no Python float is created
+per element.
+"""
+
+import base64
+import binascii
+import json
+from dataclasses import dataclass
+from typing import Any, Optional
+
+import numpy as np
+
+EMBEDDING_DTYPE = "<f4"
+BINARY_CONTENT_TYPE = "application/octet-stream"
+# Sent as the Accept header; handlers that only speak JSON ignore it.
+EMBEDDING_ACCEPT = f"{BINARY_CONTENT_TYPE}, application/json;q=0.5"
+DIM_HEADER = "X-Embedding-Dim"
+MODEL_VERSION_HEADER = "X-Model-Version"
+
+
+class EmbeddingFormatError(ValueError):
+    """The response does not contain a usable embedding."""
+
+
+@dataclass(frozen=True)
+class Embedding:
+    vector: np.ndarray
+    model_version: Optional[str] = None
+
+
+def _from_bytes(data: bytes, dim: Any) -> np.ndarray:
+    if len(data) % 4:
+        raise EmbeddingFormatError(f"Embedding is {len(data)} bytes, not a whole number of float32 values")
+    vector = np.frombuffer(data, dtype=EMBEDDING_DTYPE)
+    if dim is not None and int(dim) != len(vector):
+        raise EmbeddingFormatError(f"Embedding has {len(vector)} values, expected {int(dim)}")
+    return vector
+
+
+def _from_json(model_result: Any) -> Embedding:
+    if isinstance(model_result, dict) and "embedding_b64" in model_result:
+        try:
+            data = base64.b64decode(model_result["embedding_b64"], validate=True)
+        except (binascii.Error, TypeError):
+            raise EmbeddingFormatError("Invalid base64 embedding in model response")
+        return Embedding(_from_bytes(data, model_result.get("dim")), model_result.get("model_version"))
+
+    embedding = None
+    model_version = None
+    if isinstance(model_result, dict):
+        embedding = model_result.get("embedding")
+        model_version = model_result.get("model_version")
+    if embedding is None and isinstance(model_result, list):
+        embedding = model_result
+    if embedding is None:
+        raise EmbeddingFormatError("No embedding returned from model")
+    return Embedding(np.array(embedding).astype(EMBEDDING_DTYPE), model_version)
+
+
+def decode_embedding(response: Any) -> Embedding:
+    """Decode the embedding in a ``requests`` response from TorchServe."""
+    headers = getattr(response, "headers", None) or {}
+    content_type = str(headers.get("content-type", "")).split(";")[0].strip().lower()
+    if content_type == BINARY_CONTENT_TYPE:
+        return Embedding(_from_bytes(response.content, headers.get(DIM_HEADER)), headers.get(MODEL_VERSION_HEADER))
+
+    try:
+        model_result = response.json()
+    except json.JSONDecodeError:
+        raise EmbeddingFormatError("Invalid model response")
+    return _from_json(model_result)
+
+
+def decode_embedding_bytes(data: bytes) -> Embedding:
+    """Decode a handler's output without a content type, as gRPC returns it.
+
+    JSON output is recognised by its first byte, anything else is taken as
+    raw float32.
+    """
+    if data[:1] in (b"{", b"["):
+        try:
+            model_result = json.loads(data)
+        except ValueError:
+            pass
+        else:
+            return _from_json(model_result)
+    return Embedding(_from_bytes(data, None))
@@ -0,0 +1,163 @@
+"""Background dependency polling for the health endpoints.
+
+Load balancer probes must never wait on TorchServe or Postgres. The
+``HealthMonitor`` polls every dependency on a fixed interval from a background
+task and keeps the latest result as an immutable snapshot, so the endpoints
+only read a reference and compute its age.
+"""
+
+import asyncio
+import os
+import time
+from dataclasses import dataclass, field
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+import requests
+
+from api.metrics import set_pool_stats
+
+TORCHSERVE_MANAGEMENT_URL = os.getenv('TORCHSERVE_MANAGEMENT_URL', 'http://localhost:8081')
+HEALTH_POLL_INTERVAL = float(os.getenv('HEALTH_POLL_INTERVAL', '5'))
+HEALTH_CHECK_TIMEOUT = float(os.getenv('HEALTH_CHECK_TIMEOUT', '3'))
+# A snapshot older than this is treated as "not ready": the poller itself is stuck.
+HEALTH_MAX_SNAPSHOT_AGE = float(os.getenv('HEALTH_MAX_SNAPSHOT_AGE', str(HEALTH_POLL_INTERVAL * 3)))
+
+Check = Callable[[], Awaitable[Dict[str, Any]]]
+
+
+@dataclass(frozen=True)
+class HealthSnapshot:
+    """Result of one polling round."""
+
+    checked_at: float  # time.monotonic() of the round
+    checked_at_unix: float
+    checks: Dict[str, Dict[str, Any]] = field(default_factory=dict)
+
+    @property
+    def age(self) -> float:
+        return time.monotonic() - self.checked_at
+
+    @property
+    def healthy(self) -> bool:
+        return all(check.get("healthy", False) for check in self.checks.values())
+
+
+def _torchserve_status(models_data: Dict[str, Any]) -> str:
+    """Describe the TorchServe model list the same way /health always has."""
+    if not (models_data.get("models") and len(models_data["models"]) > 0):
+        return 'unhealthy - no models loaded'
+    model_names = [model.get("modelName") for model in models_data.get("models", [])]
+    if "where" in model_names:
+        return 'healthy'
+    return f'unhealthy - "where" model not found. Found models: {model_names}'
+
+
+async def check_torchserve(url: str = TORCHSERVE_MANAGEMENT_URL, timeout: float = HEALTH_CHECK_TIMEOUT) -> Dict[str, Any]:
+    """Ask the TorchServe management API which models are loaded."""
+    models_data: Dict[str, Any] = {}
+    try:
+        response = await asyncio.to_thread(requests.get, f'{url}/models', timeout=timeout)
+        if response.status_code == 200:
+            models_data = response.json()
+            status = _torchserve_status(models_data)
+        else:
+            status = f'unhealthy, status: {response.status_code}, body: {response.text}'
+    except requests.exceptions.ConnectionError as e:
+        status = f'unhealthy: connection error - {str(e)}'
+    except requests.exceptions.Timeout as e:
+        status = f'unhealthy: timeout - {str(e)}'
+    except Exception as e:
+        status = f'unhealthy: {str(e)}'
+    return {"healthy": status == 'healthy', "status": status, "models": models_data}
+
+
+def pool_stats(pool: Any) -> Dict[str, Any]:
+    """Return size information for an asyncpg pool, skipping what it lacks."""
+    instrumented = getattr(type(pool), "stats", None)
+    if callable(instrumented):
+        return pool.stats()
+    stats = {}
+    for key, method in (("size", "get_size"), ("idle", "get_idle_size"),
+                        ("min_size", "get_min_size"), ("max_size", "get_max_size")):
+        getter = getattr(pool, method, None)
+        if callable(getter):
+            stats[key] = getter()
+    return stats
+
+
+async def check_database(pool: Any) -> Dict[str, Any]:
+    """Run a trivial query on the pool and report its latency and size."""
+    if pool is None:
+        return {"healthy": False, "status": "no connection pool"}
+    stats = pool_stats(pool)
+    set_pool_stats(stats)
+    start = time.perf_counter()
+    try:
+        await pool.fetchval("SELECT 1")
+    except Exception as e:
+        return {"healthy": False, "status": f"unhealthy: {str(e)}", "pool": stats}
+    latency_ms = (time.perf_counter() - start) * 1000
+    return {"healthy": True, "status": "healthy", "latency_ms": round(latency_ms, 2), "pool": stats}
+
+
+class HealthMonitor:
+    """Poll registered dependency checks in the background.
+
+    Checks are coroutines returning a dict with at least a ``healthy`` flag.
+    They run concurrently, each bounded by ``timeout``, so one hanging
+    dependency cannot delay the snapshot for the others.
+    """
+
+    def __init__(self, interval: float = HEALTH_POLL_INTERVAL, timeout: float = HEALTH_CHECK_TIMEOUT):
+        self.interval = interval
+        self.timeout = timeout
+        self.checks: Dict[str, Check] = {}
+        self.snapshot: Optional[HealthSnapshot] = None
+        self._task: Optional[asyncio.Task] = None
+
+    def add_check(self, name: str, check: Check) -> None:
+        self.checks[name] = check
+
+    async def _run_check(self, name: str, check: Check) -> Dict[str, Any]:
+        try:
+            return await asyncio.wait_for(check(), timeout=self.timeout)
+        except asyncio.TimeoutError:
+            return {"healthy": False, "status": f"unhealthy: {name} check timed out after {self.timeout}s"}
+        except Exception as e:
+            return {"healthy": False, "status": f"unhealthy: {str(e)}"}
+
+    async def refresh(self) -> HealthSnapshot:
+        """Run every check once and publish the result."""
+        names = list(self.checks)
+        results = await asyncio.gather(*(self._run_check(name, self.checks[name]) for name in names))
+        self.snapshot = HealthSnapshot(
+            checked_at=time.monotonic(),
+            checked_at_unix=time.time(),
+            checks=dict(zip(names, results)),
+        )
+        return self.snapshot
+
+    async def _poll(self) -> None:
+        while True:
+            try:
+                await self.refresh()
+            except Exception as e:
+                print(f"Health poll failed: {e}")
+            await asyncio.sleep(self.interval)
+
+    def start(self) -> None:
+        if self._task is None:
+            self._task = asyncio.create_task(self._poll(), name="health-monitor")
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    def is_ready(self, max_age: float = HEALTH_MAX_SNAPSHOT_AGE) -> bool:
+        snapshot = self.snapshot
+        return snapshot is not None and snapshot.age <= max_age and snapshot.healthy
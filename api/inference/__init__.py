@@ -0,0 +1,19 @@
+from .base import InferenceClient, InferenceError, InferenceTimeout, InferenceUnavailable
+from .factory import create_inference_client
+from .grpc_client import GRPCInferenceClient
+from .http_client import HTTPInferenceClient
+from .local import LocalInferenceClient
+from .routing import CanaryRouter, ModelRoutingSync
+
+__all__ = [
+    "CanaryRouter",
+    "GRPCInferenceClient",
+    "HTTPInferenceClient",
+    "InferenceClient",
+    "InferenceError",
+    "InferenceTimeout",
+    "InferenceUnavailable",
+    "LocalInferenceClient",
+    "ModelRoutingSync",
+    "create_inference_client",
+]
@@ -0,0 +1,67 @@
+import copy
+from typing import List, Optional, Sequence, Tuple, Union
+
+from api.embedding import Embedding
+
+
+class InferenceError(Exception):
+    """The inference server answered with an error."""
+
+    def __init__(self, status_code: int, detail: str):
+        super().__init__(detail)
+        self.status_code = status_code
+        self.detail = detail
+
+
+class InferenceUnavailable(Exception):
+    """The inference server could not be reached."""
+
+
+class InferenceTimeout(Exception):
+    """The inference server did not answer in time."""
+
+
+# (image bytes, filename, content type)
+Image = Tuple[bytes, Optional[str], Optional[str]]
+
+
+class InferenceClient:
+    """Turns images into embeddings.
+
+    Implementations block the calling thread; async code runs them with
+    ``asyncio.to_thread``. ``embed`` raises ``InferenceError``,
+    ``InferenceUnavailable``, ``InferenceTimeout`` or
+    ``EmbeddingFormatError``.
+
+    ``version`` selects a registered model version; ``None`` is the
+    server's default version.
+    """
+
+    name = "base"
+    version: Optional[str] = None
+
+    def embed(self, image_data: bytes, filename: Optional[str] = None,
+              content_type: Optional[str] = None) -> Embedding:
+        raise NotImplementedError
+
+    def embed_many(self, images: Sequence[Image]) -> List[Union[Embedding, Exception]]:
+        """Embed several images; a failed image gets its exception instead."""
+        results: List[Union[Embedding, Exception]] = []
+        for image_data, filename, content_type in images:
+            try:
+                results.append(self.embed(image_data, filename, content_type))
+            except Exception as e:
+                results.append(e)
+        return results
+
+    def warm_up(self) -> None:
+        """Get ready for the first call, e.g. start worker processes; blocks."""
+
+    def with_version(self, version: Optional[str]) -> "InferenceClient":
+        """A client for ``version`` sharing this one's connections; close only this one."""
+        client = copy.copy(self)
+        client.version = version
+        return client
+
+    def close(self) -> None:
+        pass
@@ -0,0 +1,25 @@
+from typing import Optional
+
+from api.inference.base import InferenceClient
+from api.inference.grpc_client import GRPCInferenceClient
+from api.inference.http_client import HTTPInferenceClient
+from api.inference.local import LocalInferenceClient
+
+
+def create_inference_client(backend: str, url: str, grpc_target: str, model: str = "where",
+                            timeout: float = 30.0, model_path: Optional[str] = None,
+                            workers: int = 2, threads: int = 1) -> InferenceClient:
+    """Build the client for ``backend``: ``http``, ``grpc`` or ``local``.
+
+    ``local`` runs the model at ``model_path`` in ``workers`` processes with
+    ``threads`` intra-op threads each.
+    """
+    if backend == "http":
+        return HTTPInferenceClient(url, model=model, timeout=timeout)
+    if backend == "grpc":
+        return GRPCInferenceClient(grpc_target, model=model, timeout=timeout)
+    if backend == "local":
+        if not model_path:
+            raise ValueError("The local inference backend needs a model path")
+        return LocalInferenceClient(model_path, workers=workers, threads=threads, timeout=timeout)
+    raise ValueError(f"Unknown inference backend {backend!r}")
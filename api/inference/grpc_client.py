@@ -0,0 +1,167 @@
+"""TorchServe's gRPC inference API without generated stubs.
+
+Only ``InferenceAPIsService/Predictions`` is used, and its messages are
+small enough to encode by hand::
+
+    message PredictionsRequest {
+        string model_name = 1;
+        string model_version = 2;
+        map<string, bytes> input = 3;
+    }
+    message PredictionResponse {
+        bytes prediction = 1;
+    }
+
+so the client needs ``grpcio`` but not ``protobuf`` or generated code.
+"""
+
+from typing import Dict, List, Optional, Sequence, Union
+
+try:
+    import grpc
+except Exception:
+    grpc = None
+
+from api.embedding import Embedding, decode_embedding_bytes
+from api.inference.base import Image, InferenceClient, InferenceError, InferenceTimeout, InferenceUnavailable
+
+PREDICTIONS_METHOD = "/org.pytorch.serve.grpc.inference.InferenceAPIsService/Predictions"
+# TorchServe's default max_request_size/max_response_size.
+MAX_MESSAGE_LENGTH = 6553500
+
+
+def _varint(value: int) -> bytes:
+    out = bytearray()
+    while True:
+        byte = value & 0x7F
+        value >>= 7
+        if value:
+            out.append(byte | 0x80)
+        else:
+            out.append(byte)
+            return bytes(out)
+
+
+def _field(number: int, data: bytes) -> bytes:
+    """A length-delimited field (wire type 2)."""
+    return _varint(number << 3 | 2) + _varint(len(data)) + data
+
+
+def encode_predictions_request(model_name: str, inputs: Dict[str, bytes], model_version: str = "") -> bytes:
+    message = _field(1, model_name.encode())
+    if model_version:
+        message += _field(2, model_version.encode())
+    for key, value in inputs.items():
+        message += _field(3, _field(1, key.encode()) + _field(2, value))
+    return message
+
+
+def _read_varint(data: bytes, pos: int):
+    result = shift = 0
+    while True:
+        if pos >= len(data):
+            raise ValueError("Truncated varint")
+        byte = data[pos]
+        pos += 1
+        result |= (byte & 0x7F) << shift
+        if not byte & 0x80:
+            return result, pos
+        shift += 7
+
+
+def decode_prediction_response(data: bytes) -> bytes:
+    """Return the ``prediction`` field, skipping any other field."""
+    pos = 0
+    prediction = b""
+    while pos < len(data):
+        key, pos = _read_varint(data, pos)
+        number, wire_type = key >> 3, key & 7
+        if wire_type == 0:
+            _, pos = _read_varint(data, pos)
+        elif wire_type == 1:
+            pos += 8
+        elif wire_type == 2:
+            length, pos = _read_varint(data, pos)
+            if number == 1:
+                prediction = data[pos:pos + length]
+            pos += length
+        elif wire_type == 5:
+            pos += 4
+        else:
+            raise ValueError(f"Unsupported wire type {wire_type}")
+    if pos > len(data):
+        raise ValueError("Truncated message")
+    return prediction
+
+
+def _status_codes() -> Dict:
+    # How TorchServe's HTTP API answers the same failures.
+    return {
+        grpc.StatusCode.INVALID_ARGUMENT: 400,
+        grpc.StatusCode.NOT_FOUND: 404,
+        grpc.StatusCode.RESOURCE_EXHAUSTED: 503,
+        grpc.StatusCode.UNIMPLEMENTED: 501,
+    }
+
+
+class GRPCInferenceClient(InferenceClient):
+    """TorchServe's gRPC inference API over one persistent HTTP/2 channel.
+
+    ``embed_many`` issues all requests at once; they are multiplexed on the
+    channel, and TorchServe can batch them like concurrent HTTP requests.
+    """
+
+    name = "grpc"
+
+    def __init__(self, target: str = "localhost:7070", model: str = "where",
+                 timeout: float = 30.0, channel=None):
+        if grpc is None:
+            raise RuntimeError("grpcio is not installed")
+        self.target = target
+        self.model = model
+        self.timeout = timeout
+        self._channel = channel or grpc.insecure_channel(target, options=[
+            ("grpc.max_send_message_length", MAX_MESSAGE_LENGTH),
+            ("grpc.max_receive_message_length", MAX_MESSAGE_LENGTH),
+            ("grpc.keepalive_time_ms", 30000),
+        ])
+        # Messages are encoded by hand, so they pass through as bytes.
+        self._predictions = self._channel.unary_unary(PREDICTIONS_METHOD)
+
+    def _request(self, image_data: bytes) -> bytes:
+        return encode_predictions_request(self.model, {"data": image_data}, self.version or "")
+
+    @staticmethod
+    def _error(error: "grpc.RpcError") -> Exception:
+        code = error.code()
+        if code == grpc.StatusCode.UNAVAILABLE:
+            return InferenceUnavailable(error.details())
+        if code == grpc.StatusCode.DEADLINE_EXCEEDED:
+            return InferenceTimeout(error.details())
+        return InferenceError(_status_codes().get(code, 500), error.details() or code.name)
+
+    def embed(self, image_data: bytes, filename: Optional[str] = None,
+              content_type: Optional[str] = None) -> Embedding:
+        try:
+            response = self._predictions(self._request(image_data), timeout=self.timeout)
+        except grpc.RpcError as e:
+            raise self._error(e) from e
+        return decode_embedding_bytes(decode_prediction_response(response))
+
+    def embed_many(self, images: Sequence[Image]) -> List[Union[Embedding, Exception]]:
+        futures = [
+            self._predictions.future(self._request(image_data), timeout=self.timeout)
+            for image_data, _, _ in images
+        ]
+        results: List[Union[Embedding, Exception]] = []
+        for future in futures:
+            try:
+                results.append(decode_embedding_bytes(decode_prediction_response(future.result())))
+            except grpc.RpcError as e:
+                results.append(self._error(e))
+            except Exception as e:
+                results.append(e)
+        return results
+
+    def close(self) -> None:
+        self._channel.close()
@@ -0,0 +1,46 @@
+from typing import Any, Optional
+
+import requests
+
+from api.embedding import EMBEDDING_ACCEPT, Embedding, decode_embedding
+from api.inference.base import InferenceClient, InferenceError, InferenceTimeout, InferenceUnavailable
+
+
+class HTTPInferenceClient(InferenceClient):
+    """TorchServe's HTTP inference API (``POST /predictions/{model}``).
+
+    Without a ``session`` every call opens a new connection through
+    ``requests.post``. Pass a ``requests.Session`` to keep connections alive
+    across calls, e.g. in the bulk loaders.
+    """
+
+    name = "http"
+
+    def __init__(self, url: str, model: str = "where", timeout: float = 30.0, session: Any = None):
+        self.url = url.rstrip("/")
+        self.model = model
+        self.timeout = timeout
+        self.session = session
+
+    def embed(self, image_data: bytes, filename: Optional[str] = None,
+              content_type: Optional[str] = None) -> Embedding:
+        post = self.session.post if self.session is not None else requests.post
+        try:
+            path = f"{self.model}/{self.version}" if self.version else self.model
+            response = post(
+                f"{self.url}/predictions/{path}",
+                files={'data': (filename, image_data, content_type)},
+                headers={"Accept": EMBEDDING_ACCEPT},
+                timeout=self.timeout,
+            )
+        except requests.exceptions.ConnectionError as e:
+            raise InferenceUnavailable(str(e)) from e
+        except requests.exceptions.Timeout as e:
+            raise InferenceTimeout(str(e)) from e
+        if response.status_code != 200:
+            raise InferenceError(response.status_code, response.text)
+        return decode_embedding(response)
+
+    def close(self) -> None:
+        if self.session is not None:
+            self.session.close()
@@ -0,0 +1,223 @@
+"""In-process CPU inference without TorchServe.
+
+``LocalInferenceClient`` loads the same artifact TorchServe serves (the
+``where.mar`` archive, or the serialized model inside it) in a pool of
+worker processes:
+
+* ``.onnx`` models run on ONNX Runtime (``onnxruntime``);
+* ``.pt``/``.pth``/``.torchscript`` models must be TorchScript and run on
+  ``torch.jit``.
+
+Each process uses ``threads`` intra-op threads, so ``workers * threads``
+should not exceed the cores given to the API. Images are decoded with
+Pillow, resized to ``input_size`` and normalized with the ImageNet mean and
+standard deviation, as TorchServe's vision handlers do.
+"""
+
+import io
+import json
+import multiprocessing
+import os
+import tempfile
+import zipfile
+from concurrent.futures import Future, ProcessPoolExecutor
+from concurrent.futures import TimeoutError as FutureTimeout
+from concurrent.futures.process import BrokenProcessPool
+from pathlib import Path
+from typing import Callable, List, Optional, Sequence, Union
+
+import numpy as np
+
+from api.embedding import EMBEDDING_DTYPE, Embedding
+from api.inference.base import Image, InferenceClient, InferenceError, InferenceTimeout, InferenceUnavailable
+
+MEAN = (0.485, 0.456, 0.406)
+STD = (0.229, 0.224, 0.225)
+TORCHSCRIPT_SUFFIXES = (".pt", ".pth", ".torchscript")
+
+
+class InvalidImage(ValueError):
+    """The upload could not be decoded as an image."""
+
+
+def model_file(path: Union[str, Path]) -> Path:
+    """The serialized model at ``path``, extracted first if it is a ``.mar``."""
+    path = Path(path)
+    if path.suffix != ".mar":
+        return path
+    with zipfile.ZipFile(path) as archive:
+        manifest = json.loads(archive.read("MAR-INF/MANIFEST.json"))
+        name = manifest["model"]["serializedFile"]
+        # Keyed by the member's checksum so a rebuilt archive is extracted again.
+        info = archive.getinfo(name)
+        target = Path(tempfile.gettempdir()) / f"{path.stem}-{info.CRC:08x}-{info.file_size}" / name
+        if not target.exists():
+            target.parent.mkdir(parents=True, exist_ok=True)
+            partial = target.with_name(f".{target.name}.{os.getpid()}")
+            partial.write_bytes(archive.read(name))
+            os.replace(partial, target)
+    return target
+
+
+def load_model(path: Union[str, Path], threads: int = 1) -> Callable[[np.ndarray], np.ndarray]:
+    """Load the model at ``path`` and return a function from a batch to its outputs."""
+    path = model_file(path)
+    if path.suffix == ".onnx":
+        import onnxruntime as ort
+
+        options = ort.SessionOptions()
+        options.intra_op_num_threads = threads
+        options.inter_op_num_threads = 1
+        session = ort.InferenceSession(str(path), options, providers=["CPUExecutionProvider"])
+        input_name = session.get_inputs()[0].name
+        return lambda batch: session.run(None, {input_name: batch})[0]
+
+    if path.suffix in TORCHSCRIPT_SUFFIXES:
+        import torch
+
+        torch.set_num_threads(threads)
+        try:
+            torch.set_num_interop_threads(1)
+        except RuntimeError:
+            pass  # already set in this process
+        model = torch.jit.load(str(path), map_location="cpu").eval()
+
+        def run(batch: np.ndarray) -> np.ndarray:
+            with torch.inference_mode():
+                return model(torch.from_numpy(batch)).numpy()
+
+        return run
+
+    raise ValueError(f"Unsupported model file {path.name}; expected .onnx or TorchScript")
+
+
+def preprocess(image_data: bytes, input_size: int = 224) -> np.ndarray:
+    """Decode an image into a normalized 1x3xHxW float32 batch."""
+    from PIL import Image as PILImage
+
+    try:
+        image = PILImage.open(io.BytesIO(image_data)).convert("RGB")
+    except Exception as e:
+        raise InvalidImage(f"Cannot decode image: {e}") from e
+    image = image.resize((input_size, input_size), PILImage.BILINEAR)
+    pixels = np.asarray(image, dtype=np.float32) / 255.0
+    pixels = (pixels - np.array(MEAN, dtype=np.float32)) / np.array(STD, dtype=np.float32)
+    return np.ascontiguousarray(pixels.transpose(2, 0, 1)[None])
+
+
+# Set in each worker process by _init_worker.
+_run = None
+_input_size = 224
+
+
+def _init_worker(path: str, threads: int, input_size: int) -> None:
+    global _run, _input_size
+    _run = load_model(path, threads)
+    _input_size = input_size
+
+
+def _warm_worker() -> None:
+    _run(np.zeros((1, 3, _input_size, _input_size), dtype=np.float32))
+
+
+def _embed_in_worker(image_data: bytes) -> bytes:
+    output = _run(preprocess(image_data, _input_size))
+    # Raw float32 bytes are cheaper to send back than a pickled array.
+    return np.asarray(output, dtype=EMBEDDING_DTYPE).reshape(-1).tobytes()
+
+
+class LocalInferenceClient(InferenceClient):
+    """Embed images in ``workers`` local processes instead of calling TorchServe.
+
+    ``warm_up`` starts the processes and loads the model in each; otherwise
+    that happens on first use. A worker that dies takes the pool with it;
+    the next call starts a new one.
+    """
+
+    name = "local"
+
+    def __init__(self, model_path: Union[str, Path], workers: int = 2, threads: int = 1,
+                 timeout: float = 30.0, input_size: int = 224, model_version: Optional[str] = None):
+        self.model_path = Path(model_path)
+        if not self.model_path.exists():
+            raise FileNotFoundError(f"Model file {self.model_path} does not exist")
+        self.workers = workers
+        self.threads = threads
+        self.timeout = timeout
+        self.input_size = input_size
+        self.model_version = model_version or self.model_path.stem
+        self._pool: Optional[ProcessPoolExecutor] = None
+
+    def _executor(self) -> ProcessPoolExecutor:
+        if self._pool is None:
+            # Forking a process with running threads (the event loop's
+            # executor, torch's own pools) can deadlock the child.
+            self._pool = ProcessPoolExecutor(
+                max_workers=self.workers,
+                mp_context=multiprocessing.get_context("spawn"),
+                initializer=_init_worker,
+                initargs=(str(self.model_path), self.threads, self.input_size),
+            )
+        return self._pool
+
+    def _submit(self, image_data: bytes) -> Future:
+        try:
+            return self._executor().submit(_embed_in_worker, image_data)
+        except BrokenProcessPool as e:
+            self.close()
+            raise InferenceUnavailable(f"Local inference workers died: {e}") from e
+
+    def warm_up(self, timeout: float = 300.0) -> None:
+        """Start every worker and run the model once in each."""
+        # Idle workers are reused, so submitting one call per worker at once
+        # spawns them all.
+        try:
+            futures = [self._executor().submit(_warm_worker) for _ in range(self.workers)]
+            for future in futures:
+                future.result(timeout=timeout)
+        except BrokenProcessPool as e:
+            self.close()
+            raise InferenceUnavailable(f"Local inference workers died: {e}") from e
+
+    def _result(self, future: Future) -> Embedding:
+        try:
+            data = future.result(timeout=self.timeout)
+        except FutureTimeout as e:
+            future.cancel()
+            raise InferenceTimeout(f"Local inference took longer than {self.timeout}s") from e
+        except BrokenProcessPool as e:
+            self.close()
+            raise InferenceUnavailable(f"Local inference workers died: {e}") from e
+        except InvalidImage as e:
+            raise InferenceError(400, str(e)) from e
+        except Exception as e:
+            raise InferenceError(500, f"Local inference failed: {e}") from e
+        return Embedding(np.frombuffer(data, dtype=EMBEDDING_DTYPE), self.model_version)
+
+    def embed(self, image_data: bytes, filename: Optional[str] = None,
+              content_type: Optional[str] = None) -> Embedding:
+        return self._result(self._submit(image_data))
+
+    def embed_many(self, images: Sequence[Image]) -> List[Union[Embedding, Exception]]:
+        """Embed ``images`` on all workers at once."""
+        futures: List[Union[Future, Exception]] = []
+        for image_data, _, _ in images:
+            try:
+                futures.append(self._submit(image_data))
+            except Exception as e:
+                futures.append(e)
+        results: List[Union[Embedding, Exception]] = []
+        for future in futures:
+            if isinstance(future, Exception):
+                results.append(future)
+                continue
+            try:
+                results.append(self._result(future))
+            except Exception as e:
+                results.append(e)
+        return results
+
+    def close(self) -> None:
+        pool, self._pool = self._pool, None
+        if pool is not None:
+            pool.shutdown(wait=False, cancel_futures=True)
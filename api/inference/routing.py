@@ -0,0 +1,128 @@
+"""Canary routing between TorchServe model versions.
+
+During a rollout (``scripts/model_rollout.py``) both versions are
+registered. The ``model_routing`` table says which version is the canary
+and which share of requests it gets. ``ModelRoutingSync`` polls that row
+in every API process and updates the ``CanaryRouter``. The router sends
+the share to ``/predictions/{model}/{canary}`` and everything else to the
+default version. A canary that was unregistered or cannot be reached falls
+back to the default version, so a rollback never fails requests.
+
+Until the ``model_routing`` table exists (the ``202407_add_model_routing``
+migration), every request goes to the default version and the sync only
+checks for the table every ``MODEL_ROUTING_MISSING_INTERVAL`` seconds.
+"""
+
+import asyncio
+import os
+import random
+from typing import Any, List, Optional, Sequence, Union
+
+from api.embedding import Embedding
+from api.inference.base import Image, InferenceClient, InferenceError, InferenceUnavailable
+from api.metrics import INFERENCE_ROUTES
+from api.repositories.model_routing import get_routing
+
+MODEL_ROUTING_INTERVAL = float(os.getenv('MODEL_ROUTING_INTERVAL', '5'))
+MODEL_ROUTING_MISSING_INTERVAL = float(os.getenv('MODEL_ROUTING_MISSING_INTERVAL', '300'))
+
+# SQLSTATE of asyncpg's UndefinedTableError.
+UNDEFINED_TABLE = "42P01"
+
+
+class CanaryRouter(InferenceClient):
+    """Send ``weight`` of the calls to the ``canary`` version of ``client``'s model."""
+
+    def __init__(self, client: InferenceClient):
+        self.client = client
+        self.name = client.name
+        self.canary: Optional[InferenceClient] = None
+        self.weight = 0.0
+
+    def route(self, version: Optional[str], weight: float) -> None:
+        if not version or weight <= 0:
+            self.canary, self.weight = None, 0.0
+            return
+        if self.canary is None or self.canary.version != version:
+            self.canary = self.client.with_version(version)
+        self.weight = min(weight, 1.0)
+
+    def embed(self, image_data: bytes, filename: Optional[str] = None,
+              content_type: Optional[str] = None) -> Embedding:
+        canary = self.canary
+        if canary is not None and random.random() < self.weight:
+            try:
+                embedding = canary.embed(image_data, filename, content_type)
+                INFERENCE_ROUTES.labels("canary").inc()
+                return embedding
+            except InferenceError as e:
+                if e.status_code not in (404, 503):
+                    raise
+            except InferenceUnavailable:
+                pass
+            INFERENCE_ROUTES.labels("canary_fallback").inc()
+        INFERENCE_ROUTES.labels("default").inc()
+        return self.client.embed(image_data, filename, content_type)
+
+    def embed_many(self, images: Sequence[Image]) -> List[Union[Embedding, Exception]]:
+        if self.canary is None:
+            return self.client.embed_many(images)
+        return super().embed_many(images)
+
+    def warm_up(self) -> None:
+        self.client.warm_up()
+
+    def close(self) -> None:
+        self.client.close()
+
+
+class ModelRoutingSync:
+    """Poll ``model_routing`` every ``interval`` seconds and apply it to ``router``."""
+
+    def __init__(self, router: CanaryRouter, model: str = "where", interval: float = MODEL_ROUTING_INTERVAL):
+        self.router = router
+        self.model = model
+        self.interval = interval
+        self.table_missing = False
+        self._task: Optional[asyncio.Task] = None
+
+    async def refresh(self, pool: Any) -> None:
+        try:
+            row = await get_routing(pool, self.model)
+        except Exception as e:
+            if getattr(e, "sqlstate", None) != UNDEFINED_TABLE:
+                raise
+            if not self.table_missing:
+                print("Table model_routing does not exist; canary routing is off until the migration runs")
+            self.table_missing = True
+            self.router.route(None, 0.0)
+            return
+        if self.table_missing:
+            print("Table model_routing found; canary routing is on")
+        self.table_missing = False
+        if row is None:
+            self.router.route(None, 0.0)
+        else:
+            self.router.route(row["canary_version"], row["canary_weight"])
+
+    async def _run(self, pool: Any) -> None:
+        while True:
+            try:
+                await self.refresh(pool)
+            except Exception as e:
+                print(f"Model routing sync failed: {e}")
+            await asyncio.sleep(max(self.interval, MODEL_ROUTING_MISSING_INTERVAL)
+                                if self.table_missing else self.interval)
+
+    def start(self, pool: Any) -> None:
+        if self._task is None and pool is not None:
+            self._task = asyncio.create_task(self._run(pool), name="model-routing-sync")
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
@@ -0,0 +1,157 @@
+"""Background prediction jobs.
+
+``JobManager`` runs submitted coroutines on a fixed number of worker tasks.
+A client gets a job id back immediately and polls for the outcome, so a slow
+prediction does not hold its HTTP connection open. Queued and running jobs
+are bounded overall and per client. Finished jobs are kept in a ``TTLCache``
+for ``ttl`` seconds.
+"""
+
+import asyncio
+import time
+import uuid
+from dataclasses import dataclass, field
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+from api.coalesce import TTLCache
+from api.metrics import PREDICTION_JOBS, PREDICTION_JOB_QUEUE_WAIT
+
+QUEUED = "queued"
+RUNNING = "running"
+SUCCEEDED = "succeeded"
+FAILED = "failed"
+
+
+class QueueFull(Exception):
+    """The manager has ``max_pending`` jobs queued or running."""
+
+
+class ClientQueueFull(QueueFull):
+    """The client already has ``max_per_client`` jobs queued or running."""
+
+
+@dataclass
+class Job:
+    id: str
+    client: str
+    fn: Callable[[], Awaitable[Any]] = field(repr=False)
+    status: str = QUEUED
+    result: Any = None
+    error: Optional[BaseException] = None
+    created: float = field(default_factory=time.monotonic)
+    done: asyncio.Event = field(default_factory=asyncio.Event, repr=False)
+
+    @property
+    def finished(self) -> bool:
+        return self.status in (SUCCEEDED, FAILED)
+
+
+class JobManager:
+    """Run jobs on ``workers`` background tasks.
+
+    ``submit`` raises ``ClientQueueFull`` when the client has
+    ``max_per_client`` unfinished jobs, and ``QueueFull`` when there are
+    ``max_pending`` in total. Workers run between ``start()`` and ``stop()``.
+    """
+
+    def __init__(self, workers: int = 4, max_pending: int = 100, max_per_client: int = 5,
+                 ttl: float = 600.0, max_finished: int = 10000):
+        self.workers = workers
+        self.max_pending = max_pending
+        self.max_per_client = max_per_client
+        self._queue: Optional[asyncio.Queue] = None
+        self._pending: Dict[str, Job] = {}
+        self._per_client: Dict[str, int] = {}
+        self._finished = TTLCache(ttl, max_finished)
+        self._tasks: List[asyncio.Task] = []
+
+    def __len__(self) -> int:
+        return len(self._pending)
+
+    def submit(self, client: str, fn: Callable[[], Awaitable[Any]]) -> Job:
+        if self._queue is None:
+            raise QueueFull("Job workers are not running")
+        if self._per_client.get(client, 0) >= self.max_per_client:
+            raise ClientQueueFull(f"Too many unfinished jobs. Maximum is {self.max_per_client} per client")
+        if len(self._pending) >= self.max_pending:
+            raise QueueFull("Too many unfinished jobs. Try again later")
+        job = Job(id=uuid.uuid4().hex, client=client, fn=fn)
+        self._pending[job.id] = job
+        self._per_client[client] = self._per_client.get(client, 0) + 1
+        self._queue.put_nowait(job)
+        PREDICTION_JOBS.labels(QUEUED).inc()
+        return job
+
+    def get(self, job_id: str) -> Optional[Job]:
+        job = self._pending.get(job_id)
+        return job if job is not None else self._finished.get(job_id)
+
+    async def wait(self, job: Job, timeout: float) -> Job:
+        """Return ``job`` once it finished, or after ``timeout`` seconds."""
+        if not job.finished and timeout > 0:
+            try:
+                await asyncio.wait_for(job.done.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+        return job
+
+    async def _run(self, job: Job) -> None:
+        PREDICTION_JOBS.labels(QUEUED).dec()
+        PREDICTION_JOBS.labels(RUNNING).inc()
+        PREDICTION_JOB_QUEUE_WAIT.observe(time.monotonic() - job.created)
+        job.status = RUNNING
+        try:
+            job.result = await job.fn()
+            job.status = SUCCEEDED
+        except Exception as e:
+            job.error = e
+            job.status = FAILED
+        except asyncio.CancelledError as e:
+            # Shutting down; a poller sees the job failed rather than running forever.
+            job.error = e
+            job.status = FAILED
+            raise
+        finally:
+            PREDICTION_JOBS.labels(RUNNING).dec()
+            self._finish(job)
+
+    def _finish(self, job: Job) -> None:
+        job.fn = None
+        self._pending.pop(job.id, None)
+        remaining = self._per_client.get(job.client, 1) - 1
+        if remaining > 0:
+            self._per_client[job.client] = remaining
+        else:
+            self._per_client.pop(job.client, None)
+        self._finished.set(job.id, job)
+        job.done.set()
+
+    async def _worker(self) -> None:
+        while True:
+            job = await self._queue.get()
+            try:
+                await self._run(job)
+            finally:
+                self._queue.task_done()
+
+    def start(self) -> None:
+        if self._tasks:
+            return
+        self._queue = asyncio.Queue()
+        self._tasks = [
+            asyncio.create_task(self._worker(), name=f"prediction-job-{i}")
+            for i in range(self.workers)
+        ]
+
+    async def stop(self) -> None:
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        self._queue = None
+        # Jobs still queued will never run; finish them so pollers stop waiting.
+        for job in list(self._pending.values()):
+            job.error = asyncio.CancelledError()
+            job.status = FAILED
+            PREDICTION_JOBS.labels(QUEUED).dec()
+            self._finish(job)
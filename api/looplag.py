@@ -0,0 +1,106 @@
+"""Event-loop lag monitoring.
+
+A coroutine sleeps for ``interval`` in a loop and measures how late it wakes
+up. That delay is the time other callbacks held the loop. A watchdog thread
+watches the coroutine's heartbeat. If the heartbeat is older than
+``threshold``, the loop is blocked right now, and the watchdog logs the loop
+thread's current stack, which points at the blocking call. The stall's
+full duration is recorded by the coroutine once the loop runs again.
+"""
+
+import asyncio
+import logging
+import os
+import sys
+import threading
+import time
+import traceback
+from typing import Callable, Optional
+
+from api.metrics import LOOP_LAG, LOOP_STALLS
+
+logger = logging.getLogger("api.looplag")
+
+LOOP_LAG_INTERVAL = float(os.getenv("LOOP_LAG_INTERVAL", "0.1"))
+LOOP_LAG_THRESHOLD = float(os.getenv("LOOP_LAG_THRESHOLD", "0.25"))
+
+
+class LoopLagMonitor:
+    """Measure event loop lag and capture the stack of blocking code.
+
+    ``on_stall`` receives ``(blocked_for_seconds, formatted_stack)`` from the
+    watchdog thread. By default the stall is logged as a warning.
+    """
+
+    def __init__(
+        self,
+        interval: float = LOOP_LAG_INTERVAL,
+        threshold: float = LOOP_LAG_THRESHOLD,
+        on_stall: Optional[Callable[[float, str], None]] = None,
+    ):
+        self.interval = interval
+        self.threshold = threshold
+        self.on_stall = on_stall or self._log_stall
+        self.max_lag = 0.0
+        self._heartbeat = time.monotonic()
+        self._loop_thread_id: Optional[int] = None
+        self._task: Optional[asyncio.Task] = None
+        self._watchdog: Optional[threading.Thread] = None
+        self._stopped = threading.Event()
+
+    @staticmethod
+    def _log_stall(blocked_for: float, stack: str) -> None:
+        logger.warning("Event loop blocked for %.3fs, loop thread stack:\n%s", blocked_for, stack)
+
+    async def _measure(self) -> None:
+        while True:
+            start = time.monotonic()
+            await asyncio.sleep(self.interval)
+            now = time.monotonic()
+            lag = max(0.0, now - start - self.interval)
+            self._heartbeat = now
+            self.max_lag = max(self.max_lag, lag)
+            LOOP_LAG.observe(lag)
+            if lag >= self.threshold:
+                LOOP_STALLS.observe(lag)
+
+    def _watch(self) -> None:
+        reported_heartbeat = None
+        while not self._stopped.wait(self.threshold / 2):
+            heartbeat = self._heartbeat
+            blocked_for = time.monotonic() - heartbeat - self.interval
+            # Report each stall once, not on every watchdog tick.
+            if blocked_for < self.threshold or heartbeat == reported_heartbeat:
+                continue
+            frame = sys._current_frames().get(self._loop_thread_id)
+            if frame is None:
+                continue
+            reported_heartbeat = heartbeat
+            try:
+                self.on_stall(blocked_for, "".join(traceback.format_stack(frame)))
+            except Exception as e:
+                logger.error("Loop stall handler failed: %s", e)
+
+    def start(self) -> None:
+        """Start measuring; must be called from the event loop's thread."""
+        if self._task is not None:
+            return
+        self._loop_thread_id = threading.get_ident()
+        self._heartbeat = time.monotonic()
+        self._stopped.clear()
+        self._task = asyncio.get_running_loop().create_task(self._measure(), name="loop-lag-monitor")
+        self._watchdog = threading.Thread(target=self._watch, name="loop-lag-watchdog", daemon=True)
+        self._watchdog.start()
+
+    async def stop(self) -> None:
+        self._stopped.set()
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        if self._watchdog is not None:
+            self._watchdog.join(timeout=1)
+            self._watchdog = None
@@ -5,21 +5,86 @@ ROOT = Path(__file__).resolve().parents[1]
 if str(ROOT) not in sys.path:
     sys.path.append(str(ROOT))
 
-from fastapi import FastAPI
+import asyncio
+from fastapi import FastAPI, Response
 from contextlib import asynccontextmanager
 from fastapi.middleware.cors import CORSMiddleware
-from api.routes.predict import router as predict_router
-from api.middleware import EphemeralUploadMiddleware, RateLimitMiddleware
+from fastapi.responses import JSONResponse
+from api.routes.predict import (
+    BATCH_MAX_IMAGES,
+    INFERENCE_BACKEND,
+    inference_client,
+    model_routing,
+    prediction_jobs,
+    router as predict_router,
+    shadow_mirror,
+)
+from api.middleware.admission import UPLOAD_MAX_BYTES
+from api.middleware import (
+    EphemeralUploadMiddleware,
+    RateLimitMiddleware,
+    RateLimitSync,
+    ServerTimingMiddleware,
+    TokenBucketStore,
+    UploadAdmissionMiddleware,
+)
 from api.db import init_db, close_db
-import requests
+from api.health import HealthMonitor, check_database, check_torchserve
+from api import metrics
+from api.looplag import LoopLagMonitor
+from api.autoscaler import AUTOSCALER_ENABLED, ScalingPolicy, WorkerAutoscaler
 import os
 
 
+health_monitor = HealthMonitor()
+loop_lag_monitor = LoopLagMonitor()
+worker_autoscaler = WorkerAutoscaler(policy=ScalingPolicy.from_env())
+
+# Configure rate limiting based on environment
+# Updated: Higher limits for production to handle Apple security scanning
+# Default: 10 requests/24hrs → Production: 1000 requests/1hr (via env vars)
+rate_limit = int(os.getenv('RATE_LIMIT_REQUESTS', '10'))
+rate_period = int(os.getenv('RATE_LIMIT_PERIOD', '86400'))  # 24 hours default
+# Buckets are local to each worker; the sync task shares consumption via the rate_limits table.
+rate_limit_sync = RateLimitSync(TokenBucketStore(rate_limit, rate_limit / rate_period), rate_limit, rate_period)
+
+
 @asynccontextmanager
 async def lifespan(app: FastAPI):
+    if not metrics.enabled():
+        print("prometheus_client is not installed; /metrics will be empty")
+    loop_lag_monitor.start()
     await init_db(app)
+    rate_limit_sync.start(app.state.pool)
+    prediction_jobs.start()
+    # Local inference spawns its worker processes and loads the model now,
+    # not on the first request.
+    try:
+        await asyncio.to_thread(inference_client.warm_up)
+    except Exception as e:
+        print(f"Inference warm-up failed: {e}")
+    if INFERENCE_BACKEND != "local":
+        health_monitor.add_check("torchserve", check_torchserve)
+        model_routing.start(app.state.pool)
+        if AUTOSCALER_ENABLED:
+            worker_autoscaler.start(app.state.pool)
+    health_monitor.add_check("database", lambda: check_database(getattr(app.state, "pool", None)))
+    read_pool = getattr(app.state, "read_pool", None)
+    if read_pool is not None and read_pool.replicas:
+        health_monitor.add_check("replicas", read_pool.check)
+    await health_monitor.refresh()
+    health_monitor.start()
     yield
+    await health_monitor.stop()
+    await worker_autoscaler.stop()
+    await model_routing.stop()
+    await prediction_jobs.stop()
+    inference_client.close()
+    shadow_mirror.close()
+    await rate_limit_sync.stop()
     await close_db(app)
+    await loop_lag_monitor.stop()
+    metrics.mark_process_dead()
 
 
 app = FastAPI(lifespan=lifespan)
@@ -33,13 +98,24 @@ app.add_middleware(
     allow_headers=["*"],
 )
 app.add_middleware(EphemeralUploadMiddleware)
-
-# Configure rate limiting based on environment
-# Updated: Higher limits for production to handle Apple security scanning
-# Default: 10 requests/24hrs → Production: 1000 requests/1hr (via env vars)
-rate_limit = int(os.getenv('RATE_LIMIT_REQUESTS', '10'))
-rate_period = int(os.getenv('RATE_LIMIT_PERIOD', '86400'))  # 24 hours default
-app.add_middleware(RateLimitMiddleware, limit=rate_limit, period=rate_period)
+# Outside the upload middleware, so rejected uploads are cut off before the route parses them.
+app.add_middleware(UploadAdmissionMiddleware, exempt_paths=("/predict/batch",))
+# A batch may carry up to BATCH_MAX_IMAGES images of the single-upload size.
+batch_upload_max_bytes = int(os.getenv('BATCH_UPLOAD_MAX_BYTES', str(BATCH_MAX_IMAGES * UPLOAD_MAX_BYTES)))
+app.add_middleware(UploadAdmissionMiddleware, paths=("/predict/batch",), max_bytes=batch_upload_max_bytes)
+
+# Load balancer probes and metric scrapes are exempt so they are never throttled.
+# So are job polls: the job was charged when it was submitted.
+app.add_middleware(
+    RateLimitMiddleware,
+    limit=rate_limit,
+    period=rate_period,
+    exempt_paths=("/health/live", "/health/ready", "/metrics"),
+    exempt_prefixes=("/predict/jobs/",),
+    sync=rate_limit_sync,
+)
+# Outermost, so the total covers every other middleware.
+app.add_middleware(ServerTimingMiddleware)
 
 app.include_router(predict_router)
 
@@ -48,47 +124,49 @@ def read_root():
     return {"message": "Hello World"}
 
 
-TORCHSERVE_MANAGEMENT_URL = os.getenv('TORCHSERVE_MANAGEMENT_URL', 'http://localhost:8081')
+def _snapshot_age(snapshot):
+    return round(snapshot.age, 3) if snapshot is not None else None
 
 
 @app.get("/health")
-def health_check():
-    """Report FastAPI and TorchServe status."""
-    torchserve_status = 'unhealthy'
-    models_data = {}
-
-    try:
-        # Use requests library which handles connection better
-        response = requests.get(f'{TORCHSERVE_MANAGEMENT_URL}/models', timeout=10)
-
-        if response.status_code == 200:
-            models_data = response.json()
-            # Check if models are loaded
-            if models_data.get("models") and len(models_data["models"]) > 0:
-                # Check specifically for the "where" model
-                model_names = [model.get("modelName") for model in models_data.get("models", [])]
-                if "where" in model_names:
-                    torchserve_status = 'healthy'
-                else:
-                    torchserve_status = f'unhealthy - "where" model not found. Found models: {model_names}'
-            else:
-                torchserve_status = 'unhealthy - no models loaded'
-        else:
-            torchserve_status = f'unhealthy, status: {response.status_code}, body: {response.text}'
-    except requests.exceptions.ConnectionError as e:
-        torchserve_status = f'unhealthy: connection error - {str(e)}'
-    except requests.exceptions.Timeout as e:
-        torchserve_status = f'unhealthy: timeout - {str(e)}'
-    except Exception as e:
-        torchserve_status = f'unhealthy: {str(e)}'
+async def health_check():
+    """Report FastAPI and TorchServe status from the cached health snapshot."""
+    snapshot = health_monitor.snapshot
+    checks = snapshot.checks if snapshot is not None else {}
+    torchserve = checks.get("torchserve", {})
 
     return {
         "fastapi_status": "healthy",
-        "torchserve_status": torchserve_status,
-        "torchserve_models": models_data,
+        "torchserve_status": torchserve.get("status", "unknown - no health snapshot yet"),
+        "torchserve_models": torchserve.get("models", {}),
+        "checks": checks,
+        "snapshot_age_seconds": _snapshot_age(snapshot),
         "message": "API is operational",
     }
 
 
+@app.get("/health/live")
+async def liveness():
+    """Liveness probe: the event loop is serving requests."""
+    return {"status": "alive"}
+
+
+@app.get("/health/ready")
+async def readiness():
+    """Readiness probe: every dependency was healthy in a recent snapshot."""
+    snapshot = health_monitor.snapshot
+    body = {
+        "status": "ready" if health_monitor.is_ready() else "not ready",
+        "checks": {name: check.get("healthy", False) for name, check in (snapshot.checks if snapshot else {}).items()},
+        "snapshot_age_seconds": _snapshot_age(snapshot),
+    }
+    if body["status"] != "ready":
+        return JSONResponse(status_code=503, content=body)
+    return body
 
 
+@app.get("/metrics")
+async def metrics_endpoint():
+    """Prometheus exposition, aggregated across workers in multiprocess mode."""
+    body, content_type = metrics.render()
+    return Response(content=body, media_type=content_type)
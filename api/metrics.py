@@ -0,0 +1,168 @@
+"""Prometheus metrics for the API.
+
+When ``PROMETHEUS_MULTIPROC_DIR`` is set, prometheus_client keeps every
+metric in memory-mapped files in that directory, and ``render`` aggregates
+the files of all uvicorn worker processes. The directory must be emptied
+before the workers start (see ``api/docker/start.sh``).
+
+If prometheus_client is not installed, every metric is a no-op so callers
+never need to check; the API logs this once at startup (see ``enabled``).
+"""
+
+import os
+from typing import Any, Dict, Tuple
+
+try:
+    import prometheus_client as _prom
+    from prometheus_client import multiprocess as _multiprocess
+except Exception:
+    _prom = None
+    _multiprocess = None
+
+PREFIX = "whereisthisplace"
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 20.0, 30.0)
+
+
+class _NoopMetric:
+    def labels(self, *args, **kwargs) -> "_NoopMetric":
+        return self
+
+    def inc(self, amount: float = 1) -> None:
+        pass
+
+    def dec(self, amount: float = 1) -> None:
+        pass
+
+    def set(self, value: float) -> None:
+        pass
+
+    def observe(self, value: float) -> None:
+        pass
+
+
+def enabled() -> bool:
+    """Whether prometheus_client is installed, i.e. metrics are recorded."""
+    return _prom is not None
+
+
+def _histogram(name: str, documentation: str, labelnames=(), buckets=LATENCY_BUCKETS):
+    if _prom is None:
+        return _NoopMetric()
+    return _prom.Histogram(f"{PREFIX}_{name}", documentation, labelnames, buckets=buckets)
+
+
+def _counter(name: str, documentation: str, labelnames=()):
+    if _prom is None:
+        return _NoopMetric()
+    return _prom.Counter(f"{PREFIX}_{name}", documentation, labelnames)
+
+
+def _gauge(name: str, documentation: str, labelnames=(), multiprocess_mode: str = "livesum"):
+    if _prom is None:
+        return _NoopMetric()
+    return _prom.Gauge(f"{PREFIX}_{name}", documentation, labelnames, multiprocess_mode=multiprocess_mode)
+
+
+REQUEST_LATENCY = _histogram(
+    "request_duration_seconds", "HTTP request latency by route template.", ("route", "method", "status"))
+STAGE_LATENCY = _histogram(
+    "predict_stage_duration_seconds", "Latency of each stage of the predict pipeline.", ("stage",))
+PREDICTIONS = _counter(
+    "predictions_total", "Successful predictions by the source of the final answer.", ("source",))
+BIAS_ADJUSTED = _counter(
+    "bias_adjusted_predictions_total", "Model predictions whose score was reduced by the bias guard.")
+FALLBACKS = _counter(
+    "prediction_fallbacks_total", "Predictions that fell back to the model answer, by reason.", ("reason",))
+CACHE_REQUESTS = _counter(
+    "cache_requests_total", "Cache lookups by cache name and result (hit or miss).", ("cache", "result"))
+DB_POOL_CONNECTIONS = _gauge(
+    "db_pool_connections", "asyncpg pool connections by pool and state, summed over workers.", ("pool", "state"))
+DB_POOL_WAITING = _gauge(
+    "db_pool_waiting_requests", "Callers waiting for a pool connection, summed over workers.", ("pool",))
+DB_POOL_ACQUIRE_WAIT = _histogram(
+    "db_pool_acquire_wait_seconds", "Time spent waiting for a pool connection.", ("pool",),
+    buckets=(0.0005, 0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0))
+DB_QUERY_LATENCY = _histogram(
+    "db_query_duration_seconds", "Duration of queries run through the pool, by method.", ("pool", "operation"))
+DB_REPLICA_LAG = _gauge(
+    "db_replica_lag_seconds", "Replication replay lag of each read replica.", ("replica",), multiprocess_mode="max")
+DB_REPLICAS_IN_ROTATION = _gauge(
+    "db_replicas_in_rotation", "Read replicas currently receiving queries.", multiprocess_mode="min")
+UPSTREAM_REQUESTS = _counter(
+    "upstream_requests_total", "Calls to upstream services.", ("service",))
+UPSTREAM_ERRORS = _counter(
+    "upstream_errors_total", "Failed calls to upstream services by kind of failure.", ("service", "kind"))
+PREDICTION_JOBS = _gauge(
+    "prediction_jobs", "Background prediction jobs by state (queued or running).", ("state",))
+PREDICTION_JOB_QUEUE_WAIT = _histogram(
+    "prediction_job_queue_wait_seconds", "Time background prediction jobs spent queued.")
+INFERENCE_ROUTES = _counter(
+    "inference_routes_total", "Inference calls by model version route (default, canary, canary_fallback).",
+    ("route",))
+TORCHSERVE_WORKERS = _gauge(
+    "torchserve_workers", "Workers TorchServe runs for the model, as last seen by the autoscaler.",
+    multiprocess_mode="max")
+AUTOSCALER_DECISIONS = _counter(
+    "autoscaler_scaling_total", "Worker count changes made by the autoscaler, by direction.", ("direction",))
+SHADOW_REQUESTS = _counter(
+    "shadow_requests_total",
+    "Predictions mirrored to the shadow model, by outcome (compared, no_match, timeout, error, dropped).",
+    ("outcome",))
+SHADOW_LATENCY = _histogram(
+    "shadow_inference_duration_seconds", "Inference latency of the shadow model.")
+SHADOW_DISTANCE = _histogram(
+    "shadow_distance_km", "Distance between the shadow model's location and the answer, by answer source.",
+    ("source",), buckets=(0.1, 1.0, 5.0, 25.0, 100.0, 500.0, 1000.0, 2500.0, 5000.0, 10000.0, 20000.0))
+LOOP_LAG = _histogram(
+    "event_loop_lag_seconds", "Scheduling delay of the event loop.",
+    buckets=(0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0))
+LOOP_STALLS = _histogram(
+    "event_loop_stall_seconds", "Event loop stalls longer than the lag threshold.",
+    buckets=(0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0))
+
+_stage_children: Dict[str, Any] = {}
+
+
+def observe_stage(name: str, seconds: float) -> None:
+    """Record one predict stage; label children are cached for the hot path."""
+    child = _stage_children.get(name)
+    if child is None:
+        child = _stage_children[name] = STAGE_LATENCY.labels(name)
+    child.observe(seconds)
+
+
+def set_pool_stats(stats: Dict[str, int], pool: str = "primary") -> None:
+    """Publish the size/idle counts of one of this worker's pools."""
+    size = stats.get("size")
+    idle = stats.get("idle")
+    if size is None or idle is None:
+        return
+    DB_POOL_CONNECTIONS.labels(pool, "idle").set(idle)
+    DB_POOL_CONNECTIONS.labels(pool, "in_use").set(stats.get("in_use", size - idle))
+    if "max_size" in stats:
+        DB_POOL_CONNECTIONS.labels(pool, "max").set(stats["max_size"])
+    if "waiting" in stats:
+        DB_POOL_WAITING.labels(pool).set(stats["waiting"])
+
+
+def _multiprocess_dir() -> str | None:
+    return os.getenv("PROMETHEUS_MULTIPROC_DIR") or os.getenv("prometheus_multiproc_dir")
+
+
+def render() -> Tuple[bytes, str]:
+    """Return the exposition body and its content type."""
+    if _prom is None:
+        return b"# prometheus_client is not installed\n", "text/plain; charset=utf-8"
+    if _multiprocess_dir():
+        registry = _prom.CollectorRegistry()
+        _multiprocess.MultiProcessCollector(registry)
+    else:
+        registry = _prom.REGISTRY
+    return _prom.generate_latest(registry), _prom.CONTENT_TYPE_LATEST
+
+
+def mark_process_dead() -> None:
+    """Drop this worker's live gauges from the aggregate on shutdown."""
+    if _multiprocess is not None and _multiprocess_dir():
+        _multiprocess.mark_process_dead(os.getpid())
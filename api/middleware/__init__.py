@@ -1,4 +1,13 @@
+from .admission import UploadAdmissionMiddleware
 from .ephemeral import EphemeralUploadMiddleware
-from .ratelimit import RateLimitMiddleware
+from .ratelimit import RateLimitMiddleware, RateLimitSync, TokenBucketStore
+from .timing import ServerTimingMiddleware
 
-__all__ = ["EphemeralUploadMiddleware", "RateLimitMiddleware"]
+__all__ = [
+    "EphemeralUploadMiddleware",
+    "RateLimitMiddleware",
+    "RateLimitSync",
+    "ServerTimingMiddleware",
+    "TokenBucketStore",
+    "UploadAdmissionMiddleware",
+]
@@ -0,0 +1,176 @@
+import json
+import os
+from typing import Optional
+
+# TorchServe's default max_request_size; larger images would be rejected there anyway.
+UPLOAD_MAX_BYTES = int(os.getenv("UPLOAD_MAX_BYTES", "6553500"))
+# How much of the body is held back to find the first file part's magic number.
+UPLOAD_SNIFF_BYTES = 8192
+
+JPEG_MAGIC = b"\xff\xd8\xff"
+PNG_MAGIC = b"\x89PNG\r\n\x1a\n"
+
+
+def is_image(data: bytes) -> bool:
+    return data.startswith(JPEG_MAGIC) or data.startswith(PNG_MAGIC)
+
+
+def _boundary(content_type: str) -> Optional[bytes]:
+    for param in content_type.split(";")[1:]:
+        name, _, value = param.strip().partition("=")
+        if name.lower() == "boundary" and value:
+            return value.strip('"').encode("latin-1")
+    return None
+
+
+def sniff_multipart(prefix: bytes, boundary: bytes) -> Optional[bool]:
+    """Check the first file part in ``prefix``.
+
+    Returns ``True``/``False`` if its first bytes are (not) a JPEG or PNG, and
+    ``None`` if ``prefix`` does not contain enough of it to tell.
+    """
+    delimiter = b"--" + boundary
+    pos = prefix.find(delimiter)
+    while pos != -1:
+        header_start = pos + len(delimiter)
+        if prefix.startswith(b"--", header_start):
+            return None  # closing delimiter: no file part at all
+        header_end = prefix.find(b"\r\n\r\n", header_start)
+        if header_end == -1:
+            return None
+        data_start = header_end + 4
+        data_end = prefix.find(b"\r\n" + delimiter, data_start)
+        if b"filename=" in prefix[header_start:header_end].lower():
+            data = prefix[data_start:data_end if data_end != -1 else len(prefix)]
+            if is_image(data):
+                return True
+            if data_end == -1 and len(data) < len(PNG_MAGIC):
+                return None
+            return False
+        if data_end == -1:
+            return None
+        pos = data_end + 2
+    return None
+
+
+class UploadAdmissionMiddleware:
+    """Reject oversized or non-image uploads before they are buffered.
+
+    For requests with a body on ``paths``:
+
+    * a ``Content-Length`` above ``max_bytes`` gets a 413 before any of the
+      body is read;
+    * a body that turns out to be larger (chunked, or a wrong length) is cut
+      off with a 413 as soon as it passes ``max_bytes``;
+    * the first ``UPLOAD_SNIFF_BYTES`` are held back and the first file part
+      of a multipart body, or a raw ``image/*`` body, must start with a JPEG
+      or PNG magic number, else the request gets a 415.
+
+    It runs outside ``EphemeralUploadMiddleware`` so rejected requests are
+    not timed as uploads. Paths in ``exempt_paths`` are passed through, e.g.
+    to admit them with a different limit in another instance.
+    """
+
+    def __init__(self, app, paths: tuple[str, ...] = ("/predict",), max_bytes: int = UPLOAD_MAX_BYTES,
+                 exempt_paths: tuple[str, ...] = ()):
+        self.app = app
+        self.paths = tuple(paths)
+        self.max_bytes = max_bytes
+        self.exempt_paths = tuple(exempt_paths)
+
+    @staticmethod
+    async def _reject(send, status: int, detail: str) -> None:
+        body = json.dumps({"detail": detail}).encode()
+        await send({
+            "type": "http.response.start",
+            "status": status,
+            "headers": [
+                (b"content-type", b"application/json"),
+                (b"content-length", str(len(body)).encode()),
+                (b"connection", b"close"),
+            ],
+        })
+        await send({"type": "http.response.body", "body": body})
+
+    async def __call__(self, scope, receive, send):
+        if (
+            scope["type"] != "http"
+            or scope["method"] not in ("POST", "PUT", "PATCH")
+            or not scope["path"].startswith(self.paths)
+            or scope["path"] in self.exempt_paths
+        ):
+            await self.app(scope, receive, send)
+            return
+
+        content_type = ""
+        content_length = None
+        for name, value in scope["headers"]:
+            if name == b"content-type":
+                content_type = value.decode("latin-1")
+            elif name == b"content-length":
+                try:
+                    content_length = int(value)
+                except ValueError:
+                    pass
+        too_large = f"Upload too large. Maximum size is {self.max_bytes} bytes"
+        if content_length is not None and content_length > self.max_bytes:
+            await self._reject(send, 413, too_large)
+            return
+
+        # Hold back the start of the body until its magic number is known.
+        media_type = content_type.split(";")[0].strip().lower()
+        boundary = _boundary(content_type) if media_type == "multipart/form-data" else None
+        held = []
+        received = 0
+        if boundary is not None or media_type.startswith("image/"):
+            prefix = b""
+            more_body = True
+            verdict = None
+            while more_body and len(prefix) < UPLOAD_SNIFF_BYTES:
+                message = await receive()
+                held.append(message)
+                if message["type"] != "http.request":
+                    break
+                prefix += message.get("body", b"")
+                received = len(prefix)
+                if received > self.max_bytes:
+                    await self._reject(send, 413, too_large)
+                    return
+                more_body = message.get("more_body", False)
+                verdict = sniff_multipart(prefix, boundary) if boundary is not None else is_image(prefix)
+                if verdict is not None and (verdict or len(prefix) >= len(PNG_MAGIC) or not more_body):
+                    break
+            if verdict is False:
+                await self._reject(send, 415, "Invalid file content. Only JPEG and PNG images are accepted")
+                return
+
+        response_started = False
+        over_limit = False
+
+        async def admitted_receive():
+            nonlocal received, over_limit
+            if held:
+                return held.pop(0)
+            message = await receive()
+            if message["type"] == "http.request":
+                received += len(message.get("body", b""))
+                if received > self.max_bytes:
+                    over_limit = True
+                    # The app sees a disconnect and stops reading.
+                    return {"type": "http.disconnect"}
+            return message
+
+        async def tracking_send(message):
+            nonlocal response_started
+            if message["type"] == "http.response.start":
+                response_started = True
+            await send(message)
+
+        try:
+            await self.app(scope, admitted_receive, tracking_send)
+        except Exception:
+            # A route reading the body itself fails on the disconnect; answer it here.
+            if not over_limit or response_started:
+                raise
+        if over_limit and not response_started:
+            await self._reject(send, 413, too_large)
@@ -1,25 +1,50 @@
-import os
-import tempfile
-from starlette.middleware.base import BaseHTTPMiddleware
-from starlette.requests import Request
-
-
-class EphemeralUploadMiddleware(BaseHTTPMiddleware):
-    """Save request body to a temporary file and remove it after the response."""
-
-    async def dispatch(self, request: Request, call_next):
-        body = await request.body()
-        request._body = body
-        fd, path = tempfile.mkstemp(dir="/tmp", prefix="upload_", suffix=".bin")
-        with os.fdopen(fd, "wb") as tmp:
-            tmp.write(body)
-        print(f"Saved upload to {path}")
-        try:
-            response = await call_next(request)
-        finally:
-            try:
-                os.unlink(path)
-                print(f"Deleted upload {path}")
-            except FileNotFoundError:
-                pass
-        return response
+import time
+
+from api import timing
+
+
+class EphemeralUploadMiddleware:
+    """Time the upload of request bodies that the upload routes parse.
+
+    The body is passed through as it arrives and parsed once by the route:
+    Starlette spools each file part into an ``UploadFile``, in memory up to
+    1 MiB and then in an anonymous temporary file, and FastAPI closes those
+    files after the response. Nothing is buffered here.
+
+    For requests with a body whose path starts with one of ``paths``, the
+    time spent waiting for body chunks is recorded as the ``upload`` stage,
+    and the end of the body starts the lap the route records as
+    ``multipart``.
+    """
+
+    def __init__(self, app, paths: tuple[str, ...] = ("/predict",)):
+        self.app = app
+        self.paths = tuple(paths)
+
+    async def __call__(self, scope, receive, send):
+        if (
+            scope["type"] != "http"
+            or scope["method"] not in ("POST", "PUT", "PATCH")
+            or not scope["path"].startswith(self.paths)
+        ):
+            await self.app(scope, receive, send)
+            return
+
+        waited = 0.0
+        body_done = False
+
+        async def timed_receive():
+            nonlocal waited, body_done
+            if body_done:
+                return await receive()
+            start = time.perf_counter()
+            message = await receive()
+            waited += time.perf_counter() - start
+            if message["type"] != "http.request" or not message.get("more_body", False):
+                body_done = True
+                timing.record("upload", waited)
+                # Whatever happens until the route starts (the rest of the multipart parsing) is timed from here.
+                timing.checkpoint()
+            return message
+
+        await self.app(scope, timed_receive, send)
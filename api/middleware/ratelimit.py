@@ -1,27 +1,280 @@
+import asyncio
+import functools
+import ipaddress
+import math
+import os
 import time
-from starlette.middleware.base import BaseHTTPMiddleware
-from starlette.requests import Request
-from starlette.responses import Response
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Optional
 
+from api.repositories.rate_limits import delete_expired, take_tokens
 
-class RateLimitMiddleware(BaseHTTPMiddleware):
-    """Simple in-memory token bucket rate limiter per client IP."""
+# Upper bound on tracked clients; beyond it the least recently seen is evicted.
+RATE_LIMIT_MAX_CLIENTS = int(os.getenv("RATE_LIMIT_MAX_CLIENTS", "100000"))
+# How often local consumption is pushed to the rate_limits table; 0 disables sharing.
+RATE_LIMIT_SYNC_INTERVAL = float(os.getenv("RATE_LIMIT_SYNC_INTERVAL", "0.25"))
+RATE_LIMIT_CLEANUP_INTERVAL = float(os.getenv("RATE_LIMIT_CLEANUP_INTERVAL", "300"))
 
-    def __init__(self, app, limit: int = 10, period: int = 86400):
-        super().__init__(app)
+_TOO_MANY_REQUESTS = b"Too Many Requests"
+
+
+class TokenBucketStore:
+    """Per-key token buckets with continuous refill and a bounded size.
+
+    Each bucket holds up to ``capacity`` tokens and refills at
+    ``refill_per_second``, fractionally, so a client regains capacity
+    gradually instead of all at once when a window ends. Buckets are kept in
+    least-recently-used order. Every call drops at most a couple of buckets
+    from the old end that have refilled completely, since a full bucket is
+    the same as no bucket. When the store is full, inserting a new key evicts
+    the least recently used one. Both cost O(1), so memory stays flat under
+    traffic from many addresses.
+    """
+
+    def __init__(
+        self,
+        capacity: float,
+        refill_per_second: float,
+        max_keys: int = RATE_LIMIT_MAX_CLIENTS,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        self.capacity = float(capacity)
+        self.refill_per_second = refill_per_second
+        self.max_keys = max_keys
+        self.clock = clock
+        # key -> [tokens, updated_at]
+        self._buckets: OrderedDict[str, list] = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._buckets)
+
+    def _refilled(self, bucket: list, now: float) -> float:
+        return min(self.capacity, bucket[0] + (now - bucket[1]) * self.refill_per_second)
+
+    def _prune(self, now: float, budget: int = 2) -> None:
+        buckets = self._buckets
+        while budget and buckets:
+            key, bucket = next(iter(buckets.items()))
+            if self._refilled(bucket, now) < self.capacity:
+                return
+            del buckets[key]
+            budget -= 1
+
+    def tokens(self, key: str) -> float:
+        bucket = self._buckets.get(key)
+        return self.capacity if bucket is None else self._refilled(bucket, self.clock())
+
+    def consume(self, key: str, amount: float = 1.0) -> bool:
+        """Take ``amount`` tokens from ``key``'s bucket if it has them."""
+        now = self.clock()
+        buckets = self._buckets
+        # Prune first: it may drop this key's bucket if it has refilled.
+        self._prune(now)
+        bucket = buckets.get(key)
+        if bucket is None:
+            if len(buckets) >= self.max_keys:
+                buckets.popitem(last=False)
+            bucket = buckets[key] = [self.capacity, now]
+        else:
+            bucket[0] = self._refilled(bucket, now)
+            bucket[1] = now
+            buckets.move_to_end(key)
+        if bucket[0] < amount:
+            return False
+        bucket[0] -= amount
+        return True
+
+    def clamp(self, key: str, tokens: float) -> None:
+        """Lower ``key``'s tokens to at most ``tokens`` (never raises them).
+
+        ``tokens`` may be negative: the bucket then refills past that debt
+        before it admits the next request.
+        """
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            return
+        now = self.clock()
+        bucket[0] = min(self._refilled(bucket, now), tokens)
+        bucket[1] = now
+
+    def retry_after(self, key: str, amount: float = 1.0) -> float:
+        """Seconds until ``key`` has ``amount`` tokens again."""
+        missing = amount - self.tokens(key)
+        if missing <= 0:
+            return 0.0
+        if self.refill_per_second <= 0:
+            return math.inf
+        return missing / self.refill_per_second
+
+
+class RateLimitSync:
+    """Share rate limit consumption between workers through ``rate_limits``.
+
+    Requests are still admitted by the local ``TokenBucketStore``. Allowed
+    requests are counted in memory, and every ``interval`` seconds the counts
+    are taken from a cluster-wide token bucket per IP in one batched upsert.
+    That bucket has the same capacity and refill rate as the local ones. The
+    statement returns the tokens each IP has left, and the local bucket is
+    lowered to them, so the cluster enforces the same continuous refill as a
+    single worker. A client can overshoot by at most one sync interval of
+    traffic per worker; the overshoot is owed by the cluster bucket and paid
+    back before the client is admitted again. There is no database write per
+    request.
+    """
+
+    def __init__(
+        self,
+        store: TokenBucketStore,
+        limit: int,
+        period: float,
+        interval: float = RATE_LIMIT_SYNC_INTERVAL,
+        cleanup_interval: float = RATE_LIMIT_CLEANUP_INTERVAL,
+    ):
+        self.store = store
         self.limit = limit
         self.period = period
-        self.buckets: dict[str, tuple[int, float]] = {}
-
-    async def dispatch(self, request: Request, call_next):
-        client_ip = request.client.host if request.client else "unknown"
-        now = time.time()
-        tokens, last = self.buckets.get(client_ip, (self.limit, now))
-        if now - last > self.period:
-            tokens = self.limit
-            last = now
-        if tokens <= 0:
-            return Response("Too Many Requests", status_code=429)
-        tokens -= 1
-        self.buckets[client_ip] = (tokens, last)
-        return await call_next(request)
+        self.interval = interval
+        self.cleanup_interval = cleanup_interval
+        self.pending: Dict[str, int] = {}
+        self._pool: Any = None
+        self._task: Optional[asyncio.Task] = None
+        self._last_cleanup = time.monotonic()
+
+    def record(self, key: str, count: int = 1) -> None:
+        self.pending[key] = self.pending.get(key, 0) + count
+
+    async def flush(self, pool: Any) -> None:
+        """Push pending counts and clamp local buckets to the cluster's tokens."""
+        if not self.pending:
+            return
+        batch, self.pending = self.pending, {}
+        by_host: Dict[str, list] = {}
+        for key, count in batch.items():
+            try:
+                host = str(ipaddress.ip_address(key))
+            except ValueError:
+                continue  # e.g. "unknown": stays local only
+            entry = by_host.setdefault(host, [0, []])
+            entry[0] += count
+            entry[1].append(key)
+        if not by_host:
+            return
+        hosts = list(by_host)
+        try:
+            left = await take_tokens(pool, hosts, [by_host[h][0] for h in hosts], self.limit, self.period)
+        except Exception:
+            # Keep the counts for the next round.
+            for key, count in batch.items():
+                self.pending[key] = self.pending.get(key, 0) + count
+            raise
+        for host, tokens in left.items():
+            for key in by_host.get(host, (0, ()))[1]:
+                # Requests admitted while the upsert ran are not taken from ``tokens`` yet.
+                self.store.clamp(key, tokens - self.pending.get(key, 0))
+
+    async def _run(self) -> None:
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                await self.flush(self._pool)
+                if time.monotonic() - self._last_cleanup >= self.cleanup_interval:
+                    self._last_cleanup = time.monotonic()
+                    await delete_expired(self._pool, self.limit, self.period)
+            except Exception as e:
+                print(f"Rate limit sync failed: {e}")
+
+    def start(self, pool: Any) -> None:
+        if self.interval <= 0 or pool is None or self._task is not None:
+            return
+        self._pool = pool
+        self._task = asyncio.create_task(self._run(), name="rate-limit-sync")
+
+    async def stop(self) -> None:
+        if self._task is None:
+            return
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+        try:
+            await self.flush(self._pool)
+        except Exception as e:
+            print(f"Rate limit sync failed: {e}")
+
+
+class RateLimitMiddleware:
+    """In-memory token bucket rate limiter per client IP.
+
+    A client may burst up to ``limit`` requests and then regains
+    ``limit / period`` requests per second. Pass a ``RateLimitSync`` (and its
+    ``store``) to enforce the same bucket across workers.
+
+    Every admitted request costs one token. Routes whose cost depends on the
+    body, like ``/predict/batch``, charge the rest through the callable in
+    ``request.state.rate_limit_charge`` (see ``charge``).
+    """
+
+    def __init__(
+        self,
+        app,
+        limit: int = 10,
+        period: int = 86400,
+        exempt_paths: tuple[str, ...] = (),
+        exempt_prefixes: tuple[str, ...] = (),
+        max_clients: int = RATE_LIMIT_MAX_CLIENTS,
+        store: Optional[TokenBucketStore] = None,
+        sync: Optional[RateLimitSync] = None,
+    ):
+        self.app = app
+        self.limit = limit
+        self.period = period
+        self.exempt_paths = frozenset(exempt_paths)
+        self.exempt_prefixes = tuple(exempt_prefixes)
+        if store is None:
+            store = sync.store if sync is not None else TokenBucketStore(limit, limit / period, max_keys=max_clients)
+        self.store = store
+        self.sync = sync
+
+    def charge(self, client_ip: str, amount: int) -> Optional[int]:
+        """Take ``amount`` more tokens for an admitted request.
+
+        Returns ``None`` if the client had them, else the seconds to send in
+        ``Retry-After``.
+        """
+        if amount <= 0:
+            return None
+        if not self.store.consume(client_ip, amount):
+            return math.ceil(min(self.store.retry_after(client_ip, amount), self.period))
+        if self.sync is not None:
+            self.sync.record(client_ip, amount)
+        return None
+
+    async def __call__(self, scope, receive, send):
+        if (
+            scope["type"] != "http"
+            or scope["path"] in self.exempt_paths
+            or (self.exempt_prefixes and scope["path"].startswith(self.exempt_prefixes))
+        ):
+            await self.app(scope, receive, send)
+            return
+        client = scope.get("client")
+        client_ip = client[0] if client else "unknown"
+        if not self.store.consume(client_ip):
+            retry_after = self.store.retry_after(client_ip)
+            await send({
+                "type": "http.response.start",
+                "status": 429,
+                "headers": [
+                    (b"content-type", b"text/plain; charset=utf-8"),
+                    (b"content-length", str(len(_TOO_MANY_REQUESTS)).encode()),
+                    (b"retry-after", str(math.ceil(min(retry_after, self.period))).encode()),
+                ],
+            })
+            await send({"type": "http.response.body", "body": _TOO_MANY_REQUESTS})
+            return
+        if self.sync is not None:
+            self.sync.record(client_ip)
+        scope.setdefault("state", {})["rate_limit_charge"] = functools.partial(self.charge, client_ip)
+        await self.app(scope, receive, send)
@@ -0,0 +1,81 @@
+import json
+import logging
+import os
+import random
+import time
+
+from api import timing
+from api.metrics import REQUEST_LATENCY
+
+logger = logging.getLogger("api.timing")
+
+
+def route_label(scope) -> str:
+    """Route template (``/predict``) rather than raw path, to bound label cardinality."""
+    route = scope.get("route")
+    return getattr(route, "path", None) or "unmatched"
+
+
+class ServerTimingMiddleware:
+    """Record request latency and expose per-stage timings of sampled requests.
+
+    Every request is observed in the request-latency histogram. Sampled
+    requests also get a ``Server-Timing`` response header and one JSON log
+    line. ``sample_rate`` defaults to ``TIMING_SAMPLE_RATE`` (1.0 = every
+    request, 0 = off).
+    """
+
+    def __init__(self, app, sample_rate: float | None = None):
+        self.app = app
+        if sample_rate is None:
+            sample_rate = float(os.getenv("TIMING_SAMPLE_RATE", "1.0"))
+        self.sample_rate = sample_rate
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        status = 500
+        if self.sample_rate <= 0 or (self.sample_rate < 1 and random.random() >= self.sample_rate):
+            async def send_status(message):
+                nonlocal status
+                if message["type"] == "http.response.start":
+                    status = message["status"]
+                await send(message)
+
+            start = time.perf_counter()
+            try:
+                await self.app(scope, receive, send_status)
+            finally:
+                REQUEST_LATENCY.labels(route_label(scope), scope["method"], status).observe(
+                    time.perf_counter() - start)
+            return
+
+        timings, token = timing.begin()
+
+        async def send_with_timing(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                # The header has to go out with the response start, so it covers the time until then.
+                header = timings.server_timing(timings.total()).encode("latin-1")
+                message = {**message, "headers": [*message.get("headers", ()), (b"server-timing", header)]}
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_timing)
+        finally:
+            timing.end(token)
+            total = timings.total()
+            route = route_label(scope)
+            REQUEST_LATENCY.labels(route, scope["method"], status).observe(total)
+            logger.info(json.dumps({
+                "event": "request_timing",
+                "method": scope["method"],
+                "route": route,
+                "path": scope["path"],
+                "status": status,
+                "total_ms": round(total * 1000, 2),
+                "stages_ms": {name: round(d * 1000, 2) for name, d in timings.stages.items()},
+            }))
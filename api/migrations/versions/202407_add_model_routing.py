@@ -0,0 +1,27 @@
+"""add model_routing for model version rollouts"""
+
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = '202407_add_model_routing'
+down_revision = '202406_add_prediction_columns'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        'model_routing',
+        sa.Column('model', sa.String(), primary_key=True),
+        # Embedding version the gallery (photos.vlad) was computed with.
+        sa.Column('gallery_version', sa.String()),
+        sa.Column('canary_version', sa.String()),
+        sa.Column('canary_weight', sa.Float(), nullable=False, server_default='0'),
+        sa.Column('updated_at', sa.DateTime(timezone=True), nullable=False, server_default=sa.func.now()),
+        sa.CheckConstraint('canary_weight >= 0 AND canary_weight <= 1', name='ck_model_routing_canary_weight'),
+    )
+
+
+def downgrade():
+    op.drop_table('model_routing')
@@ -0,0 +1,20 @@
+"""store a refilling token count in rate_limits"""
+
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision = '202408_rate_limit_tokens'
+down_revision = '202407_add_model_routing'
+branch_labels = None
+depends_on = None
+
+
+# rate_limits is created by scripts/init-db.sql, not by a migration.
+def upgrade():
+    op.execute('ALTER TABLE IF EXISTS rate_limits ADD COLUMN IF NOT EXISTS tokens DOUBLE PRECISION')
+    op.execute('CREATE INDEX IF NOT EXISTS idx_rate_limits_last_request ON rate_limits (last_request)')
+
+
+def downgrade():
+    op.execute('DROP INDEX IF EXISTS idx_rate_limits_last_request')
+    op.execute('ALTER TABLE IF EXISTS rate_limits DROP COLUMN IF EXISTS tokens')
@@ -0,0 +1,10 @@
+from typing import Any
+
+
+async def try_advisory_lock(conn: Any, key: int) -> bool:
+    """Take the session-level advisory lock ``key`` on ``conn`` if no session holds it.
+
+    The lock is held until ``conn`` closes or is reset, e.g. by going back
+    to its pool.
+    """
+    return bool(await conn.fetchval("SELECT pg_try_advisory_lock($1)", key))
@@ -1,19 +1,28 @@
 import os
-from typing import Optional, Dict, Any
+from typing import Any, Dict, List, Optional, Sequence, Tuple
 
 import asyncpg
 
-from api.db import init_connection
+from api.db import connection_options, init_connection
 import numpy as np
 
+NEAREST_QUERY = (
+    "SELECT lat, lon, 1 - (vlad <#> $1) AS score "
+    "FROM whereisthisplace.photos ORDER BY vlad <#> $1 LIMIT 1"
+)
 
-async def nearest(vec: np.ndarray) -> Optional[asyncpg.Record]:
+
+async def nearest(vec: np.ndarray, pool: Optional[Any] = None) -> Optional[asyncpg.Record]:
     """Return the closest photo to the given vector.
 
     Parameters
     ----------
     vec: np.ndarray
         Embedding vector with dimension matching the ``vlad`` column.
+    pool: optional
+        Pool to run the query on, normally ``app.state.read_pool`` so the
+        search goes to a read replica. Without one, a dedicated connection to
+        ``DATABASE_URL`` is opened for the query.
 
     Returns
     -------
@@ -21,19 +30,120 @@ async def nearest(vec: np.ndarray) -> Optional[asyncpg.Record]:
         Row containing ``lat``, ``lon`` and ``score`` fields or ``None`` if no
         data is found.
     """
+    if pool is not None:
+        return await pool.fetchrow(NEAREST_QUERY, vec)
+
     database_url = os.getenv("DATABASE_URL")
     if not database_url:
         raise RuntimeError("DATABASE_URL is not set")
 
-    conn = await asyncpg.connect(dsn=database_url)
+    conn = await asyncpg.connect(dsn=database_url, **connection_options())
     await init_connection(conn)
     try:
-        row = await conn.fetchrow(
-            "SELECT lat, lon, 1 - (vlad <#> $1) AS score "
-            "FROM photos ORDER BY vlad <#> $1 LIMIT 1",
-            vec.tolist(),
-        )
+        row = await conn.fetchrow(NEAREST_QUERY, vec)
         return row
     finally:
         await conn.close()
 
+
+# One nearest-neighbour search per query vector, in a single round trip. The
+# vectors are passed as text so no array codec for ``vector`` is needed.
+NEAREST_MANY_QUERY = """
+SELECT q.idx, m.lat, m.lon, m.score
+FROM unnest($1::text[]) WITH ORDINALITY AS q(vec, idx)
+LEFT JOIN LATERAL (
+    SELECT lat, lon, 1 - (vlad <#> q.vec::vector) AS score
+    FROM whereisthisplace.photos ORDER BY vlad <#> q.vec::vector LIMIT 1
+) m ON true
+ORDER BY q.idx
+"""
+
+
+def _vector_literal(vec: np.ndarray) -> str:
+    return "[" + ",".join(str(float(x)) for x in vec.tolist()) + "]"
+
+
+async def nearest_many(vecs: Sequence[np.ndarray], pool: Optional[Any] = None) -> List[Optional[Dict[str, Any]]]:
+    """Return the closest photo to each of the given vectors.
+
+    Like ``nearest`` for a batch: the searches run as one statement and the
+    result has one entry per vector, in order, ``None`` where nothing matched.
+    """
+    if not vecs:
+        return []
+    literals = [_vector_literal(vec) for vec in vecs]
+
+    if pool is not None:
+        rows = await pool.fetch(NEAREST_MANY_QUERY, literals)
+    else:
+        database_url = os.getenv("DATABASE_URL")
+        if not database_url:
+            raise RuntimeError("DATABASE_URL is not set")
+
+        conn = await asyncpg.connect(dsn=database_url, **connection_options())
+        await init_connection(conn)
+        try:
+            rows = await conn.fetch(NEAREST_MANY_QUERY, literals)
+        finally:
+            await conn.close()
+
+    matches: List[Optional[Dict[str, Any]]] = [None] * len(vecs)
+    for row in rows:
+        if row["lat"] is not None:
+            matches[row["idx"] - 1] = {"lat": row["lat"], "lon": row["lon"], "score": row["score"]}
+    return matches
+
+
+# Search and prediction log in one statement. The data-modifying CTE sees the
+# table as it was before the insert, so the new row never matches itself.
+NEAREST_AND_LOG_QUERY = """
+WITH match AS (
+    SELECT lat, lon, 1 - (vlad <#> $1) AS score
+    FROM whereisthisplace.photos ORDER BY vlad <#> $1 LIMIT 1
+), judged AS (
+    SELECT lat, lon, score,
+           CASE WHEN lat BETWEEN $2::float8 AND $3::float8 AND lon BETWEEN $4::float8 AND $5::float8 THEN
+               CASE WHEN $8::text IS NOT NULL THEN $8::text
+                    WHEN score > $6::float8 THEN $9::text
+               END
+           END AS bias_warning
+    FROM match
+), logged AS (
+    INSERT INTO whereisthisplace.photos (lat, lon, score, bias_warning, source)
+    SELECT lat, lon,
+           CASE WHEN bias_warning IS NULL THEN score ELSE score * $7::float8 END,
+           bias_warning, $10::text
+    FROM judged
+)
+SELECT lat, lon, score FROM match
+"""
+
+
+async def nearest_and_log(
+    pool: Any,
+    vec: np.ndarray,
+    *,
+    lat_range: Tuple[float, float],
+    lon_range: Tuple[float, float],
+    high_confidence: float,
+    score_factor: float,
+    filename_reason: Optional[str],
+    high_confidence_reason: str,
+    source: str = "model",
+) -> Optional[asyncpg.Record]:
+    """Find the closest photo and log the prediction in one round trip.
+
+    Returns the same row as ``nearest`` (the unadjusted score). The logged
+    row gets the bias adjustment described by the keyword arguments: inside
+    ``lat_range``/``lon_range``, a ``filename_reason`` or a score above
+    ``high_confidence`` becomes the ``bias_warning``, and the score is
+    multiplied by ``score_factor``. Needs a pool on the primary.
+    """
+    return await pool.fetchrow(
+        NEAREST_AND_LOG_QUERY,
+        vec,
+        lat_range[0], lat_range[1], lon_range[0], lon_range[1],
+        high_confidence, score_factor,
+        filename_reason, high_confidence_reason,
+        source,
+    )
@@ -0,0 +1,51 @@
+from typing import Any, Optional
+
+
+async def get_routing(pool: Any, model: str) -> Optional[dict]:
+    """Return the routing row of ``model``, or ``None`` if it has none."""
+    row = await pool.fetchrow(
+        """
+        SELECT gallery_version, canary_version, canary_weight
+        FROM whereisthisplace.model_routing WHERE model = $1
+        """,
+        model,
+    )
+    return dict(row) if row else None
+
+
+async def set_canary(pool: Any, model: str, version: Optional[str], weight: float) -> None:
+    """Send ``weight`` (0-1) of ``model``'s requests to ``version``."""
+    await pool.execute(
+        """
+        INSERT INTO whereisthisplace.model_routing (model, canary_version, canary_weight)
+        VALUES ($1, $2, $3)
+        ON CONFLICT (model) DO UPDATE SET
+            canary_version = EXCLUDED.canary_version,
+            canary_weight = EXCLUDED.canary_weight,
+            updated_at = now()
+        """,
+        model, version, weight,
+    )
+
+
+async def set_gallery_version(pool: Any, model: str, version: str) -> None:
+    """Stamp the gallery with the embedding version its vectors were computed with."""
+    await pool.execute(
+        """
+        INSERT INTO whereisthisplace.model_routing (model, gallery_version)
+        VALUES ($1, $2)
+        ON CONFLICT (model) DO UPDATE SET gallery_version = EXCLUDED.gallery_version, updated_at = now()
+        """,
+        model, version,
+    )
+
+
+async def gallery_dimension(pool: Any) -> Optional[int]:
+    """Declared dimension of ``photos.vlad``; pgvector stores it as the type modifier."""
+    typmod = await pool.fetchval(
+        """
+        SELECT atttypmod FROM pg_attribute
+        WHERE attrelid = 'whereisthisplace.photos'::regclass AND attname = 'vlad'
+        """
+    )
+    return typmod if typmod and typmod > 0 else None
@@ -1,10 +1,18 @@
 import asyncpg
-from typing import Optional, Any
+from typing import Optional, Any, Iterable, Tuple
 
 async def insert_prediction(pool: Any, lat: float, lon: float, score: float,
                             bias_warning: Optional[str], source: str) -> None:
     """Insert a prediction record into the photos table."""
     await pool.execute(
-        "INSERT INTO photos (lat, lon, score, bias_warning, source) VALUES ($1, $2, $3, $4, $5)",
+        "INSERT INTO whereisthisplace.photos (lat, lon, score, bias_warning, source) VALUES ($1, $2, $3, $4, $5)",
         lat, lon, score, bias_warning, source
     )
+
+
+async def insert_predictions(pool: Any, rows: Iterable[Tuple[float, float, float, Optional[str], str]]) -> None:
+    """Insert several prediction records, each ``(lat, lon, score, bias_warning, source)``."""
+    await pool.executemany(
+        "INSERT INTO whereisthisplace.photos (lat, lon, score, bias_warning, source) VALUES ($1, $2, $3, $4, $5)",
+        list(rows)
+    )
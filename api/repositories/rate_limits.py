@@ -0,0 +1,42 @@
+from typing import Any, Dict, List
+
+
+async def take_tokens(pool: Any, ips: List[str], counts: List[int], limit: float, period: float) -> Dict[str, float]:
+    """Take request counts from each IP's cluster-wide bucket in ``rate_limits``.
+
+    A bucket holds up to ``limit`` tokens and regains ``limit / period`` per
+    second since its ``last_request``. One statement refills and charges the
+    whole batch. Tokens may go below zero when workers admitted more than was
+    left; that debt is paid back before the client is admitted again. Returns
+    the tokens left for every IP in the batch, keyed by ``host(ip_address)``.
+    """
+    rows = await pool.fetch(
+        """
+        INSERT INTO whereisthisplace.rate_limits AS rate_limits (ip_address, request_count, tokens, last_request)
+        SELECT ip::inet, n, $3::float8 - n, now() FROM unnest($1::text[], $2::int[]) AS batch(ip, n)
+        ON CONFLICT (ip_address) DO UPDATE SET
+            request_count = rate_limits.request_count + EXCLUDED.request_count,
+            tokens = LEAST(
+                $3::float8,
+                COALESCE(rate_limits.tokens, $3::float8)
+                    + EXTRACT(EPOCH FROM now() - rate_limits.last_request) * $3::float8 / $4::float8
+            ) - EXCLUDED.request_count,
+            last_request = now()
+        RETURNING host(ip_address) AS ip, tokens
+        """,
+        ips, counts, limit, period,
+    )
+    return {row["ip"]: row["tokens"] for row in rows}
+
+
+async def delete_expired(pool: Any, limit: float, period: float) -> None:
+    """Remove buckets that have refilled completely; they are the same as no row."""
+    await pool.execute(
+        """
+        DELETE FROM whereisthisplace.rate_limits
+        WHERE last_request < now() - make_interval(secs => $2::float8)
+          AND COALESCE(tokens, $1::float8)
+              + EXTRACT(EPOCH FROM now() - last_request) * $1::float8 / $2::float8 >= $1::float8
+        """,
+        limit, period,
+    )
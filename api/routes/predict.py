@@ -1,58 +1,97 @@
-from fastapi import APIRouter, UploadFile, File, HTTPException, Depends, Request
+from fastapi import APIRouter, BackgroundTasks, UploadFile, File, HTTPException, Depends, Request
+from fastapi.responses import StreamingResponse
 import requests
-from io import BytesIO
 import os
 import json
+import asyncio
 import base64
+import hashlib
 import types
-from dataclasses import dataclass, asdict
-from typing import Any, Dict, Optional
+from dataclasses import dataclass, asdict, replace
+from typing import Any, Dict, List, Optional, Tuple
 import numpy as np
-from api.repositories.match import nearest
-from api.repositories.photos import insert_prediction
+from api.repositories.match import nearest, nearest_and_log, nearest_many
+from api.repositories.photos import insert_prediction, insert_predictions
+from api.coalesce import SingleFlight, TTLCache
+from api.embedding import EmbeddingFormatError
+from api.inference import (
+    CanaryRouter,
+    InferenceError,
+    InferenceTimeout,
+    InferenceUnavailable,
+    ModelRoutingSync,
+    create_inference_client,
+)
+from api.shadow import ShadowMirror
+from ml.exif import read_gps, trustworthy
+from ml.fuse import fuse
+from api.jobs import FAILED, SUCCEEDED, ClientQueueFull, JobManager, QueueFull
+from api.timing import stage, lap
+from api.metrics import (
+    BIAS_ADJUSTED,
+    CACHE_REQUESTS,
+    FALLBACKS,
+    PREDICTIONS,
+    UPSTREAM_ERRORS,
+    UPSTREAM_REQUESTS,
+)
 
 
-async def query_geo(vec: np.ndarray) -> "GeoResult":
+async def query_geo(vec: np.ndarray, pool: Any = None) -> "GeoResult":
     """Return geographic coordinates for a PatchNetVLAD embedding."""
-    row = await nearest(vec)
+    with stage("nearest"):
+        row = await nearest(vec, pool=pool)
     if row is None:
         raise HTTPException(status_code=404, detail="No match found")
     return GeoResult(lat=row["lat"], lon=row["lon"], score=row.get("score", 0.0))
 
 
+# NYC coordinates: roughly 40.4-41.0 latitude, -74.5 to -73.5 longitude
+NYC_LAT_RANGE = (40.4, 41.0)
+NYC_LON_RANGE = (-74.5, -73.5)
+# Common European landmark filenames that shouldn't predict NYC
+EUROPEAN_KEYWORDS = [
+    'eiffel', 'tower', 'brandenburg', 'gate', 'buckingham', 'palace', 
+    'big_ben', 'london', 'paris', 'berlin', 'europe', 'colosseum',
+    'arc_de_triomphe', 'notre_dame', 'louvre', 'westminster'
+]
+# High confidence NYC predictions are often suspicious for user uploads
+BIAS_HIGH_CONFIDENCE = 0.9
+HIGH_CONFIDENCE_BIAS_REASON = "Very high confidence NYC prediction may indicate model bias"
+# Reduce confidence significantly for biased predictions
+BIAS_SCORE_FACTOR = 0.3
+
+
+def is_nyc(lat: float, lon: float) -> bool:
+    return (NYC_LAT_RANGE[0] <= lat <= NYC_LAT_RANGE[1]) and (NYC_LON_RANGE[0] <= lon <= NYC_LON_RANGE[1])
+
+
+def landmark_bias_reason(filename: str = "") -> Optional[str]:
+    """Warning for an NYC prediction of an upload named after a European landmark."""
+    filename_lower = filename.lower() if filename else ""
+    if any(keyword in filename_lower for keyword in EUROPEAN_KEYWORDS):
+        return f"European landmark filename '{filename}' predicted as NYC"
+    return None
+
+
 def detect_geographic_bias(geo_result: "GeoResult", filename: str = "") -> "GeoResult":
-    """Detect and adjust for known geographic bias patterns."""
+    """Detect and adjust for known geographic bias patterns.
+
+    ``nearest_and_log`` applies the same rule in SQL, from the same constants.
+    """
     lat, lon, score = geo_result.lat, geo_result.lon, geo_result.score
     
-    # NYC coordinates: roughly 40.4-41.0 latitude, -74.5 to -73.5 longitude
-    is_nyc_prediction = (40.4 <= lat <= 41.0) and (-74.5 <= lon <= -73.5)
-    
     # Check for suspicious patterns
-    bias_detected = False
-    bias_reason = ""
+    bias_reason = None
     
-    if is_nyc_prediction:
-        # Common European landmark filenames that shouldn't predict NYC
-        european_keywords = [
-            'eiffel', 'tower', 'brandenburg', 'gate', 'buckingham', 'palace', 
-            'big_ben', 'london', 'paris', 'berlin', 'europe', 'colosseum',
-            'arc_de_triomphe', 'notre_dame', 'louvre', 'westminster'
-        ]
-        
-        filename_lower = filename.lower() if filename else ""
-        if any(keyword in filename_lower for keyword in european_keywords):
-            bias_detected = True
-            bias_reason = f"European landmark filename '{filename}' predicted as NYC"
-        
-        # High confidence NYC predictions are often suspicious for user uploads
-        elif score > 0.9:
-            bias_detected = True
-            bias_reason = "Very high confidence NYC prediction may indicate model bias"
+    if is_nyc(lat, lon):
+        bias_reason = landmark_bias_reason(filename)
+        if bias_reason is None and score > BIAS_HIGH_CONFIDENCE:
+            bias_reason = HIGH_CONFIDENCE_BIAS_REASON
     
     # Apply bias corrections
-    if bias_detected:
-        # Reduce confidence significantly for biased predictions
-        adjusted_score = score * 0.3
+    if bias_reason:
+        adjusted_score = score * BIAS_SCORE_FACTOR
         return GeoResult(
             lat=lat, 
             lon=lon, 
@@ -76,8 +115,7 @@ def should_use_openai_fallback(geo_result: "GeoResult", filename: str = "") -> b
         return True
     
     # 3. Suspicious NYC predictions with moderate confidence
-    is_nyc = (40.4 <= geo_result.lat <= 41.0) and (-74.5 <= geo_result.lon <= -73.5)
-    if is_nyc and geo_result.score < 0.7:
+    if is_nyc(geo_result.lat, geo_result.lon) and geo_result.score < 0.7:
         return True
     
     return False
@@ -96,7 +134,60 @@ OPENAI_BASE_URL = os.getenv("OPENAI_BASE_URL")
 
 router = APIRouter()
 
+ALLOWED_TYPES = ['image/jpeg', 'image/jpg', 'image/png']
+
 TORCHSERVE_URL = os.getenv('TORCHSERVE_URL', 'http://localhost:8080')
+# "http", "grpc" (TorchServe's gRPC inference API at TORCHSERVE_GRPC_TARGET) or
+# "local" (the model at LOCAL_MODEL_PATH in this process's own worker pool).
+INFERENCE_BACKEND = os.getenv('INFERENCE_BACKEND', 'http')
+TORCHSERVE_GRPC_TARGET = os.getenv('TORCHSERVE_GRPC_TARGET', 'localhost:7070')
+LOCAL_MODEL_PATH = os.getenv('LOCAL_MODEL_PATH', '/model-store/where.mar')
+LOCAL_INFERENCE_WORKERS = int(os.getenv('LOCAL_INFERENCE_WORKERS', '2'))
+LOCAL_INFERENCE_THREADS = int(os.getenv('LOCAL_INFERENCE_THREADS', '1'))
+# During a model rollout part of the calls go to the new version (see api/inference/routing.py).
+inference_client = CanaryRouter(create_inference_client(
+    INFERENCE_BACKEND, TORCHSERVE_URL, TORCHSERVE_GRPC_TARGET, model_path=LOCAL_MODEL_PATH,
+    workers=LOCAL_INFERENCE_WORKERS, threads=LOCAL_INFERENCE_THREADS,
+))
+# Started by the app's lifespan for the TorchServe backends.
+model_routing = ModelRoutingSync(inference_client)
+# Off unless SHADOW_SAMPLE_RATE is set (see api/shadow.py).
+shadow_mirror = ShadowMirror.from_env(TORCHSERVE_URL, TORCHSERVE_GRPC_TARGET)
+# Photos with a trustworthy GPS fix in their EXIF block are answered from it.
+EXIF_GPS_ENABLED = os.getenv('EXIF_GPS_ENABLED', 'true').lower() in ('1', 'true', 'yes')
+# Model-only predictions search and log in one statement (see nearest_and_log).
+SEARCH_AND_LOG = os.getenv('DB_SEARCH_AND_LOG', 'false').lower() in ('1', 'true', 'yes')
+
+# /predict/stream: how long the refined event waits for OpenAI and Nominatim.
+OPENAI_STREAM_TIMEOUT = float(os.getenv('OPENAI_STREAM_TIMEOUT', '20'))
+
+# Results of requests with an Idempotency-Key, kept for retries.
+IDEMPOTENCY_TTL = float(os.getenv('IDEMPOTENCY_TTL', '600'))
+IDEMPOTENCY_MAX_ENTRIES = int(os.getenv('IDEMPOTENCY_MAX_ENTRIES', '10000'))
+
+# /predict/batch: images per request, and TorchServe calls in flight per batch.
+# TorchServe groups concurrent calls into one model batch when the model is
+# registered with batch_size > 1.
+BATCH_MAX_IMAGES = int(os.getenv('BATCH_MAX_IMAGES', '16'))
+BATCH_EMBED_CONCURRENCY = int(os.getenv('BATCH_EMBED_CONCURRENCY', '8'))
+
+# /predict/jobs: background workers, unfinished jobs overall and per client,
+# how long finished jobs are kept, and the longest long-poll.
+PREDICTION_JOB_WORKERS = int(os.getenv('PREDICTION_JOB_WORKERS', '4'))
+PREDICTION_JOB_MAX_PENDING = int(os.getenv('PREDICTION_JOB_MAX_PENDING', '100'))
+PREDICTION_JOB_MAX_PER_CLIENT = int(os.getenv('PREDICTION_JOB_MAX_PER_CLIENT', '5'))
+PREDICTION_JOB_TTL = float(os.getenv('PREDICTION_JOB_TTL', '600'))
+PREDICTION_JOB_MAX_WAIT = float(os.getenv('PREDICTION_JOB_MAX_WAIT', '30'))
+
+_inflight_predictions = SingleFlight()
+_idempotent_results = TTLCache(IDEMPOTENCY_TTL, IDEMPOTENCY_MAX_ENTRIES)
+# Started and stopped by the app's lifespan.
+prediction_jobs = JobManager(
+    workers=PREDICTION_JOB_WORKERS,
+    max_pending=PREDICTION_JOB_MAX_PENDING,
+    max_per_client=PREDICTION_JOB_MAX_PER_CLIENT,
+    ttl=PREDICTION_JOB_TTL,
+)
 
 
 async def get_db_pool(request: Request):
@@ -111,11 +202,96 @@ class GeoResult:
     score: float
     bias_warning: Optional[str] = None
     original_score: Optional[float] = None
-    source: str = "model"  # "model" or "openai"
+    source: str = "model"  # "model", "openai" or "exif"
+
+
+def describe_prediction(geo: GeoResult) -> Dict[str, Any]:
+    """Prediction as returned to clients, with display hints."""
+    # Prepare response with enhanced information
+    prediction_dict = asdict(geo)
+    
+    # Add confidence category for user-friendly display
+    if geo.score >= 0.8:
+        confidence_level = "high"
+    elif geo.score >= 0.5:
+        confidence_level = "medium"
+    elif geo.score >= 0.3:
+        confidence_level = "low"
+    else:
+        confidence_level = "very_low"
+    
+    prediction_dict["confidence_level"] = confidence_level
+    
+    # Add warning message for UI
+    if hasattr(geo, 'bias_warning') and geo.bias_warning:
+        prediction_dict["warning"] = "Location prediction may be inaccurate due to model bias"
+    return prediction_dict
+
+
+def exif_geo(image_data: bytes) -> Optional[GeoResult]:
+    """The location in the photo's EXIF GPS fields, if it can be trusted.
+
+    Only the JPEG header is read, so this costs far less than inference.
+    """
+    if not EXIF_GPS_ENABLED:
+        return None
+    with stage("exif"):
+        gps = read_gps(image_data)
+    if not trustworthy(gps):
+        return None
+    (lat, lon), score = fuse([], [], exif=gps)
+    return GeoResult(lat=lat, lon=lon, score=score, source="exif")
+
+
+def embed_image(image_data: bytes, filename: Optional[str], content_type: Optional[str]) -> np.ndarray:
+    """Get the embedding of one image from the inference backend.
+
+    Failures raise the ``HTTPException`` to answer with.
+    """
+    UPSTREAM_REQUESTS.labels("torchserve").inc()
+    try:
+        return inference_client.embed(image_data, filename, content_type).vector
+    except InferenceError as e:
+        UPSTREAM_ERRORS.labels("torchserve", "status").inc()
+        raise HTTPException(
+            status_code=e.status_code,
+            detail=f"TorchServe error: {e.detail}"
+        )
+    except (InferenceUnavailable, InferenceTimeout) as e:
+        raise torchserve_unavailable(e)
+    except EmbeddingFormatError as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+def torchserve_unavailable(error: Exception) -> HTTPException:
+    """Map an unreachable or timed out inference backend to the response for it."""
+    if isinstance(error, InferenceUnavailable):
+        UPSTREAM_ERRORS.labels("torchserve", "connection").inc()
+        return HTTPException(
+            status_code=503,
+            detail="Cannot connect to TorchServe. Please ensure the inference service is running."
+        )
+    UPSTREAM_ERRORS.labels("torchserve", "timeout").inc()
+    return HTTPException(
+        status_code=504,
+        detail="TorchServe request timed out. The model might be processing or unavailable."
+    )
+
+
+def prediction_key(image_data: bytes, filename: Optional[str], mode: Optional[str]) -> str:
+    """Identify a prediction by everything that can change its result."""
+    digest = hashlib.sha256(image_data).hexdigest()
+    return f"{mode or ''}:{filename or ''}:{digest}"
 
 
 @router.post("/predict")
-async def predict(photo: UploadFile = File(...), mode: Optional[str] = None, db_pool=Depends(get_db_pool)):
+async def predict(
+    photo: UploadFile = File(...),
+    mode: Optional[str] = None,
+    db_pool=Depends(get_db_pool),
+    request: Request = None,
+    background_tasks: BackgroundTasks = None,
+):
     """
     Make prediction using the uploaded photo with bias detection and fallback.
     
@@ -123,162 +299,534 @@ async def predict(photo: UploadFile = File(...), mode: Optional[str] = None, db_
     - OpenAI is now the default prediction method
     - Model is only used when mode="model" is explicitly specified
     - This allows testing OpenAI responses while the model/database matures
+
+    Identical uploads that arrive while one is being processed share its
+    result. With an ``Idempotency-Key`` header, the result is also returned
+    to retries for ``IDEMPOTENCY_TTL`` seconds after it completed.
+
+    Photos whose EXIF block carries a trustworthy GPS fix are answered from
+    it with ``source="exif"``, without inference or OpenAI.
+
+    A sample of the requests is mirrored to the shadow model once the
+    response was sent.
     """
+    lap("multipart")
+    if photo.content_type not in ALLOWED_TYPES:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Invalid file type. Allowed types: {ALLOWED_TYPES}"
+        )
+
     try:
-        allowed_types = ['image/jpeg', 'image/jpg', 'image/png']
-        if photo.content_type not in allowed_types:
+        image_data = await photo.read()
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Prediction error: {str(e)}")
+
+    key = prediction_key(image_data, photo.filename, mode)
+    # Vector search goes to a read replica when the app has them.
+    read_pool = getattr(request.app.state, "read_pool", None) if request is not None else None
+    idempotency_key = request.headers.get("idempotency-key") if request is not None else None
+    if idempotency_key:
+        cached = _idempotent_results.get(idempotency_key)
+        if cached is not None:
+            cached_key, cached_result = cached
+            if cached_key != key:
+                raise HTTPException(
+                    status_code=422,
+                    detail="Idempotency-Key was already used for a different request"
+                )
+            CACHE_REQUESTS.labels("idempotency", "hit").inc()
+            return cached_result
+        CACHE_REQUESTS.labels("idempotency", "miss").inc()
+
+    result, shared = await _inflight_predictions.do(
+        key,
+        lambda: _predict_image(image_data, photo.filename, photo.content_type, mode, db_pool, read_pool),
+    )
+    CACHE_REQUESTS.labels("predict_singleflight", "hit" if shared else "miss").inc()
+    if not shared and background_tasks is not None and shadow_mirror.sampled():
+        background_tasks.add_task(
+            shadow_mirror.run, image_data, photo.filename, photo.content_type,
+            result["prediction"], read_pool or db_pool,
+        )
+    if idempotency_key:
+        _idempotent_results.set(idempotency_key, (key, result))
+    return result
+
+
+def _error_body(error: BaseException) -> Dict[str, Any]:
+    """Status code and detail the error would have produced as a response."""
+    if not isinstance(error, HTTPException):
+        error = HTTPException(status_code=500, detail=f"Prediction error: {str(error)}")
+    return {"status_code": error.status_code, "detail": error.detail}
+
+
+def _item_error(index: int, filename: Optional[str], error: BaseException) -> Dict[str, Any]:
+    return {
+        "index": index,
+        "filename": filename,
+        "status": "error",
+        "error": _error_body(error),
+    }
+
+
+def _item_success(index: int, filename: Optional[str], geo: GeoResult,
+                  results: List[Optional[Dict[str, Any]]]) -> Tuple:
+    """Store the result for item ``index`` and return its row for ``insert_predictions``."""
+    PREDICTIONS.labels(geo.source).inc()
+    results[index] = {
+        "index": index,
+        "filename": filename,
+        "status": "success",
+        "prediction": describe_prediction(geo),
+    }
+    return (geo.lat, geo.lon, geo.score, geo.bias_warning, geo.source)
+
+
+async def _embed_batch_item(semaphore: asyncio.Semaphore, image_data: bytes,
+                            filename: Optional[str], content_type: Optional[str]) -> np.ndarray:
+    async with semaphore:
+        return await asyncio.to_thread(embed_image, image_data, filename, content_type)
+
+
+@router.post("/predict/batch")
+async def predict_batch(
+    photos: List[UploadFile] = File(...),
+    db_pool=Depends(get_db_pool),
+    request: Request = None,
+):
+    """
+    Predict the location of several uploaded photos in one request.
+
+    Images are embedded by concurrent TorchServe calls, matched by a single
+    multi-vector search and logged with one batched insert. Results come
+    back in upload order; an image that fails gets an ``error`` entry with
+    the status code and detail ``/predict`` would have returned, and the
+    rest of the batch is unaffected.
+
+    Batches use the model only, without the OpenAI fallback. Photos with a
+    trustworthy EXIF GPS fix are answered from it, as in ``/predict``.
+
+    Each image counts as one request against the client's rate limit.
+    """
+    lap("multipart")
+    if len(photos) > BATCH_MAX_IMAGES:
+        raise HTTPException(
+            status_code=413,
+            detail=f"Too many images. Maximum is {BATCH_MAX_IMAGES} per batch"
+        )
+    # The rate limiter charged one image when it admitted the request.
+    charge = getattr(request.state, "rate_limit_charge", None) if request is not None else None
+    if charge is not None:
+        retry_after = charge(len(photos) - 1)
+        if retry_after is not None:
             raise HTTPException(
-                status_code=400,
-                detail=f"Invalid file type. Allowed types: {allowed_types}"
+                status_code=429,
+                detail="Too Many Requests",
+                headers={"Retry-After": str(retry_after)},
             )
+    read_pool = getattr(request.app.state, "read_pool", None) if request is not None else None
 
-        image_data = await photo.read()
-        files = {'data': (photo.filename, BytesIO(image_data), photo.content_type)}
+    results: List[Optional[Dict[str, Any]]] = [None] * len(photos)
+    rows = []
+    pending = []
+    for index, photo in enumerate(photos):
+        if photo.content_type not in ALLOWED_TYPES:
+            results[index] = _item_error(index, photo.filename, HTTPException(
+                status_code=400,
+                detail=f"Invalid file type. Allowed types: {ALLOWED_TYPES}"
+            ))
+            continue
+        data = await photo.read()
+        geo = exif_geo(data)
+        if geo is not None:
+            rows.append(_item_success(index, photo.filename, geo, results))
+            continue
+        pending.append((index, photo, data))
 
-        response = requests.post(
-            f"{TORCHSERVE_URL}/predictions/where",
-            files=files,
-            timeout=30
+    semaphore = asyncio.Semaphore(BATCH_EMBED_CONCURRENCY)
+    with stage("torchserve"):
+        embedded = await asyncio.gather(
+            *(_embed_batch_item(semaphore, data, photo.filename, photo.content_type) for _, photo, data in pending),
+            return_exceptions=True,
         )
 
-        if response.status_code == 200:
-            try:
-                model_result = response.json()
-            except json.JSONDecodeError:
-                raise HTTPException(status_code=500, detail="Invalid model response")
-
-            embedding = None
-            if isinstance(model_result, dict):
-                embedding = model_result.get("embedding")
-            if embedding is None and isinstance(model_result, list):
-                embedding = model_result
-            if embedding is None:
-                raise HTTPException(status_code=500, detail="No embedding returned from model")
-
-            vec = np.array(embedding)
-            geo = await query_geo(vec)
-            
-            # Apply bias detection
-            geo = detect_geographic_bias(geo, photo.filename)
-            
-            # FEATURE BRANCH: OpenAI is now the default mode
-            # Always use OpenAI unless explicitly disabled with mode="model"
-            use_openai = (mode != "model") and OPENAI_API_KEY
-            
-            if use_openai:
-                try:
-                    b64 = base64.b64encode(image_data).decode()
-                    # Using modern OpenAI v1.x syntax
-                    client = openai.OpenAI(api_key=OPENAI_API_KEY)
-                    resp = client.chat.completions.create(
-                        model="gpt-4o",
-                        messages=[{
-                            "role": "user",
-                            "content": [
-                                {
-                                    "type": "text",
-                                    "text": "Where was this photo taken? Reply with ONLY the city and country name, like 'Paris, France' or 'New York, USA'. If you cannot identify the location, reply with 'Unknown'.",
-                                },
-                                {
-                                    "type": "image_url",
-                                    "image_url": {"url": f"data:{photo.content_type};base64,{b64}"},
-                                },
-                            ],
-                        }],
-                        max_tokens=50
-                    )
-                    place = resp.choices[0].message.content.strip()
-                    
-                    # Skip if OpenAI couldn't identify the location
-                    if any(phrase in place.lower() for phrase in ['unknown', 'i cannot', 'i\'m sorry', 'unable to determine']):
-                        raise Exception("OpenAI could not identify location")
-                    g = requests.get(
-                        "https://nominatim.openstreetmap.org/search",
-                        params={"q": place, "format": "json", "limit": 1},
-                                                headers={"User-Agent": "WhereIsThisPlace/1.0 (https://github.com/whereisthisplace)"},
-                        timeout=10,
-                    )
-                    if g.status_code == 200:
-                        data = g.json()
-                        if isinstance(data, list) and data:
-                            # Use OpenAI result, but preserve original for comparison
-                            original_geo = geo
-                            geo = GeoResult(
-                                lat=float(data[0]["lat"]),
-                                lon=float(data[0]["lon"]),
-                                score=0.95,  # High confidence for OpenAI
-                                source="openai",
-                                bias_warning=getattr(original_geo, 'bias_warning', None),
-                                original_score=original_geo.score  # Preserve model score for comparison
-                            )
-                except Exception as openai_error:
-                    # If OpenAI fails, continue with model prediction but add warning
-                    print(f"OpenAI request failed: {str(openai_error)}")
-                    # Add failure warning to the model prediction
-                    if hasattr(geo, 'bias_warning') and geo.bias_warning:
-                        geo.bias_warning += f" (OpenAI unavailable: {str(openai_error)})"
-                    else:
-                        geo.bias_warning = f"OpenAI unavailable: {str(openai_error)}"
-
-            # Prepare response with enhanced information
-            prediction_dict = asdict(geo)
-            
-            # Add confidence category for user-friendly display
-            if geo.score >= 0.8:
-                confidence_level = "high"
-            elif geo.score >= 0.5:
-                confidence_level = "medium"
-            elif geo.score >= 0.3:
-                confidence_level = "low"
-            else:
-                confidence_level = "very_low"
-            
-            prediction_dict["confidence_level"] = confidence_level
-            
-            # Add warning message for UI
-            if hasattr(geo, 'bias_warning') and geo.bias_warning:
-                prediction_dict["warning"] = "Location prediction may be inaccurate due to model bias"
-
-            # Persist prediction in the database if a pool is available
-            if db_pool:
-                try:
-                    await insert_prediction(
-                        db_pool,
-                        geo.lat,
-                        geo.lon,
-                        geo.score,
-                        getattr(geo, "bias_warning", None),
-                        geo.source,
-                    )
-                except Exception as db_error:
-                    print(f"DB insert failed: {db_error}")
-
-            return {
-                "status": "success",
-                "filename": photo.filename,
-                "prediction": prediction_dict,
-                "message": "Prediction completed successfully",
-            }
+    searched = []
+    for (index, photo, _), outcome in zip(pending, embedded):
+        if isinstance(outcome, Exception):
+            results[index] = _item_error(index, photo.filename, outcome)
         else:
-            raise HTTPException(
-                status_code=response.status_code,
-                detail=f"TorchServe error: {response.text}"
+            searched.append((index, photo, outcome))
+
+    if searched:
+        try:
+            with stage("nearest"):
+                matches = await nearest_many([vec for _, _, vec in searched], pool=read_pool)
+        except Exception as e:
+            raise HTTPException(status_code=500, detail=f"Prediction error: {str(e)}")
+
+        for (index, photo, _), match in zip(searched, matches):
+            if match is None:
+                results[index] = _item_error(index, photo.filename, HTTPException(status_code=404, detail="No match found"))
+                continue
+            geo = detect_geographic_bias(
+                GeoResult(lat=match["lat"], lon=match["lon"], score=match.get("score", 0.0)),
+                photo.filename,
             )
+            if geo.bias_warning:
+                BIAS_ADJUSTED.inc()
+            rows.append(_item_success(index, photo.filename, geo, results))
+
+    if db_pool and rows:
+        try:
+            with stage("insert_prediction"):
+                await insert_predictions(db_pool, rows)
+        except Exception as db_error:
+            print(f"DB insert failed: {db_error}")
+
+    succeeded = sum(1 for result in results if result["status"] == "success")
+    return {
+        "status": "success",
+        "results": results,
+        "succeeded": succeeded,
+        "failed": len(results) - succeeded,
+    }
+
+
+@router.post("/predict/jobs", status_code=202)
+async def submit_prediction_job(
+    photo: UploadFile = File(...),
+    mode: Optional[str] = None,
+    db_pool=Depends(get_db_pool),
+    request: Request = None,
+):
+    """
+    Queue a prediction and return its job id without waiting for it.
 
-    except requests.exceptions.ConnectionError:
+    The job runs the same pipeline as ``/predict`` on a background worker.
+    Poll ``GET /predict/jobs/{job_id}`` for the outcome. A client may have
+    ``PREDICTION_JOB_MAX_PER_CLIENT`` unfinished jobs (429 beyond that), and
+    the worker accepts ``PREDICTION_JOB_MAX_PENDING`` in total (503).
+    """
+    lap("multipart")
+    if photo.content_type not in ALLOWED_TYPES:
         raise HTTPException(
-            status_code=503,
-            detail="Cannot connect to TorchServe. Please ensure the inference service is running."
+            status_code=400,
+            detail=f"Invalid file type. Allowed types: {ALLOWED_TYPES}"
         )
-    except requests.exceptions.Timeout:
-        raise HTTPException(
-            status_code=504,
-            detail="TorchServe request timed out. The model might be processing or unavailable."
+
+    # The upload is gone once this request returns; the job keeps the bytes.
+    image_data = await photo.read()
+    filename, content_type = photo.filename, photo.content_type
+    key = prediction_key(image_data, filename, mode)
+    read_pool = getattr(request.app.state, "read_pool", None) if request is not None else None
+    client = request.client.host if request is not None and request.client else "unknown"
+
+    async def run_prediction():
+        result, shared = await _inflight_predictions.do(
+            key,
+            lambda: _predict_image(image_data, filename, content_type, mode, db_pool, read_pool),
         )
-    except HTTPException:
-        raise
-    except Exception as e:
+        CACHE_REQUESTS.labels("predict_singleflight", "hit" if shared else "miss").inc()
+        return result
+
+    try:
+        job = prediction_jobs.submit(client, run_prediction)
+    except ClientQueueFull as e:
+        raise HTTPException(status_code=429, detail=str(e))
+    except QueueFull as e:
+        raise HTTPException(status_code=503, detail=str(e))
+    return {"job_id": job.id, "status": job.status, "status_url": f"/predict/jobs/{job.id}"}
+
+
+@router.get("/predict/jobs/{job_id}")
+async def get_prediction_job(job_id: str, wait: float = 0):
+    """
+    Report a prediction job's status, and its result once it finished.
+
+    With ``wait`` (seconds, at most ``PREDICTION_JOB_MAX_WAIT``), an
+    unfinished job is waited for before answering.
+    """
+    job = prediction_jobs.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    job = await prediction_jobs.wait(job, min(max(wait, 0.0), PREDICTION_JOB_MAX_WAIT))
+
+    body = {"job_id": job.id, "status": job.status}
+    if job.status == SUCCEEDED:
+        body["result"] = job.result
+    elif job.status == FAILED:
+        body["error"] = _error_body(job.error)
+    return body
+
+
+@router.post("/predict/stream")
+async def predict_stream(
+    photo: UploadFile = File(...),
+    mode: Optional[str] = None,
+    db_pool=Depends(get_db_pool),
+    request: Request = None,
+):
+    """
+    Stream the prediction as newline-delimited JSON events.
+
+    A photo with a trustworthy EXIF GPS fix gets a single ``exif`` event.
+    Otherwise a ``model`` event carries the model's answer as soon as the
+    vector search is done. In OpenAI mode a ``refined`` event follows with the OpenAI
+    answer, or the model answer with a warning if OpenAI failed or took
+    longer than ``OPENAI_STREAM_TIMEOUT`` seconds. ``final`` is true on the
+    last event. Failures after the stream started arrive as an ``error``
+    event with the status code ``/predict`` would have returned.
+    """
+    lap("multipart")
+    if photo.content_type not in ALLOWED_TYPES:
         raise HTTPException(
-            status_code=500,
-            detail=f"Prediction error: {str(e)}"
+            status_code=400,
+            detail=f"Invalid file type. Allowed types: {ALLOWED_TYPES}"
         )
+
+    try:
+        image_data = await photo.read()
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Prediction error: {str(e)}")
+
+    read_pool = getattr(request.app.state, "read_pool", None) if request is not None else None
+    return StreamingResponse(
+        _prediction_events(image_data, photo.filename, photo.content_type, mode, db_pool, read_pool),
+        media_type="application/x-ndjson",
+    )
+
+
+def _event(name: str, final: bool, **fields: Any) -> bytes:
+    return (json.dumps({"event": name, "final": final, **fields}) + "\n").encode()
+
+
+async def _prediction_events(
+    image_data: bytes,
+    filename: Optional[str],
+    content_type: Optional[str],
+    mode: Optional[str],
+    db_pool: Any,
+    read_pool: Any = None,
+):
+    """Events of ``/predict/stream``; the prediction is logged before the last one."""
+    use_openai = (mode != "model") and OPENAI_API_KEY
+    try:
+        geo = exif_geo(image_data)
+        if geo is not None:
+            result = await _record_prediction(geo, filename, db_pool, False)
+            yield _event("exif", True, filename=filename, prediction=result["prediction"])
+            return
+        geo, logged = await _model_geo(image_data, filename, content_type, use_openai, db_pool, read_pool)
+        if not use_openai:
+            result = await _record_prediction(geo, filename, db_pool, logged)
+            yield _event("model", True, filename=filename, prediction=result["prediction"])
+            return
+
+        yield _event("model", False, filename=filename, prediction=describe_prediction(geo))
+        try:
+            # The thread gets a copy: on timeout it may still finish later.
+            geo = await asyncio.wait_for(
+                asyncio.to_thread(refine_with_openai, replace(geo), image_data, content_type),
+                OPENAI_STREAM_TIMEOUT,
+            )
+        except asyncio.TimeoutError:
+            print(f"OpenAI request timed out after {OPENAI_STREAM_TIMEOUT}s")
+            FALLBACKS.labels("openai_timeout").inc()
+            openai_unavailable(geo, "timed out")
+        result = await _record_prediction(geo, filename, db_pool, logged)
+        yield _event("refined", True, filename=filename, prediction=result["prediction"])
+    except Exception as e:
+        error = prediction_error(e)
+        yield _event("error", True, status_code=error.status_code, detail=error.detail)
+
+
+def openai_unavailable(geo: GeoResult, reason: str) -> None:
+    """Add the warning for a model prediction OpenAI could not refine."""
+    # Add failure warning to the model prediction
+    if hasattr(geo, 'bias_warning') and geo.bias_warning:
+        geo.bias_warning += f" (OpenAI unavailable: {reason})"
+    else:
+        geo.bias_warning = f"OpenAI unavailable: {reason}"
+
+
+def refine_with_openai(geo: GeoResult, image_data: bytes, content_type: Optional[str]) -> GeoResult:
+    """Ask OpenAI where the photo was taken and geocode the answer.
+
+    Returns the OpenAI location, or ``geo`` with a warning if that fails.
+    Blocks on both HTTP calls.
+    """
+    try:
+        b64 = base64.b64encode(image_data).decode()
+        # Using modern OpenAI v1.x syntax
+        UPSTREAM_REQUESTS.labels("openai").inc()
+        try:
+            client = openai.OpenAI(api_key=OPENAI_API_KEY)
+            with stage("openai"):
+                resp = client.chat.completions.create(
+                    model="gpt-4o",
+                    messages=[{
+                        "role": "user",
+                        "content": [
+                            {
+                                "type": "text",
+                                "text": "Where was this photo taken? Reply with ONLY the city and country name, like 'Paris, France' or 'New York, USA'. If you cannot identify the location, reply with 'Unknown'.",
+                            },
+                            {
+                                "type": "image_url",
+                                "image_url": {"url": f"data:{content_type};base64,{b64}"},
+                            },
+                        ],
+                    }],
+                    max_tokens=50
+                )
+        except Exception:
+            UPSTREAM_ERRORS.labels("openai", "error").inc()
+            raise
+        place = resp.choices[0].message.content.strip()
+
+        # Skip if OpenAI couldn't identify the location
+        if any(phrase in place.lower() for phrase in ['unknown', 'i cannot', 'i\'m sorry', 'unable to determine']):
+            raise Exception("OpenAI could not identify location")
+        UPSTREAM_REQUESTS.labels("nominatim").inc()
+        try:
+            with stage("nominatim"):
+                g = requests.get(
+                    "https://nominatim.openstreetmap.org/search",
+                    params={"q": place, "format": "json", "limit": 1},
+                    headers={"User-Agent": "WhereIsThisPlace/1.0 (https://github.com/whereisthisplace)"},
+                    timeout=10,
+                )
+        except Exception:
+            UPSTREAM_ERRORS.labels("nominatim", "error").inc()
+            raise
+        if g.status_code == 200:
+            data = g.json()
+            if isinstance(data, list) and data:
+                # Use OpenAI result, but preserve original for comparison
+                original_geo = geo
+                geo = GeoResult(
+                    lat=float(data[0]["lat"]),
+                    lon=float(data[0]["lon"]),
+                    score=0.95,  # High confidence for OpenAI
+                    source="openai",
+                    bias_warning=getattr(original_geo, 'bias_warning', None),
+                    original_score=original_geo.score  # Preserve model score for comparison
+                )
+        else:
+            UPSTREAM_ERRORS.labels("nominatim", "status").inc()
+        if geo.source != "openai":
+            FALLBACKS.labels("geocode_failed").inc()
+    except Exception as openai_error:
+        # If OpenAI fails, continue with model prediction but add warning
+        print(f"OpenAI request failed: {str(openai_error)}")
+        FALLBACKS.labels("openai_failed").inc()
+        openai_unavailable(geo, str(openai_error))
+    return geo
+
+
+async def _model_geo(
+    image_data: bytes,
+    filename: Optional[str],
+    content_type: Optional[str],
+    use_openai: bool,
+    db_pool: Any,
+    read_pool: Any = None,
+) -> Tuple[GeoResult, bool]:
+    """Embed the image and find its location with the model.
+
+    Returns the bias-checked result and whether it was already logged.
+    """
+    # Inference blocks; a thread keeps the event loop serving other requests.
+    with stage("torchserve"):
+        vec = await asyncio.to_thread(embed_image, image_data, filename, content_type)
+
+    # Without OpenAI the model answer is what gets logged, so the search
+    # and the log insert can be one statement on the primary.
+    logged = False
+    if SEARCH_AND_LOG and db_pool and not use_openai:
+        with stage("nearest_and_log"):
+            row = await nearest_and_log(
+                db_pool,
+                vec,
+                lat_range=NYC_LAT_RANGE,
+                lon_range=NYC_LON_RANGE,
+                high_confidence=BIAS_HIGH_CONFIDENCE,
+                score_factor=BIAS_SCORE_FACTOR,
+                filename_reason=landmark_bias_reason(filename),
+                high_confidence_reason=HIGH_CONFIDENCE_BIAS_REASON,
+            )
+        if row is None:
+            raise HTTPException(status_code=404, detail="No match found")
+        geo = GeoResult(lat=row["lat"], lon=row["lon"], score=row.get("score", 0.0))
+        logged = True
+    else:
+        geo = await query_geo(vec, read_pool)
+    
+    # Apply bias detection
+    geo = detect_geographic_bias(geo, filename)
+    if geo.bias_warning:
+        BIAS_ADJUSTED.inc()
+    return geo, logged
+
+
+async def _record_prediction(geo: GeoResult, filename: Optional[str], db_pool: Any, logged: bool) -> Dict[str, Any]:
+    """Log the final prediction and build the ``/predict`` response."""
+    prediction_dict = describe_prediction(geo)
+
+    # Persist prediction in the database if a pool is available
+    if db_pool and not logged:
+        try:
+            with stage("insert_prediction"):
+                await insert_prediction(
+                    db_pool,
+                    geo.lat,
+                    geo.lon,
+                    geo.score,
+                    getattr(geo, "bias_warning", None),
+                    geo.source,
+                )
+        except Exception as db_error:
+            print(f"DB insert failed: {db_error}")
+
+    PREDICTIONS.labels(geo.source).inc()
+    return {
+        "status": "success",
+        "filename": filename,
+        "prediction": prediction_dict,
+        "message": "Prediction completed successfully",
+    }
+
+
+def prediction_error(error: Exception) -> HTTPException:
+    """The response for an exception raised by the prediction pipeline."""
+    if isinstance(error, HTTPException):
+        return error
+    return HTTPException(
+        status_code=500,
+        detail=f"Prediction error: {str(error)}"
+    )
+
+
+async def _predict_image(
+    image_data: bytes,
+    filename: Optional[str],
+    content_type: Optional[str],
+    mode: Optional[str],
+    db_pool: Any,
+    read_pool: Any = None,
+) -> Dict[str, Any]:
+    """Run the prediction pipeline for one image and build the response."""
+    # FEATURE BRANCH: OpenAI is now the default mode
+    # Always use OpenAI unless explicitly disabled with mode="model"
+    use_openai = (mode != "model") and OPENAI_API_KEY
+    try:
+        geo = exif_geo(image_data)
+        if geo is not None:
+            return await _record_prediction(geo, filename, db_pool, False)
+        geo, logged = await _model_geo(image_data, filename, content_type, use_openai, db_pool, read_pool)
+        if use_openai:
+            geo = await asyncio.to_thread(refine_with_openai, geo, image_data, content_type)
+        return await _record_prediction(geo, filename, db_pool, logged)
+    except Exception as e:
+        raise prediction_error(e)
@@ -0,0 +1,137 @@
+"""Mirror a sample of /predict requests to a candidate model.
+
+With ``SHADOW_SAMPLE_RATE`` above zero, that share of the requests that run
+the prediction pipeline is sent once more, after the response went out, to
+a candidate inference backend (``SHADOW_BACKEND``, ``SHADOW_URL``, ...). The
+candidate's embedding is searched against the gallery like the primary's,
+and the distance between the two predicted locations is recorded, next to
+the candidate's inference latency. Nothing the candidate returns reaches
+clients.
+
+The candidate must produce embeddings the gallery can be searched with,
+i.e. the same dimension and embedding space (see
+``scripts/model_rollout.py`` for the checks a rollout makes).
+
+Shadow calls never queue behind each other or take threads from the
+primary path. At most ``SHADOW_MAX_CONCURRENCY`` run at once, each on a
+thread of the mirror's own pool. A sampled request that finds them all
+busy is dropped. A call that times out keeps its slot until the candidate
+answers, so a slow candidate cannot pile up work.
+"""
+
+import asyncio
+import math
+import os
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, Optional
+
+from api.inference import InferenceClient, create_inference_client
+from api.metrics import SHADOW_DISTANCE, SHADOW_LATENCY, SHADOW_REQUESTS
+from api.repositories.match import nearest
+
+SHADOW_SAMPLE_RATE = float(os.getenv('SHADOW_SAMPLE_RATE', '0'))
+SHADOW_MAX_CONCURRENCY = int(os.getenv('SHADOW_MAX_CONCURRENCY', '2'))
+SHADOW_TIMEOUT = float(os.getenv('SHADOW_TIMEOUT', '10'))
+SHADOW_BACKEND = os.getenv('SHADOW_BACKEND', 'http')
+SHADOW_URL = os.getenv('SHADOW_URL')
+SHADOW_GRPC_TARGET = os.getenv('SHADOW_GRPC_TARGET')
+SHADOW_MODEL = os.getenv('SHADOW_MODEL', 'where')
+SHADOW_MODEL_VERSION = os.getenv('SHADOW_MODEL_VERSION')
+SHADOW_MODEL_PATH = os.getenv('SHADOW_MODEL_PATH')
+
+EARTH_RADIUS_KM = 6371.0
+
+
+def distance_km(lat1: float, lon1: float, lat2: float, lon2: float) -> float:
+    """Great-circle distance between two points."""
+    phi1, phi2 = math.radians(lat1), math.radians(lat2)
+    dphi = phi2 - phi1
+    dlambda = math.radians(lon2 - lon1)
+    a = math.sin(dphi / 2) ** 2 + math.cos(phi1) * math.cos(phi2) * math.sin(dlambda / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * math.asin(min(1.0, math.sqrt(a)))
+
+
+class ShadowMirror:
+    """Send ``sample_rate`` of the predictions to ``client`` as well and compare."""
+
+    def __init__(self, client: Optional[InferenceClient], sample_rate: float = SHADOW_SAMPLE_RATE,
+                 max_concurrency: int = SHADOW_MAX_CONCURRENCY, timeout: float = SHADOW_TIMEOUT):
+        self.client = client
+        self.sample_rate = sample_rate if client is not None else 0.0
+        self.max_concurrency = max(1, max_concurrency)
+        self.timeout = timeout
+        self._slots = threading.BoundedSemaphore(self.max_concurrency)
+        self._executor: Optional[ThreadPoolExecutor] = None
+
+    @classmethod
+    def from_env(cls, default_url: str, default_grpc_target: str) -> "ShadowMirror":
+        """The mirror configured by the ``SHADOW_*`` settings; off unless sampled."""
+        if SHADOW_SAMPLE_RATE <= 0:
+            return cls(None)
+        client = create_inference_client(
+            SHADOW_BACKEND, SHADOW_URL or default_url, SHADOW_GRPC_TARGET or default_grpc_target,
+            model=SHADOW_MODEL, timeout=SHADOW_TIMEOUT, model_path=SHADOW_MODEL_PATH, workers=1,
+        )
+        if SHADOW_MODEL_VERSION:
+            client = client.with_version(SHADOW_MODEL_VERSION)
+        return cls(client)
+
+    @property
+    def enabled(self) -> bool:
+        return self.sample_rate > 0
+
+    def sampled(self) -> bool:
+        return self.enabled and random.random() < self.sample_rate
+
+    def _release(self, _future: Any = None) -> None:
+        self._slots.release()
+
+    async def run(self, image_data: bytes, filename: Optional[str], content_type: Optional[str],
+                  primary: Dict[str, Any], pool: Any) -> None:
+        """Predict with the candidate and record how far it lands from ``primary``.
+
+        ``primary`` is the ``prediction`` of the response. Never raises.
+        """
+        if not self._slots.acquire(blocking=False):
+            SHADOW_REQUESTS.labels("dropped").inc()
+            return
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(self.max_concurrency, thread_name_prefix="shadow")
+        released_later = False
+        try:
+            start = time.perf_counter()
+            call = self._executor.submit(self.client.embed, image_data, filename, content_type)
+            try:
+                embedding = await asyncio.wait_for(asyncio.wrap_future(call), self.timeout)
+            except asyncio.TimeoutError:
+                # The thread cannot be stopped; keep the slot until it is free.
+                call.add_done_callback(self._release)
+                released_later = True
+                SHADOW_REQUESTS.labels("timeout").inc()
+                return
+            SHADOW_LATENCY.observe(time.perf_counter() - start)
+
+            row = await asyncio.wait_for(nearest(embedding.vector, pool=pool), self.timeout)
+            if row is None:
+                SHADOW_REQUESTS.labels("no_match").inc()
+                return
+            SHADOW_DISTANCE.labels(primary.get("source", "model")).observe(
+                distance_km(primary["lat"], primary["lon"], row["lat"], row["lon"]))
+            SHADOW_REQUESTS.labels("compared").inc()
+        except asyncio.TimeoutError:
+            SHADOW_REQUESTS.labels("timeout").inc()
+        except Exception as e:
+            SHADOW_REQUESTS.labels("error").inc()
+            print(f"Shadow prediction failed: {e}")
+        finally:
+            if not released_later:
+                self._release()
+
+    def close(self) -> None:
+        if self._executor is not None:
+            self._executor.shutdown(wait=False)
+        if self.client is not None:
+            self.client.close()
@@ -20,7 +20,7 @@ def test_definition_of_done():
        - geo.bias_warning (if any)
        - geo.source
     4. ✅ photos.py contains insert_prediction function that executes:
-       INSERT INTO photos (lat, lon, score, bias_warning, source) VALUES ($1, $2, $3, $4, $5)
+       INSERT INTO whereisthisplace.photos (lat, lon, score, bias_warning, source) VALUES ($1, $2, $3, $4, $5)
     5. ✅ Migration 202406_add_prediction_columns.py adds the required columns
     
     This ensures that every successful POST /predict will insert 1 row into photos table,
@@ -40,7 +40,7 @@ def test_definition_of_done():
     # 2. insert_prediction function exists and has correct SQL
     with open('repositories/photos.py', 'r') as f:
         photos_code = f.read()
-        assert 'INSERT INTO photos' in photos_code
+        assert 'INSERT INTO whereisthisplace.photos' in photos_code
         assert 'lat, lon, score, bias_warning, source' in photos_code
         print("✅ photos.py has correct INSERT statement")
     
@@ -1,9 +1,7 @@
-import os
-import re
 import sys
 from pathlib import Path
 
-from fastapi import FastAPI, Request
+from fastapi import FastAPI, File, Request, UploadFile
 from fastapi.testclient import TestClient
 
 API_ROOT = Path(__file__).resolve().parents[1]
@@ -11,23 +9,48 @@ PROJECT_ROOT = API_ROOT.parent
 sys.path.insert(0, str(PROJECT_ROOT))
 sys.path.insert(1, str(API_ROOT))
 
-from api.middleware import EphemeralUploadMiddleware
+from api.middleware import EphemeralUploadMiddleware, ServerTimingMiddleware
 
 app = FastAPI()
-app.add_middleware(EphemeralUploadMiddleware)
+app.add_middleware(EphemeralUploadMiddleware, paths=('/upload',))
+app.add_middleware(ServerTimingMiddleware, sample_rate=1.0)
+
+uploads = []
 
 @app.post('/upload')
 async def upload(request: Request):
+    data = await request.body()
+    return {'size': len(data), 'body': data[:3].decode()}
+
+@app.post('/upload/photo')
+async def upload_photo(photo: UploadFile = File(...)):
+    uploads.append(photo)
+    data = await photo.read()
+    return {'size': len(data)}
+
+@app.post('/echo')
+async def echo(request: Request):
     data = await request.body()
     return {'size': len(data)}
 
 client = TestClient(app)
 
-def test_upload_removed_and_logged(capsys):
-    response = client.post('/upload', data=b'dummy')
+
+def test_body_is_passed_through_and_timed():
+    body = b'abc' + b'x' * 200_000
+    response = client.post('/upload', content=body)
     assert response.status_code == 200
-    logs = capsys.readouterr().out
-    match = re.search(r"Saved upload to (.+)", logs)
-    assert match is not None
-    path = match.group(1).strip()
-    assert not os.path.exists(path)
+    assert response.json() == {'size': len(body), 'body': 'abc'}
+    assert 'upload;dur=' in response.headers['server-timing']
+
+
+def test_upload_files_are_closed_after_the_response():
+    response = client.post('/upload/photo', files={'photo': ('a.jpg', b'y' * 2_000_000, 'image/jpeg')})
+    assert response.json() == {'size': 2_000_000}
+    assert uploads[-1].file.closed
+
+
+def test_other_paths_are_not_timed():
+    response = client.post('/echo', content=b'dummy')
+    assert response.json() == {'size': 5}
+    assert 'upload;dur=' not in response.headers['server-timing']
@@ -1,7 +1,8 @@
+import asyncio
 import sys
 from pathlib import Path
 
-from fastapi import FastAPI
+from fastapi import FastAPI, HTTPException, Request
 from fastapi.testclient import TestClient
 
 API_ROOT = Path(__file__).resolve().parents[1]
@@ -10,6 +11,7 @@ sys.path.insert(0, str(PROJECT_ROOT))
 sys.path.insert(1, str(API_ROOT))
 
 from api.middleware import RateLimitMiddleware
+from api.middleware.ratelimit import RateLimitSync, TokenBucketStore
 
 app = FastAPI()
 app.add_middleware(RateLimitMiddleware)
@@ -26,3 +28,189 @@ def test_rate_limit_exceeded():
         assert resp.status_code == 200
     resp = client.get('/limited')
     assert resp.status_code == 429
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_token_bucket_refills_continuously():
+    clock = FakeClock()
+    store = TokenBucketStore(capacity=2, refill_per_second=0.5, clock=clock)
+    assert store.consume('a') and store.consume('a')
+    assert not store.consume('a')
+    assert store.retry_after('a') == 2.0
+    clock.now = 1.0
+    assert store.tokens('a') == 0.5
+    assert not store.consume('a')
+    clock.now = 2.0
+    assert store.consume('a')
+
+
+def test_refilled_bucket_allows_exactly_capacity():
+    clock = FakeClock()
+    store = TokenBucketStore(capacity=3, refill_per_second=1.0, clock=clock)
+    assert [store.consume('a') for _ in range(4)] == [True, True, True, False]
+    clock.now = 10.0
+    assert [store.consume('a') for _ in range(4)] == [True, True, True, False]
+    assert store.tokens('a') == 0
+
+
+def test_token_bucket_store_stays_bounded():
+    clock = FakeClock()
+    store = TokenBucketStore(capacity=5, refill_per_second=0.0, max_keys=100, clock=clock)
+    for i in range(10_000):
+        store.consume(f'10.0.{i // 256}.{i % 256}')
+    assert len(store) == 100
+    # The most recent clients are kept; the oldest were evicted.
+    assert store.tokens('10.0.39.15') == 4
+    assert store.tokens('10.0.0.0') == 5
+
+
+def test_full_buckets_are_pruned():
+    clock = FakeClock()
+    store = TokenBucketStore(capacity=1, refill_per_second=1.0, clock=clock)
+    for i in range(50):
+        store.consume(str(i))
+    clock.now = 10.0
+    for i in range(50, 100):
+        store.consume(str(i))
+    assert len(store) <= 51
+
+
+class FakePool:
+    """Stands in for the rate_limits table: keeps per-IP token buckets in memory."""
+
+    def __init__(self, tokens=None, clock=None):
+        self.tokens = dict(tokens or {})
+        self.clock = clock or FakeClock()
+        self.updated = {}
+        self.calls = []
+
+    async def fetch(self, query, ips, counts, limit, period):
+        self.calls.append((list(ips), list(counts)))
+        now = self.clock()
+        for ip, n in zip(ips, counts):
+            tokens = self.tokens.get(ip, limit)
+            if ip in self.updated:
+                tokens = min(limit, tokens + (now - self.updated[ip]) * limit / period)
+            self.tokens[ip] = tokens - n
+            self.updated[ip] = now
+        return [{'ip': ip, 'tokens': self.tokens[ip]} for ip in ips]
+
+
+def test_sync_batches_counts_and_applies_cluster_tokens():
+    store = TokenBucketStore(capacity=10, refill_per_second=0.0)
+    sync = RateLimitSync(store, limit=10, period=3600)
+    # Another worker already used 6 of this client's 10 requests.
+    pool = FakePool({'10.0.0.1': 4})
+    for _ in range(2):
+        assert store.consume('10.0.0.1')
+        sync.record('10.0.0.1')
+    store.consume('unknown')
+    sync.record('unknown')
+
+    asyncio.run(sync.flush(pool))
+
+    assert pool.calls == [(['10.0.0.1'], [2])]
+    assert sync.pending == {}
+    assert store.tokens('10.0.0.1') == 2
+    asyncio.run(sync.flush(pool))
+    assert len(pool.calls) == 1
+
+
+def test_cluster_bucket_refills_while_sync_is_on():
+    clock = FakeClock()
+    pool = FakePool(clock=clock)
+    workers = [RateLimitSync(TokenBucketStore(2, 0.5, clock=clock), limit=2, period=4) for _ in range(2)]
+
+    def admit(sync):
+        if not sync.store.consume('10.0.0.1'):
+            return False
+        sync.record('10.0.0.1')
+        return True
+
+    a, b = workers
+    assert admit(a) and admit(a) and not admit(a)
+    asyncio.run(a.flush(pool))
+    # One token refills every 2 s, also with the cluster bucket in the loop.
+    clock.now = 2.0
+    assert admit(a) and not admit(a)
+    asyncio.run(a.flush(pool))
+    clock.now = 4.0
+    assert admit(a)
+    asyncio.run(a.flush(pool))
+    assert pool.tokens['10.0.0.1'] == 0
+
+    # A worker that had not seen the client overshoots by its local burst;
+    # the cluster bucket owes it and both workers wait it out.
+    assert admit(b) and admit(b)
+    asyncio.run(b.flush(pool))
+    assert pool.tokens['10.0.0.1'] == -2
+    clock.now = 8.0
+    assert not admit(b)
+    clock.now = 10.0
+    assert admit(b)
+
+
+def test_sync_keeps_counts_when_the_database_fails():
+    class BrokenPool:
+        async def fetch(self, *args):
+            raise ConnectionError('down')
+
+    store = TokenBucketStore(capacity=10, refill_per_second=0.0)
+    sync = RateLimitSync(store, limit=10, period=3600)
+    sync.record('10.0.0.1')
+    try:
+        asyncio.run(sync.flush(BrokenPool()))
+    except ConnectionError:
+        pass
+    assert sync.pending == {'10.0.0.1': 1}
+
+
+batch_app = FastAPI()
+batch_app.add_middleware(RateLimitMiddleware, limit=5, period=3600)
+
+
+@batch_app.post('/batch')
+async def batch(request: Request, images: int):
+    retry_after = request.state.rate_limit_charge(images - 1)
+    if retry_after is not None:
+        raise HTTPException(status_code=429, headers={'Retry-After': str(retry_after)})
+    return {'ok': True}
+
+
+def test_routes_can_charge_more_than_one_token():
+    batch_client = TestClient(batch_app)
+    assert batch_client.post('/batch?images=4').status_code == 200
+    rejected = batch_client.post('/batch?images=2')
+    assert rejected.status_code == 429
+    assert int(rejected.headers['retry-after']) >= 720
+    # The admission token of the rejected request was spent; the extra one was not.
+    assert batch_client.post('/batch?images=1').status_code == 429
+
+
+polled_app = FastAPI()
+polled_app.add_middleware(RateLimitMiddleware, limit=1, period=3600, exempt_prefixes=('/jobs/',))
+
+
+@polled_app.post('/jobs')
+async def submit_job():
+    return {'job_id': 'a'}
+
+
+@polled_app.get('/jobs/{job_id}')
+async def poll_job(job_id: str):
+    return {'job_id': job_id}
+
+
+def test_exempt_prefixes_are_not_charged():
+    polled_client = TestClient(polled_app)
+    assert polled_client.post('/jobs').status_code == 200
+    for _ in range(5):
+        assert polled_client.get('/jobs/a').status_code == 200
+    assert polled_client.post('/jobs').status_code == 429
@@ -0,0 +1,67 @@
+import sys
+from pathlib import Path
+
+from fastapi import FastAPI, Request
+from fastapi.testclient import TestClient
+
+API_ROOT = Path(__file__).resolve().parents[1]
+PROJECT_ROOT = API_ROOT.parent
+sys.path.insert(0, str(PROJECT_ROOT))
+sys.path.insert(1, str(API_ROOT))
+
+from api.middleware import EphemeralUploadMiddleware, UploadAdmissionMiddleware
+from api.middleware.admission import PNG_MAGIC, sniff_multipart
+
+JPEG = b"\xff\xd8\xff\xe0" + b"\x00" * 100
+
+app = FastAPI()
+app.add_middleware(EphemeralUploadMiddleware, paths=('/upload',))
+app.add_middleware(UploadAdmissionMiddleware, paths=('/upload',), max_bytes=1000)
+
+@app.post('/upload')
+async def upload(request: Request):
+    data = await request.body()
+    return {'size': len(data)}
+
+client = TestClient(app)
+
+
+def multipart(name: str, data: bytes, boundary: bytes = b'xyz') -> bytes:
+    return (
+        b'--' + boundary + b'\r\nContent-Disposition: form-data; name="mode"\r\n\r\nmodel\r\n'
+        + b'--' + boundary + b'\r\nContent-Disposition: form-data; name="photo"; filename="' + name.encode()
+        + b'"\r\nContent-Type: image/jpeg\r\n\r\n' + data + b'\r\n--' + boundary + b'--\r\n'
+    )
+
+
+def test_sniff_multipart_finds_first_file_part():
+    assert sniff_multipart(multipart('a.jpg', JPEG), b'xyz') is True
+    assert sniff_multipart(multipart('a.png', PNG_MAGIC + b'rest'), b'xyz') is True
+    assert sniff_multipart(multipart('a.jpg', b'<html>not an image</html>'), b'xyz') is False
+    # Not enough of the body yet to tell.
+    assert sniff_multipart(multipart('a.jpg', JPEG)[:60], b'xyz') is None
+
+
+def test_image_upload_is_admitted():
+    response = client.post('/upload', files={'photo': ('a.jpg', JPEG, 'image/jpeg')})
+    assert response.status_code == 200
+
+
+def test_non_image_upload_is_rejected():
+    response = client.post('/upload', files={'photo': ('a.jpg', b'GIF89a' + b'\x00' * 50, 'image/jpeg')})
+    assert response.status_code == 415
+
+
+def test_declared_oversized_upload_is_rejected():
+    response = client.post('/upload', files={'photo': ('a.jpg', JPEG * 20, 'image/jpeg')})
+    assert response.status_code == 413
+
+
+def test_streamed_oversized_upload_is_cut_off():
+    def chunks():
+        yield JPEG
+        for _ in range(20):
+            yield b'\x00' * 100
+
+    response = client.post('/upload', content=chunks(), headers={'Content-Type': 'image/jpeg'})
+    assert response.status_code == 413
@@ -0,0 +1,131 @@
+"""Low-overhead per-stage latency recording.
+
+``ServerTimingMiddleware`` decides per request whether to sample it and, if
+so, installs a ``StageTimings`` recorder in a context variable. Code on the
+hot path wraps each stage in ``stage("name")``. Every stage feeds the
+stage-latency histogram in ``api.metrics``. Requests that are not sampled
+skip the per-request recorder.
+"""
+
+import functools
+import inspect
+import time
+from contextvars import ContextVar
+from typing import Dict, Optional
+
+from api.metrics import observe_stage
+
+_current: ContextVar[Optional["StageTimings"]] = ContextVar("stage_timings", default=None)
+
+
+class StageTimings:
+    """Durations of the stages of a single request, in seconds."""
+
+    __slots__ = ("started", "checkpoint", "stages")
+
+    def __init__(self) -> None:
+        self.started = time.perf_counter()
+        self.checkpoint = self.started
+        self.stages: Dict[str, float] = {}
+
+    def record(self, name: str, duration: float) -> None:
+        # A stage that runs more than once (e.g. retries) accumulates.
+        self.stages[name] = self.stages.get(name, 0.0) + duration
+
+    def lap(self, name: str) -> None:
+        """Record the time since the last checkpoint as ``name``."""
+        now = time.perf_counter()
+        self.record(name, now - self.checkpoint)
+        self.checkpoint = now
+
+    def total(self) -> float:
+        return time.perf_counter() - self.started
+
+    def server_timing(self, total: float) -> str:
+        """Format as a ``Server-Timing`` header value (milliseconds)."""
+        parts = [f"{name};dur={duration * 1000:.2f}" for name, duration in self.stages.items()]
+        parts.append(f"total;dur={total * 1000:.2f}")
+        return ", ".join(parts)
+
+
+def current() -> Optional[StageTimings]:
+    return _current.get()
+
+
+def begin() -> tuple:
+    """Install a fresh recorder for the current context; returns (timings, token)."""
+    timings = StageTimings()
+    return timings, _current.set(timings)
+
+
+def end(token) -> None:
+    _current.reset(token)
+
+
+def checkpoint() -> None:
+    """Mark "now" as the start of the next ``lap``."""
+    timings = _current.get()
+    if timings is not None:
+        timings.checkpoint = time.perf_counter()
+
+
+def lap(name: str) -> None:
+    timings = _current.get()
+    if timings is not None:
+        timings.lap(name)
+
+
+def record(name: str, duration: float) -> None:
+    """Record a stage measured by the caller, e.g. one spread over several awaits."""
+    observe_stage(name, duration)
+    timings = _current.get()
+    if timings is not None:
+        timings.record(name, duration)
+
+
+class stage:
+    """Context manager timing one named stage of the current request.
+
+    Usage::
+
+        with stage("torchserve"):
+            response = requests.post(...)
+    """
+
+    __slots__ = ("name", "start")
+
+    def __init__(self, name: str) -> None:
+        self.name = name
+
+    def __enter__(self) -> "stage":
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        duration = time.perf_counter() - self.start
+        observe_stage(self.name, duration)
+        timings = _current.get()
+        if timings is not None:
+            timings.record(self.name, duration)
+
+
+def timed(name: str):
+    """Decorator form of ``stage`` for sync and async functions."""
+
+    def decorator(func):
+        if inspect.iscoroutinefunction(func):
+            @functools.wraps(func)
+            async def async_wrapper(*args, **kwargs):
+                with stage(name):
+                    return await func(*args, **kwargs)
+
+            return async_wrapper
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with stage(name):
+                return func(*args, **kwargs)
+
+        return wrapper
+
+    return decorator
@@ -0,0 +1,178 @@
+"""GPS position from the EXIF block of a JPEG.
+
+Only the segment headers before the image data are read: each marker
+segment is skipped by its length until the APP1 ``Exif`` segment, which is
+the only one read in full. The image itself is never decoded.
+"""
+
+import io
+import struct
+from typing import BinaryIO, Dict, Optional
+
+# Positions whose reported horizontal error is larger are not trusted (metres).
+EXIF_MAX_ERROR_M = 1000.0
+
+_SOS = 0xDA
+_EOI = 0xD9
+_APP1 = 0xE1
+_EXIF_HEADER = b"Exif\x00\x00"
+# Markers without a length field.
+_STANDALONE = {0x01} | set(range(0xD0, 0xD8))
+
+_GPS_IFD = 0x8825
+_GPS_STATUS = 0x09
+_GPS_LATITUDE_REF = 0x01
+_GPS_LATITUDE = 0x02
+_GPS_LONGITUDE_REF = 0x03
+_GPS_LONGITUDE = 0x04
+_GPS_H_POSITIONING_ERROR = 0x1F
+
+# Bytes per value of the TIFF field types that can hold GPS data.
+_TYPE_SIZES = {1: 1, 2: 1, 3: 2, 4: 4, 5: 8, 7: 1, 9: 4, 10: 8}
+_MAX_ENTRIES = 512
+
+
+def read_app1(stream: BinaryIO) -> Optional[bytes]:
+    """The payload of the EXIF APP1 segment, or ``None`` if there is none."""
+    if stream.read(2) != b"\xff\xd8":
+        return None
+    while True:
+        header = stream.read(2)
+        if len(header) < 2 or header[0] != 0xFF:
+            return None
+        marker = header[1]
+        if marker == 0xFF:
+            # Fill byte before the marker.
+            stream.seek(-1, io.SEEK_CUR)
+            continue
+        if marker in _STANDALONE:
+            continue
+        if marker in (_SOS, _EOI):
+            return None
+        size = stream.read(2)
+        if len(size) < 2:
+            return None
+        length = struct.unpack(">H", size)[0] - 2
+        if length < 0:
+            return None
+        if marker == _APP1:
+            payload = stream.read(length)
+            if payload.startswith(_EXIF_HEADER):
+                return payload[len(_EXIF_HEADER):]
+            # XMP is also stored in APP1; keep looking.
+            continue
+        stream.seek(length, io.SEEK_CUR)
+
+
+class _Tiff:
+    def __init__(self, data: bytes):
+        if data[:2] == b"II":
+            self.order = "<"
+        elif data[:2] == b"MM":
+            self.order = ">"
+        else:
+            raise ValueError("not a TIFF header")
+        self.data = data
+        if self.unpack("H", 2) != 42:
+            raise ValueError("not a TIFF header")
+
+    def unpack(self, fmt: str, offset: int):
+        return struct.unpack_from(self.order + fmt, self.data, offset)[0]
+
+    def ifd(self, offset: int) -> Dict[int, tuple]:
+        """Tag -> ``(type, count, value offset)`` of the IFD at ``offset``."""
+        count = self.unpack("H", offset)
+        if count > _MAX_ENTRIES:
+            raise ValueError("implausible IFD")
+        entries = {}
+        for i in range(count):
+            entry = offset + 2 + i * 12
+            tag, kind, n = struct.unpack_from(self.order + "HHI", self.data, entry)
+            size = _TYPE_SIZES.get(kind)
+            if size is None:
+                continue
+            value = entry + 8
+            if size * n > 4:
+                value = self.unpack("I", entry + 8)
+                if value + size * n > len(self.data):
+                    raise ValueError("value outside the EXIF block")
+            entries[tag] = (kind, n, value)
+        return entries
+
+    def ascii(self, entry: tuple) -> str:
+        _, n, value = entry
+        return self.data[value:value + n].split(b"\x00", 1)[0].decode("ascii", "replace")
+
+    def rationals(self, entry: tuple) -> list:
+        kind, n, value = entry
+        if kind not in (5, 10):
+            raise ValueError("not a rational")
+        fmt = "II" if kind == 5 else "ii"
+        values = []
+        for i in range(n):
+            numerator, denominator = struct.unpack_from(self.order + fmt, self.data, value + i * 8)
+            if denominator == 0:
+                raise ValueError("zero denominator")
+            values.append(numerator / denominator)
+        return values
+
+
+def _degrees(tiff: _Tiff, entry: tuple, ref: str, positive: str, negative: str) -> float:
+    parts = tiff.rationals(entry)
+    if len(parts) != 3 or not (0 <= parts[1] < 60 and 0 <= parts[2] < 60) or ref not in (positive, negative):
+        raise ValueError("malformed coordinate")
+    degrees = parts[0] + parts[1] / 60 + parts[2] / 3600
+    return -degrees if ref == negative else degrees
+
+
+def parse_gps(exif: bytes) -> Optional[Dict[str, object]]:
+    """GPS fields of an EXIF block: ``lat``, ``lon`` and, if recorded, ``error_m`` and ``status``."""
+    try:
+        tiff = _Tiff(exif)
+        ifd0 = tiff.ifd(tiff.unpack("I", 4))
+        if _GPS_IFD not in ifd0:
+            return None
+        gps = tiff.ifd(tiff.unpack("I", ifd0[_GPS_IFD][2]))
+        if _GPS_LATITUDE not in gps or _GPS_LONGITUDE not in gps:
+            return None
+        result: Dict[str, object] = {
+            "lat": _degrees(tiff, gps[_GPS_LATITUDE], tiff.ascii(gps.get(_GPS_LATITUDE_REF, (2, 0, 0))), "N", "S"),
+            "lon": _degrees(tiff, gps[_GPS_LONGITUDE], tiff.ascii(gps.get(_GPS_LONGITUDE_REF, (2, 0, 0))), "E", "W"),
+        }
+        if _GPS_H_POSITIONING_ERROR in gps:
+            # Optional: a malformed value is left out instead of losing the position.
+            try:
+                result["error_m"] = tiff.rationals(gps[_GPS_H_POSITIONING_ERROR])[0]
+            except (ValueError, IndexError, struct.error):
+                pass
+        if _GPS_STATUS in gps:
+            result["status"] = tiff.ascii(gps[_GPS_STATUS])
+        return result
+    except (ValueError, IndexError, struct.error):
+        return None
+
+
+def read_gps(image_data: bytes) -> Optional[Dict[str, object]]:
+    """GPS fields of a JPEG's EXIF block, or ``None`` if it has none or they are malformed."""
+    exif = read_app1(io.BytesIO(image_data))
+    return parse_gps(exif) if exif else None
+
+
+def trustworthy(gps: Optional[Dict[str, object]], max_error_m: float = EXIF_MAX_ERROR_M) -> bool:
+    """Whether ``gps`` is a real fix that can be answered with.
+
+    Void fixes, positions outside the valid range, 0,0 (the value of
+    cameras without a fix) and positions less precise than ``max_error_m``
+    are not.
+    """
+    if not gps:
+        return False
+    lat, lon = gps.get("lat"), gps.get("lon")
+    if lat is None or lon is None:
+        return False
+    if gps.get("status") == "V":
+        return False
+    if not (-90 <= lat <= 90 and -180 <= lon <= 180) or (lat == 0 and lon == 0):
+        return False
+    error = gps.get("error_m")
+    return error is None or error <= max_error_m
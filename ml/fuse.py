@@ -2,6 +2,11 @@
 
 from typing import List, Tuple, Optional
 
+from ml.exif import trustworthy
+
+# Confidence of a location taken from the photo's own GPS fix.
+EXIF_CONFIDENCE = 1.0
+
 
 def fuse(
     scene: List[Tuple[str, float]],
@@ -10,17 +15,21 @@ def fuse(
 ) -> Tuple[Tuple[float, float], float]:
     """Combine different signals to determine the final location.
 
-    Currently this stub simply returns the first retrieval result and its
-    confidence score.
+    A trustworthy GPS fix in ``exif`` is the answer. Otherwise this stub
+    simply returns the first retrieval result and its confidence score.
 
     Args:
         scene: Scene classifier output (unused).
         retrieval: List of retrieval results as ``(lat, lon, score)`` tuples.
-        exif: Optional EXIF metadata (unused).
+            May be empty when ``exif`` holds a trustworthy fix.
+        exif: Optional GPS fields as returned by ``ml.exif.read_gps``.
 
     Returns:
         A tuple ``((lat, lon), confidence)``.
     """
+    if trustworthy(exif):
+        return (exif["lat"], exif["lon"]), EXIF_CONFIDENCE
+
     if not retrieval:
         raise ValueError("retrieval results cannot be empty")
 
@@ -0,0 +1,86 @@
+#!/usr/bin/env python3
+"""Compare the per-image cost of TorchServe's HTTP and gRPC inference APIs
+and of the in-process local backend.
+
+Sends the same image repeatedly through each backend, one at a time and
+with concurrent callers, and reports latency percentiles and throughput.
+
+Usage:
+    python scripts/benchmark_inference.py --image eiffel.jpg --requests 200 \
+        --backends http,grpc,local --model-path where.mar --concurrency 1,8
+"""
+import argparse
+import statistics
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Dict, List
+
+ROOT = Path(__file__).resolve().parents[1]
+if str(ROOT) not in sys.path:
+    sys.path.append(str(ROOT))
+
+import requests
+
+from api.inference import GRPCInferenceClient, HTTPInferenceClient, InferenceClient, LocalInferenceClient
+
+
+def make_client(backend: str, args) -> InferenceClient:
+    if backend == "http":
+        return HTTPInferenceClient(args.model_url, session=requests.Session() if args.keep_alive else None)
+    if backend == "grpc":
+        return GRPCInferenceClient(args.grpc_target)
+    if backend == "local":
+        return LocalInferenceClient(args.model_path, workers=args.local_workers, threads=args.local_threads)
+    raise ValueError(f"Unknown backend {backend!r}")
+
+
+def run(client: InferenceClient, image: bytes, count: int, concurrency: int) -> Dict[str, float]:
+    def timed_call(_):
+        start = time.perf_counter()
+        client.embed(image, "benchmark.jpg", "image/jpeg")
+        return time.perf_counter() - start
+
+    client.embed(image, "benchmark.jpg", "image/jpeg")  # warm up connections
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        latencies: List[float] = sorted(pool.map(timed_call, range(count)))
+    elapsed = time.perf_counter() - start
+    return {
+        "p50_ms": statistics.median(latencies) * 1000,
+        "p95_ms": latencies[int(len(latencies) * 0.95) - 1] * 1000,
+        "per_image_ms": elapsed / count * 1000,
+        "images_per_s": count / elapsed,
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Benchmark TorchServe inference transports")
+    parser.add_argument("--image", type=Path, default=ROOT / "eiffel.jpg", help="Image to embed")
+    parser.add_argument("--requests", type=int, default=200, help="Images per run")
+    parser.add_argument("--backends", default="http,grpc", help="Comma-separated backends")
+    parser.add_argument("--concurrency", default="1,8", help="Comma-separated caller counts")
+    parser.add_argument("--model-url", default="http://localhost:8080", help="TorchServe HTTP inference URL")
+    parser.add_argument("--grpc-target", default="localhost:7070", help="TorchServe gRPC inference address")
+    parser.add_argument("--model-path", default="/model-store/where.mar", help="Model for the local backend")
+    parser.add_argument("--local-workers", type=int, default=2, help="Local inference processes")
+    parser.add_argument("--local-threads", type=int, default=1, help="Intra-op threads per local process")
+    parser.add_argument("--keep-alive", action="store_true", help="Reuse HTTP connections (requests.Session)")
+    args = parser.parse_args()
+
+    image = args.image.read_bytes()
+    print(f"{'backend':<8} {'callers':>7} {'p50 ms':>8} {'p95 ms':>8} {'ms/image':>9} {'images/s':>9}")
+    for backend in args.backends.split(","):
+        client = make_client(backend, args)
+        try:
+            for concurrency in (int(c) for c in args.concurrency.split(",")):
+                r = run(client, image, args.requests, concurrency)
+                print(f"{backend:<8} {concurrency:>7} {r['p50_ms']:>8.2f} {r['p95_ms']:>8.2f} "
+                      f"{r['per_image_ms']:>9.2f} {r['images_per_s']:>9.1f}")
+        finally:
+            client.close()
+
+
+if __name__ == "__main__":
+    main()
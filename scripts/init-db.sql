@@ -52,11 +52,24 @@ CREATE TABLE IF NOT EXISTS rate_limits (
     ip_address INET PRIMARY KEY,
     request_count INTEGER DEFAULT 0,
     window_start TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP,
-    last_request TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP
+    last_request TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP,
+    -- Tokens left in the client's bucket as of last_request
+    tokens DOUBLE PRECISION
 );
+ALTER TABLE rate_limits ADD COLUMN IF NOT EXISTS tokens DOUBLE PRECISION;
 
--- Create index for rate limit cleanup
+-- Create indexes for rate limit cleanup
 CREATE INDEX IF NOT EXISTS idx_rate_limits_window_start ON rate_limits (window_start);
+CREATE INDEX IF NOT EXISTS idx_rate_limits_last_request ON rate_limits (last_request);
+
+-- Model version rollouts: canary traffic share and the gallery's embedding version
+CREATE TABLE IF NOT EXISTS model_routing (
+    model VARCHAR(255) PRIMARY KEY,
+    gallery_version VARCHAR(255),
+    canary_version VARCHAR(255),
+    canary_weight DOUBLE PRECISION NOT NULL DEFAULT 0 CHECK (canary_weight >= 0 AND canary_weight <= 1),
+    updated_at TIMESTAMP WITH TIME ZONE NOT NULL DEFAULT CURRENT_TIMESTAMP
+);
 
 -- Create uploaded images tracking table (for ephemeral storage)
 CREATE TABLE IF NOT EXISTS uploaded_images (
@@ -3,37 +3,34 @@ import asyncio
 import csv
 import hashlib
 import os
+import sys
 from pathlib import Path
 from typing import Optional, Sequence
 
 import asyncpg
 import numpy as np
-import requests
 from pgvector.asyncpg import register_vector
 
+ROOT = Path(__file__).resolve().parents[1]
+if str(ROOT) not in sys.path:
+    sys.path.append(str(ROOT))
 
-async def _compute_embedding(image_path: Path, model_url: Optional[str] = None) -> Sequence[float]:
+from api.inference import InferenceClient, create_inference_client
+
+
+async def _compute_embedding(image_path: Path, client: Optional[InferenceClient] = None) -> Sequence[float]:
     """Return a 128-dim embedding for the given image.
 
-    If ``model_url`` is provided, the image is sent to TorchServe's HTTP
-    inference API and the returned embedding is used. Otherwise a deterministic
-    embedding derived from the file contents is returned.
+    If ``client`` is provided, the image is embedded by the model (TorchServe
+    or the local backend). Otherwise a deterministic stub embedding derived
+    from the file contents is returned, for tests without a model.
     """
     data = image_path.read_bytes()
-    if model_url:
-        try:
-            resp = requests.post(f"{model_url.rstrip('/')}/predictions/where", data=data, timeout=30)
-            resp.raise_for_status()
-            result = resp.json()
-            if isinstance(result, dict) and "embedding" in result:
-                return result["embedding"]
-            if isinstance(result, list):
-                return result
-            print(f"Warning: Unexpected response from model server for {image_path.name}, using fallback")
-        except Exception as e:
-            print(f"Warning: TorchServe error for {image_path.name}: {e}, using fallback embedding")
-
-    # Deterministic fallback embedding using SHA256 hash
+    if client is not None:
+        embedding = await asyncio.to_thread(client.embed, data, image_path.name, None)
+        return embedding.vector.tolist()
+
+    # Deterministic stub embedding using SHA256 hash
     digest = hashlib.sha256(data).digest()
     arr = np.frombuffer(digest * 8, dtype=np.uint8)[:128].astype("float32")
     return arr.tolist()
@@ -44,11 +41,16 @@ async def init_connection(conn):
     await conn.execute("SET search_path TO whereisthisplace, public;")
     await register_vector(conn)
 
-async def load_dataset(dataset_dir: Path, database_url: str, model_url: Optional[str] = None) -> int:
+async def load_dataset(dataset_dir: Path, database_url: str, model_url: Optional[str] = None,
+                       client: Optional[InferenceClient] = None) -> int:
     """Load all CSV files in ``dataset_dir`` into the database.
 
-    Returns the number of inserted rows.
+    Images are embedded with ``client``, or TorchServe at ``model_url`` if
+    only that is given. Images the model fails on are skipped rather than
+    stored with a stub embedding. Returns the number of inserted rows.
     """
+    if client is None and model_url:
+        client = create_inference_client("http", model_url, "")
     pool = await asyncpg.create_pool(dsn=database_url, init=init_connection)
     inserted = 0
     try:
@@ -64,7 +66,11 @@ async def load_dataset(dataset_dir: Path, database_url: str, model_url: Optional
                         
                     lat = float(row["lat"])
                     lon = float(row["lon"])
-                    embedding = await _compute_embedding(img_path, model_url)
+                    try:
+                        embedding = await _compute_embedding(img_path, client)
+                    except Exception as e:
+                        print(f"Warning: Model error for {img_path.name}: {e}, skipping...")
+                        continue
                     
                     # Convert embedding to numpy array and then to list for pgvector
                     if isinstance(embedding, list):
@@ -84,6 +90,8 @@ async def load_dataset(dataset_dir: Path, database_url: str, model_url: Optional
                         print(f"  Inserted {inserted} images...")
     finally:
         await pool.close()
+        if client is not None:
+            client.close()
     return inserted
 
 
@@ -95,9 +103,30 @@ def main(argv: Optional[Sequence[str]] = None) -> None:
         default=Path("datasets"),
         help="Directory containing CSV files and images",
     )
+    parser.add_argument(
+        "--inference-backend",
+        choices=["http", "grpc", "local"],
+        help="How to embed images. If omitted, --model-url selects http, else a stub embedding is used",
+    )
     parser.add_argument(
         "--model-url",
-        help="TorchServe inference URL. If omitted, use local embedding stub",
+        help="TorchServe inference URL",
+    )
+    parser.add_argument(
+        "--grpc-target",
+        default="localhost:7070",
+        help="TorchServe gRPC inference address (--inference-backend grpc)",
+    )
+    parser.add_argument(
+        "--model-path",
+        default=os.getenv("LOCAL_MODEL_PATH"),
+        help="Model archive or ONNX/TorchScript file (--inference-backend local)",
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=os.cpu_count() or 1,
+        help="Local inference processes (--inference-backend local)",
     )
     parser.add_argument(
         "--database-url",
@@ -109,7 +138,13 @@ def main(argv: Optional[Sequence[str]] = None) -> None:
     if not args.database_url:
         raise SystemExit("DATABASE_URL must be provided via --database-url or environment")
 
-    count = asyncio.run(load_dataset(args.dataset_dir, args.database_url, args.model_url))
+    client = None
+    if args.inference_backend:
+        client = create_inference_client(
+            args.inference_backend, args.model_url or "http://localhost:8080", args.grpc_target,
+            model_path=args.model_path, workers=args.workers,
+        )
+    count = asyncio.run(load_dataset(args.dataset_dir, args.database_url, args.model_url, client))
     print(f"Inserted {count} rows")
 
 
@@ -0,0 +1,270 @@
+#!/usr/bin/env python3
+"""Swap the TorchServe model version without a restart.
+
+``rollout`` registers the new version next to the serving one, with the
+same worker count and batching, and warms it with probe requests. Before
+any traffic reaches it, it checks that its embeddings fit the gallery:
+
+* the dimension must equal that of ``photos.vlad``;
+* its embedding version must equal the gallery's version stamp in
+  ``model_routing``. The version is the ``model_version`` the handler
+  reports, or ``--embedding-version`` for handlers that report none;
+* with ``--min-similarity``, the new and old embeddings of the probe image
+  must be at least that cosine-similar.
+
+It then raises the canary share in ``model_routing`` step by step. The API
+processes pick each step up within ``MODEL_ROUTING_INTERVAL``. During every
+step the new version's probe latency is compared with the old one's. At
+the end the new version becomes TorchServe's default, the canary is
+cleared, and the old version is unregistered after ``--drain-seconds``. Any
+failure sets the share back to zero and unregisters the new version.
+
+``stamp`` records the gallery's embedding version, e.g. after re-embedding
+the gallery with a new model.
+
+Usage:
+    python scripts/model_rollout.py stamp --embedding-version wpca128-v1
+    python scripts/model_rollout.py rollout --mar where-v2.mar --version 2.0 \
+        --steps 5,25,50,100 --step-seconds 60
+"""
+import argparse
+import asyncio
+import math
+import os
+import statistics
+import sys
+import time
+from pathlib import Path
+from typing import List, Optional, Sequence
+
+ROOT = Path(__file__).resolve().parents[1]
+if str(ROOT) not in sys.path:
+    sys.path.append(str(ROOT))
+
+import asyncpg
+import requests
+
+from api.embedding import Embedding
+from api.inference import HTTPInferenceClient, InferenceClient
+from api.inference.routing import MODEL_ROUTING_INTERVAL
+from api.repositories.model_routing import gallery_dimension, get_routing, set_canary, set_gallery_version
+
+
+# Probes per version and step; fewer make the p95 just the slowest outlier.
+MIN_PROBES = 20
+
+
+class RolloutError(Exception):
+    """The rollout was stopped; the message says why."""
+
+
+def cosine_similarity(a: Sequence[float], b: Sequence[float]) -> float:
+    dot = sum(x * y for x, y in zip(a, b))
+    norm = math.sqrt(sum(x * x for x in a)) * math.sqrt(sum(y * y for y in b))
+    return dot / norm if norm else 0.0
+
+
+def compatibility_problems(embedding: Embedding, gallery_dim: Optional[int], gallery_version: Optional[str],
+                           declared_version: Optional[str] = None, reference: Optional[Embedding] = None,
+                           min_similarity: Optional[float] = None) -> List[str]:
+    """Why the new model's ``embedding`` cannot be searched against the gallery, if it cannot."""
+    problems = []
+    dim = len(embedding.vector)
+    if gallery_dim is not None and dim != gallery_dim:
+        problems.append(f"embedding has {dim} dimensions, the gallery {gallery_dim}")
+    version = embedding.model_version or declared_version
+    if embedding.model_version and declared_version and embedding.model_version != declared_version:
+        problems.append(f"model reports embedding version {embedding.model_version!r}, "
+                        f"not the declared {declared_version!r}")
+    if gallery_version is None:
+        problems.append("the gallery has no version stamp; run the stamp command first")
+    elif version is None:
+        problems.append("the model reports no embedding version; pass --embedding-version")
+    elif version != gallery_version:
+        problems.append(f"embedding version {version!r} does not match the gallery's {gallery_version!r}")
+    if min_similarity is not None and reference is not None and not problems:
+        similarity = cosine_similarity(embedding.vector, reference.vector)
+        if similarity < min_similarity:
+            problems.append(f"cosine similarity to the current model is {similarity:.3f}, below {min_similarity}")
+    return problems
+
+
+def latency_regression(new: Sequence[float], old: Sequence[float], max_ratio: float,
+                       slack: float = 0.01) -> Optional[str]:
+    """A description of the regression if ``new``'s p95 exceeds ``max_ratio`` times ``old``'s."""
+    def p95(latencies):
+        ordered = sorted(latencies)
+        return ordered[max(0, math.ceil(len(ordered) * 0.95) - 1)]
+
+    new_p95, old_p95 = p95(new), p95(old)
+    if new_p95 > old_p95 * max_ratio + slack:
+        return f"p95 {new_p95 * 1000:.1f} ms against {old_p95 * 1000:.1f} ms for the current version"
+    return None
+
+
+class Management:
+    """The calls of TorchServe's management API a rollout needs."""
+
+    def __init__(self, url: str, model: str, timeout: float = 300.0):
+        self.url = url.rstrip("/")
+        self.model = model
+        self.timeout = timeout
+
+    def _check(self, response) -> "requests.Response":
+        if response.status_code not in (200, 201, 202):
+            raise RolloutError(f"TorchServe answered {response.status_code}: {response.text}")
+        return response
+
+    def describe(self, version: Optional[str] = None) -> dict:
+        path = f"{self.model}/{version}" if version else self.model
+        return self._check(requests.get(f"{self.url}/models/{path}", timeout=self.timeout)).json()[0]
+
+    def register(self, url: str, workers: int, batch_size: int, max_batch_delay: int) -> None:
+        self._check(requests.post(f"{self.url}/models", params={
+            "url": url,
+            "model_name": self.model,
+            "initial_workers": workers,
+            "batch_size": batch_size,
+            "max_batch_delay": max_batch_delay,
+            "synchronous": "true",
+        }, timeout=self.timeout))
+
+    def set_default(self, version: str) -> None:
+        self._check(requests.put(f"{self.url}/models/{self.model}/{version}/set-default", timeout=self.timeout))
+
+    def unregister(self, version: str) -> None:
+        self._check(requests.delete(f"{self.url}/models/{self.model}/{version}", timeout=self.timeout))
+
+
+def timed_embed(client: InferenceClient, image: bytes) -> float:
+    start = time.perf_counter()
+    client.embed(image, "rollout-probe.jpg", "image/jpeg")
+    return time.perf_counter() - start
+
+
+def compare_latency(new: InferenceClient, old: InferenceClient, image: bytes, seconds: float,
+                    max_ratio: float) -> None:
+    """Probe both versions alternately for ``seconds`` and fail on a latency regression."""
+    new_latencies: List[float] = []
+    old_latencies: List[float] = []
+    deadline = time.monotonic() + seconds
+    while time.monotonic() < deadline or len(new_latencies) < MIN_PROBES:
+        # Alternate which version goes first so neither always gets the warmer path.
+        if len(new_latencies) % 2:
+            old_latencies.append(timed_embed(old, image))
+            new_latencies.append(timed_embed(new, image))
+        else:
+            new_latencies.append(timed_embed(new, image))
+            old_latencies.append(timed_embed(old, image))
+        time.sleep(0.2)
+    regression = latency_regression(new_latencies, old_latencies, max_ratio)
+    if regression:
+        raise RolloutError(f"New version is slower: {regression}")
+    print(f"  p50 {statistics.median(new_latencies) * 1000:.1f} ms "
+          f"(current version {statistics.median(old_latencies) * 1000:.1f} ms)")
+
+
+async def rollout(args) -> None:
+    management = Management(args.management_url, args.model)
+    current = management.describe()
+    old_version = current["modelVersion"]
+    if old_version == args.version:
+        raise RolloutError(f"Version {args.version} is already the default")
+    workers = args.workers or max(1, len(current.get("workers", [])))
+
+    pool = await asyncpg.create_pool(dsn=args.database_url, min_size=1, max_size=2)
+    client = HTTPInferenceClient(args.model_url, model=args.model, session=requests.Session())
+    registered = False
+    try:
+        routing = await get_routing(pool, args.model) or {}
+        gallery_dim = await gallery_dimension(pool)
+        image = args.probe_image.read_bytes()
+
+        print(f"Registering {args.model} {args.version} next to {old_version} with {workers} workers")
+        management.register(args.mar, workers, current.get("batchSize", 1), current.get("maxBatchDelay", 100))
+        registered = True
+        new = client.with_version(args.version)
+        old = client.with_version(old_version)
+        for _ in range(args.warmup):
+            new.embed(image, "rollout-warmup.jpg", "image/jpeg")
+
+        problems = compatibility_problems(
+            new.embed(image, "rollout-probe.jpg", "image/jpeg"), gallery_dim, routing.get("gallery_version"),
+            args.embedding_version, old.embed(image, "rollout-probe.jpg", "image/jpeg"), args.min_similarity,
+        )
+        if problems:
+            raise RolloutError("Incompatible with the gallery: " + "; ".join(problems))
+
+        for percent in (float(p) for p in args.steps.split(",")):
+            print(f"Sending {percent:g}% of requests to {args.version}")
+            await set_canary(pool, args.model, args.version, percent / 100)
+            compare_latency(new, old, image, max(args.step_seconds, MODEL_ROUTING_INTERVAL), args.max_latency_ratio)
+
+        management.set_default(args.version)
+        await set_canary(pool, args.model, None, 0.0)
+        print(f"{args.version} is the default version")
+        if not args.keep_old:
+            # Let requests routed by the API's previous routing state finish.
+            await asyncio.sleep(args.drain_seconds)
+            management.unregister(old_version)
+            print(f"Unregistered {old_version}")
+    except Exception:
+        await set_canary(pool, args.model, None, 0.0)
+        if registered:
+            try:
+                management.unregister(args.version)
+            except Exception as e:
+                print(f"Could not unregister {args.version}: {e}")
+        raise
+    finally:
+        client.close()
+        await pool.close()
+
+
+async def stamp(args) -> None:
+    pool = await asyncpg.create_pool(dsn=args.database_url, min_size=1, max_size=1)
+    try:
+        await set_gallery_version(pool, args.model, args.embedding_version)
+    finally:
+        await pool.close()
+    print(f"Gallery of {args.model} stamped with embedding version {args.embedding_version}")
+
+
+def main(argv: Optional[Sequence[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description="Roll out a new TorchServe model version")
+    parser.add_argument("--database-url", default=os.getenv("DATABASE_URL"))
+    parser.add_argument("--model", default="where")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    stamp_parser = commands.add_parser("stamp", help="Record the gallery's embedding version")
+    stamp_parser.add_argument("--embedding-version", required=True)
+
+    rollout_parser = commands.add_parser("rollout", help="Register, check and shift traffic to a new version")
+    rollout_parser.add_argument("--mar", required=True, help="Archive name in the model store, or its URL")
+    rollout_parser.add_argument("--version", required=True, help="Model version in the archive's manifest")
+    rollout_parser.add_argument("--embedding-version", help="Embedding version, if the handler reports none")
+    rollout_parser.add_argument("--workers", type=int, help="Workers for the new version (default: as the current)")
+    rollout_parser.add_argument("--steps", default="5,25,50,100", help="Canary percentages")
+    rollout_parser.add_argument("--step-seconds", type=float, default=60.0)
+    rollout_parser.add_argument("--warmup", type=int, default=20, help="Warm-up requests before any traffic")
+    rollout_parser.add_argument("--min-similarity", type=float,
+                                help="Minimum cosine similarity of old and new probe embeddings")
+    rollout_parser.add_argument("--max-latency-ratio", type=float, default=1.5)
+    rollout_parser.add_argument("--drain-seconds", type=float, default=MODEL_ROUTING_INTERVAL * 2 + 30)
+    rollout_parser.add_argument("--keep-old", action="store_true", help="Leave the old version registered")
+    rollout_parser.add_argument("--probe-image", type=Path, default=ROOT / "eiffel.jpg")
+    rollout_parser.add_argument("--model-url", default=os.getenv("TORCHSERVE_URL", "http://localhost:8080"))
+    rollout_parser.add_argument("--management-url",
+                                default=os.getenv("TORCHSERVE_MANAGEMENT_URL", "http://localhost:8081"))
+
+    args = parser.parse_args(argv)
+    if not args.database_url:
+        raise SystemExit("DATABASE_URL must be provided via --database-url or environment")
+    try:
+        asyncio.run(stamp(args) if args.command == "stamp" else rollout(args))
+    except RolloutError as e:
+        raise SystemExit(f"Rollout stopped: {e}")
+
+
+if __name__ == "__main__":
+    main()
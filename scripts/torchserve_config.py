@@ -0,0 +1,267 @@
+#!/usr/bin/env python3
+"""Write a TorchServe config sized to the host.
+
+Reads the CPUs (affinity and cgroup quota), memory (cgroup limit or
+MemTotal) and NUMA nodes of the host, picks worker count, batch size, batch
+delay, job queue size and netty threads from a profile, and writes them on
+top of a base ``config.properties``:
+
+* ``latency``: no batching, few workers with several threads each;
+* ``balanced``: small batches with a short delay;
+* ``throughput``: one thread per worker, larger batches, longer delay.
+
+Per-worker thread counts (``OMP_NUM_THREADS``) are written to
+``<output>.env`` for the shell that starts TorchServe to source.
+
+With ``--probe-url`` it instead checks a running TorchServe: it sends the
+probe image one at a time and with enough concurrent callers to fill every
+worker's batches, and fails if there are errors, if concurrency does not
+raise throughput, or if it stays below ``--min-images-per-second``.
+
+Usage:
+    python scripts/torchserve_config.py --profile balanced \
+        --base config/config.properties --output /tmp/ts/config.properties
+    python scripts/torchserve_config.py --probe-url http://localhost:8080 \
+        --plan /tmp/ts/config.properties
+"""
+import argparse
+import json
+import os
+import sys
+import zipfile
+from dataclasses import asdict, dataclass
+from pathlib import Path
+from typing import Dict, Optional
+
+ROOT = Path(__file__).resolve().parents[1]
+if str(ROOT) not in sys.path:
+    sys.path.append(str(ROOT))
+
+GIB = 1024 ** 3
+# TorchServe's own defaults for the settings it is given no value for.
+DEFAULT_JOB_QUEUE_SIZE = 100
+DEFAULT_RESPONSE_TIMEOUT = 120
+
+
+@dataclass(frozen=True)
+class Host:
+    cpus: int
+    memory_bytes: int
+    numa_nodes: int = 1
+
+
+@dataclass(frozen=True)
+class Profile:
+    threads_per_worker: int
+    batch_size: int
+    max_batch_delay_ms: int
+    # Queued requests per batch slot before TorchServe answers 503.
+    queue_depth: int
+
+
+PROFILES: Dict[str, Profile] = {
+    "latency": Profile(threads_per_worker=4, batch_size=1, max_batch_delay_ms=0, queue_depth=8),
+    "balanced": Profile(threads_per_worker=2, batch_size=4, max_batch_delay_ms=10, queue_depth=4),
+    "throughput": Profile(threads_per_worker=1, batch_size=8, max_batch_delay_ms=50, queue_depth=4),
+}
+
+
+@dataclass(frozen=True)
+class Plan:
+    workers: int
+    threads_per_worker: int
+    batch_size: int
+    max_batch_delay_ms: int
+    job_queue_size: int
+    netty_threads: int
+    netty_client_threads: int
+    cpu_launcher: bool
+
+
+def _read(path: Path) -> Optional[str]:
+    try:
+        return path.read_text().strip()
+    except OSError:
+        return None
+
+
+def detect_host(root: Path = Path("/")) -> Host:
+    """Describe the CPUs, memory and NUMA nodes this process may use."""
+    try:
+        cpus = len(os.sched_getaffinity(0))
+    except AttributeError:
+        cpus = os.cpu_count() or 1
+    # cgroup v2 CPU quota, e.g. "400000 100000" for 4 CPUs in a container.
+    quota = (_read(root / "sys/fs/cgroup/cpu.max") or "max").split()
+    if quota[0] != "max" and len(quota) == 2:
+        cpus = max(1, min(cpus, int(quota[0]) // int(quota[1])))
+
+    memory = 0
+    for line in (_read(root / "proc/meminfo") or "").splitlines():
+        if line.startswith("MemTotal:"):
+            memory = int(line.split()[1]) * 1024
+    limit = _read(root / "sys/fs/cgroup/memory.max")
+    if limit and limit != "max":
+        memory = min(memory, int(limit)) if memory else int(limit)
+
+    node_dir = root / "sys/devices/system/node"
+    nodes = len(list(node_dir.glob("node[0-9]*"))) if node_dir.is_dir() else 0
+    return Host(cpus=cpus, memory_bytes=memory, numa_nodes=max(1, nodes))
+
+
+def plan(host: Host, profile: Profile, worker_memory: int = GIB, reserved_memory: int = 2 * GIB) -> Plan:
+    """Size TorchServe for ``host``.
+
+    Workers share the CPUs ``threads_per_worker`` at a time, and are capped by
+    what fits in memory after ``reserved_memory`` for the JVM and the API.
+    """
+    threads = max(1, min(profile.threads_per_worker, host.cpus))
+    workers = max(1, host.cpus // threads)
+    if host.memory_bytes:
+        workers = max(1, min(workers, (host.memory_bytes - reserved_memory) // worker_memory))
+    # The frontend only moves bytes; a few threads per worker is plenty.
+    netty = max(2, min(host.cpus, workers))
+    return Plan(
+        workers=workers,
+        threads_per_worker=threads,
+        batch_size=profile.batch_size,
+        max_batch_delay_ms=profile.max_batch_delay_ms,
+        job_queue_size=max(DEFAULT_JOB_QUEUE_SIZE, workers * profile.batch_size * profile.queue_depth),
+        netty_threads=netty,
+        netty_client_threads=netty,
+        # TorchServe pins each worker to its own cores and node.
+        cpu_launcher=host.numa_nodes > 1,
+    )
+
+
+def model_version(mar: Path, default: str = "1.0") -> str:
+    """The version TorchServe registers ``mar`` under; per-model settings are keyed by it."""
+    try:
+        with zipfile.ZipFile(mar) as archive:
+            manifest = json.loads(archive.read("MAR-INF/MANIFEST.json"))
+        return manifest["model"].get("modelVersion") or default
+    except (OSError, KeyError, ValueError, zipfile.BadZipFile):
+        return default
+
+
+def read_properties(path: Optional[Path]) -> Dict[str, str]:
+    properties: Dict[str, str] = {}
+    if path is None or not path.exists():
+        return properties
+    for line in path.read_text().splitlines():
+        line = line.strip()
+        if line and not line.startswith("#") and "=" in line:
+            key, _, value = line.partition("=")
+            properties[key.strip()] = value.strip()
+    return properties
+
+
+def render(p: Plan, base: Dict[str, str], model: str = "where", version: str = "1.0") -> str:
+    """``base`` with the settings of ``p`` and the model's registration parameters."""
+    properties = dict(base)
+    properties.update({
+        "default_workers_per_model": str(p.workers),
+        "job_queue_size": str(p.job_queue_size),
+        "number_of_netty_threads": str(p.netty_threads),
+        "netty_client_threads": str(p.netty_client_threads),
+        "models": json.dumps({model: {version: {
+            "defaultVersion": True,
+            "marName": f"{model}.mar",
+            "minWorkers": p.workers,
+            "maxWorkers": p.workers,
+            "batchSize": p.batch_size,
+            "maxBatchDelay": p.max_batch_delay_ms,
+            "responseTimeout": DEFAULT_RESPONSE_TIMEOUT,
+        }}}),
+    })
+    if p.cpu_launcher:
+        properties["cpu_launcher_enable"] = "true"
+    # Request counters on the metrics API, which the API's autoscaler reads.
+    properties.setdefault("metrics_mode", "prometheus")
+    lines = [f"# Generated by scripts/torchserve_config.py: {json.dumps(asdict(p))}"]
+    lines += [f"{key}={value}" for key, value in properties.items()]
+    return "\n".join(lines) + "\n"
+
+
+def render_env(p: Plan) -> str:
+    # With the launcher TorchServe sets the threads per worker itself.
+    if p.cpu_launcher:
+        return ""
+    return f"export OMP_NUM_THREADS={p.threads_per_worker}\nexport MKL_NUM_THREADS={p.threads_per_worker}\n"
+
+
+def read_plan(config: Path) -> Plan:
+    """The plan recorded in the header of a generated config."""
+    header = config.read_text().splitlines()[0]
+    return Plan(**json.loads(header.split(": ", 1)[1]))
+
+
+def probe(url: str, image: bytes, p: Plan, rounds: int = 8) -> Dict[str, float]:
+    """Measure images/s with one caller and with enough callers to fill every batch."""
+    from api.inference import HTTPInferenceClient
+    from scripts.benchmark_inference import run
+
+    import requests
+
+    concurrency = p.workers * p.batch_size
+    client = HTTPInferenceClient(url, session=requests.Session())
+    try:
+        single = run(client, image, rounds * 2, 1)
+        loaded = run(client, image, concurrency * rounds, concurrency)
+    finally:
+        client.close()
+    return {
+        "concurrency": concurrency,
+        "single_images_per_s": single["images_per_s"],
+        "images_per_s": loaded["images_per_s"],
+        "p95_ms": loaded["p95_ms"],
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Generate or check a TorchServe config for this host")
+    parser.add_argument("--profile", default=os.getenv("TS_PROFILE", "balanced"), choices=sorted(PROFILES))
+    parser.add_argument("--base", type=Path, default=ROOT / "config" / "config.properties",
+                        help="config.properties to start from")
+    parser.add_argument("--output", type=Path, help="Where to write the config (default: print it)")
+    parser.add_argument("--model-store", type=Path, default=Path("/model-store"))
+    parser.add_argument("--model", default="where")
+    parser.add_argument("--worker-memory-gb", type=float, default=1.0, help="Memory one model worker needs")
+    parser.add_argument("--probe-url", help="Check the TorchServe at this URL instead of writing a config")
+    parser.add_argument("--plan", type=Path, help="Generated config whose plan --probe-url checks")
+    parser.add_argument("--probe-image", type=Path, default=ROOT / "eiffel.jpg")
+    parser.add_argument("--min-images-per-second", type=float, default=0.0)
+    args = parser.parse_args()
+
+    if args.probe_url:
+        p = read_plan(args.plan) if args.plan else plan(detect_host(), PROFILES[args.profile])
+        try:
+            result = probe(args.probe_url, args.probe_image.read_bytes(), p)
+        except Exception as e:
+            raise SystemExit(f"Probe failed: {e}")
+        print(f"{result['concurrency']} callers: {result['images_per_s']:.1f} images/s "
+              f"(p95 {result['p95_ms']:.1f} ms), 1 caller: {result['single_images_per_s']:.1f} images/s")
+        if p.workers * p.batch_size > 1 and result["images_per_s"] <= result["single_images_per_s"]:
+            raise SystemExit("Concurrent requests are no faster than one at a time; "
+                             "check that the workers and batching took effect")
+        if result["images_per_s"] < args.min_images_per_second:
+            raise SystemExit(f"Below {args.min_images_per_second} images/s")
+        return
+
+    host = detect_host()
+    p = plan(host, PROFILES[args.profile], worker_memory=int(args.worker_memory_gb * GIB))
+    version = model_version(args.model_store / f"{args.model}.mar")
+    config = render(p, read_properties(args.base), args.model, version)
+    print(f"Host: {host.cpus} CPUs, {host.memory_bytes / GIB:.1f} GiB, {host.numa_nodes} NUMA node(s); "
+          f"profile {args.profile}: {p.workers} workers x {p.threads_per_worker} threads, "
+          f"batch {p.batch_size} / {p.max_batch_delay_ms} ms", file=sys.stderr)
+    if args.output is None:
+        print(config, end="")
+        return
+    args.output.parent.mkdir(parents=True, exist_ok=True)
+    args.output.write_text(config)
+    Path(f"{args.output}.env").write_text(render_env(p))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,154 @@
+import sys
+import asyncio
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(ROOT))
+sys.path.insert(1, str(ROOT / "api"))
+
+from api.autoscaler import (
+    INFERENCE_LATENCY,
+    QUEUE_LATENCY,
+    REQUESTS,
+    Observation,
+    ScalingPolicy,
+    WorkerAutoscaler,
+    decide,
+    observe,
+    parse_counters,
+)
+
+POLICY = ScalingPolicy(min_workers=1, max_workers=8, up_cooldown=15, down_cooldown=120)
+
+
+def test_queueing_scales_up_to_the_target_utilization():
+    decision = decide(Observation(workers=2, queue_ms=200, busy=2.0), POLICY, since_last_change=60)
+    assert decision.workers == 4  # 2 busy / 0.6
+    assert decision.reason == "queueing"
+
+    burst = decide(Observation(workers=2, queue_ms=900, busy=20.0), POLICY, since_last_change=60)
+    assert burst.workers == 8
+
+
+def test_scaling_up_waits_for_the_up_cooldown():
+    obs = Observation(workers=2, queue_ms=200, busy=2.0)
+    assert decide(obs, POLICY, since_last_change=5).workers == 2
+    assert decide(obs, POLICY, since_last_change=15).workers == 4
+
+
+def test_idle_workers_are_removed_one_at_a_time_after_the_down_cooldown():
+    obs = Observation(workers=6, queue_ms=0, busy=0.0)
+    assert decide(obs, POLICY, since_last_change=60).workers == 6
+    decision = decide(obs, POLICY, since_last_change=120)
+    assert decision.workers == 5
+    assert decision.reason == "idle"
+    assert decide(Observation(workers=1, queue_ms=0, busy=0.0), POLICY, since_last_change=1e9).workers == 1
+
+
+def test_moderate_load_keeps_the_count():
+    # 50% busy is between the scale-down and scale-up thresholds.
+    decision = decide(Observation(workers=4, queue_ms=5, busy=2.0), POLICY, since_last_change=1e9)
+    assert decision.workers == 4
+    assert decision.reason == "steady"
+
+
+def test_counts_outside_the_policy_are_corrected():
+    assert decide(Observation(workers=12, queue_ms=0, busy=1.0), POLICY, 0).workers == 8
+    assert decide(Observation(workers=0, queue_ms=0, busy=0.0), POLICY, 0).workers == 1
+
+
+def test_counters_are_parsed_for_the_model_and_turned_into_demand():
+    text = "\n".join([
+        "# HELP ts_queue_latency_microseconds Cumulative queue duration in microseconds",
+        "# TYPE ts_queue_latency_microseconds counter",
+        'ts_queue_latency_microseconds{uuid="a",model_name="where",model_version="default",} 2000000.0',
+        'ts_queue_latency_microseconds{uuid="a",model_name="other",model_version="default",} 9.0',
+        'ts_inference_latency_microseconds{uuid="a",model_name="where",model_version="default",} 12000000.0',
+        'ts_inference_requests_total{uuid="a",model_name="where",model_version="default",} 100.0',
+    ])
+    counters = parse_counters(text, "where")
+    assert counters == {QUEUE_LATENCY: 2e6, INFERENCE_LATENCY: 12e6, REQUESTS: 100.0}
+
+    zero = {QUEUE_LATENCY: 0.0, INFERENCE_LATENCY: 0.0, REQUESTS: 0.0}
+    obs = observe(zero, counters, seconds=5, workers=3)
+    assert obs.queue_ms == 20.0
+    assert obs.busy == 2.0  # 10 s of work in 5 s
+    # A restarted TorchServe starts its counters over.
+    assert observe(counters, zero, seconds=5, workers=3).busy == 0.0
+
+
+def test_batched_requests_share_a_worker():
+    before = {QUEUE_LATENCY: 0.0, INFERENCE_LATENCY: 0.0, REQUESTS: 0.0}
+    # 80 requests in batches of 8, each reporting its batch's 0.5 s.
+    after = {QUEUE_LATENCY: 0.0, INFERENCE_LATENCY: 40e6, REQUESTS: 80.0}
+    obs = observe(before, after, seconds=10, workers=2, batch_size=8)
+    assert obs.busy == 0.5
+    assert decide(obs, POLICY, since_last_change=1e9).workers <= 2
+    # Read as one request per worker, the same load would ask for 7 workers.
+    unbatched = observe(before, after, seconds=10, workers=2)
+    assert decide(unbatched, POLICY, since_last_change=1e9).workers == 7
+
+
+class FakeConnection:
+    def __init__(self, locks, closed=False):
+        self.locks = locks
+        self.closed = closed
+
+    async def fetchval(self, query, key):
+        if key in self.locks:
+            return False
+        self.locks[key] = self
+        return True
+
+    def is_closed(self):
+        return self.closed
+
+
+class FakePool:
+    """Connections of one database; releasing one drops its advisory locks."""
+
+    def __init__(self, locks):
+        self.locks = locks
+
+    async def acquire(self):
+        return FakeConnection(self.locks)
+
+    async def release(self, conn):
+        for key in [k for k, holder in self.locks.items() if holder is conn]:
+            del self.locks[key]
+
+
+def test_only_one_process_scales():
+    locks = {}
+    first, second = WorkerAutoscaler(policy=POLICY), WorkerAutoscaler(policy=POLICY)
+    first._pool, second._pool = FakePool(locks), FakePool(locks)
+
+    async def run():
+        elected = [await first.is_leader(), await second.is_leader(), await first.is_leader()]
+        await first.stop()
+        elected.append(await second.is_leader())
+        return elected
+
+    assert asyncio.run(run()) == [True, False, True, True]
+    assert WorkerAutoscaler(policy=POLICY)._pool is None
+    assert asyncio.run(WorkerAutoscaler(policy=POLICY).is_leader())
+
+
+def test_step_scales_through_the_management_api():
+    scaler = WorkerAutoscaler(policy=POLICY)
+    samples = iter([
+        {QUEUE_LATENCY: 0.0, INFERENCE_LATENCY: 0.0, REQUESTS: 0.0},
+        {QUEUE_LATENCY: 50e6, INFERENCE_LATENCY: 100e6, REQUESTS: 100.0},
+    ])
+    scaled = []
+    scaler._counters = lambda: next(samples)
+    scaler._describe = lambda: (2, 1)
+    scaler._scale = scaled.append
+
+    async def run():
+        assert await scaler.step() is None
+        return await scaler.step()
+
+    decision = asyncio.run(run())
+    assert decision.workers == 8
+    assert scaled == [8]
@@ -1,3 +1,4 @@
+import asyncio
 import sys
 import os
 from pathlib import Path
@@ -10,7 +11,8 @@ ROOT = Path(__file__).resolve().parents[1]
 sys.path.insert(0, str(ROOT))
 sys.path.insert(1, str(ROOT / "api"))
 
-from api.db import init_db, close_db
+from api.config import DatabaseSettings
+from api.db import InstrumentedPool, ReplicaSet, close_db, connection_options, init_connection, init_db
 
 
 class DummyPool:
@@ -37,3 +39,134 @@ async def test_pool_returns_connection(mock_create_pool):
         assert conn == "conn"
         await close_db(app)
         assert app.state.pool.closed
+
+
+class SlowPool:
+    """asyncpg-like pool with a fixed number of connections."""
+
+    def __init__(self, size: int = 1) -> None:
+        self.free = asyncio.Queue()
+        for i in range(size):
+            self.free.put_nowait(FakeConnection(i))
+        self.size = size
+
+    async def acquire(self, timeout=None):
+        return await asyncio.wait_for(self.free.get(), timeout)
+
+    async def release(self, conn, timeout=None):
+        self.free.put_nowait(conn)
+
+    def get_size(self):
+        return self.size
+
+    def get_idle_size(self):
+        return self.free.qsize()
+
+
+class FakeConnection:
+    def __init__(self, n: int) -> None:
+        self.n = n
+
+    async def fetchval(self, query, *args, column=0, timeout=None):
+        await asyncio.sleep(0.01)
+        return self.n
+
+
+def test_instrumented_pool_tracks_waiters_and_connections_in_use():
+    pool = InstrumentedPool(SlowPool(size=1))
+
+    async def main():
+        async with pool.acquire() as conn:
+            assert conn.n == 0
+            waiter = asyncio.create_task(pool.fetchval("SELECT 1"))
+            await asyncio.sleep(0.005)
+            stats = pool.stats()
+            assert stats["in_use"] == 1
+            assert stats["waiting"] == 1
+            assert stats["idle"] == 0
+        assert await waiter == 0
+
+    asyncio.run(main())
+    stats = pool.stats()
+    assert stats["in_use"] == 0 and stats["waiting"] == 0
+    assert stats["acquire_wait_ms_avg"] > 0
+    assert stats["query_ms_avg"] > 0
+
+
+def test_instrumented_pool_acquire_timeout():
+    pool = InstrumentedPool(SlowPool(size=1), acquire_timeout=0.01)
+
+    async def main():
+        conn = await pool.acquire()
+        with pytest.raises(asyncio.TimeoutError):
+            await pool.acquire()
+        await pool.release(conn)
+
+    asyncio.run(main())
+    assert pool.stats()["waiting"] == 0
+
+
+class RecordingConnection:
+    def __init__(self) -> None:
+        self.executed = []
+
+    async def execute(self, query, *args):
+        self.executed.append(query)
+
+
+@pytest.mark.parametrize("pgbouncer, expect_search_path", [(False, True), (True, False)])
+def test_init_connection_sets_no_session_state_behind_pgbouncer(pgbouncer, expect_search_path):
+    conn = RecordingConnection()
+    settings = DatabaseSettings(DB_PGBOUNCER_MODE=pgbouncer)
+    with patch("api.db.get_database_settings", return_value=settings), \
+            patch("api.db.register_vector") as register:
+        asyncio.run(init_connection(conn))
+        options = connection_options()
+    assert any("search_path" in q for q in conn.executed) == expect_search_path
+    register.assert_called_once_with(conn)
+    assert (options["statement_cache_size"] == 0) == pgbouncer
+
+
+class LagPool:
+    """Stands in for an InstrumentedPool on a replica reporting a fixed lag."""
+
+    def __init__(self, lag=0.0, in_use=0, fail=False) -> None:
+        self.lag = lag
+        self.in_use = in_use
+        self.waiting = 0
+        self.fail = fail
+
+    async def fetchval(self, query, *args, column=0, timeout=None):
+        if self.fail:
+            raise ConnectionError("replica down")
+        return self.lag
+
+    def stats(self):
+        return {"in_use": self.in_use}
+
+
+def test_replica_set_prefers_least_busy_healthy_replica():
+    primary = LagPool()
+    busy, idle = LagPool(in_use=3), LagPool(in_use=1)
+    replicas = ReplicaSet(primary, {"replica0": busy, "replica1": idle}, max_lag=5)
+    assert replicas.pool() is idle
+    idle.in_use = 4
+    assert replicas.pool() is busy
+
+
+def test_replica_set_drops_lagging_and_failed_replicas():
+    primary = LagPool()
+    lagging, down = LagPool(lag=30), LagPool(fail=True)
+    replicas = ReplicaSet(primary, {"replica0": lagging, "replica1": down}, max_lag=5)
+
+    result = asyncio.run(replicas.check())
+
+    assert result["healthy"] is True
+    assert result["replicas"]["replica0"]["healthy"] is False
+    assert result["replicas"]["replica1"]["healthy"] is False
+    assert replicas.pool() is primary
+
+    lagging.lag = 0.5
+    asyncio.run(replicas.check())
+    assert replicas.in_rotation == {"replica0"}
+    assert replicas.pool() is lagging
@@ -0,0 +1,67 @@
+import base64
+import struct
+import sys
+from pathlib import Path
+from types import SimpleNamespace
+
+import pytest
+
+ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(ROOT))
+sys.path.insert(1, str(ROOT / "api"))
+
+import numpy as np
+from api.embedding import EmbeddingFormatError, decode_embedding
+
+# The numpy stub used by the other tests has no dtypes.
+pytestmark = pytest.mark.skipif(not hasattr(np, "float32"), reason="needs numpy")
+
+VALUES = [0.5, -1.25, 3.0]
+RAW = struct.pack("<3f", *VALUES)
+
+
+def response(content=b"", headers=None, json_body=None):
+    def json():
+        if json_body is None:
+            raise ValueError("no JSON")
+        return json_body
+    return SimpleNamespace(content=content, headers=headers or {}, json=json)
+
+
+def test_binary_embedding_is_decoded_without_copying():
+    embedding = decode_embedding(response(RAW, {
+        "content-type": "application/octet-stream",
+        "X-Embedding-Dim": "3",
+        "X-Model-Version": "2.1",
+    }))
+
+    assert embedding.vector.dtype == np.float32
+    assert embedding.vector.tolist() == VALUES
+    assert embedding.model_version == "2.1"
+    # A view onto the response body, not a copy.
+    assert not embedding.vector.flags.owndata
+
+
+def test_base64_embedding_in_json():
+    embedding = decode_embedding(response(json_body={
+        "embedding_b64": base64.b64encode(RAW).decode(), "dim": 3, "model_version": "2.1",
+    }))
+
+    assert embedding.vector.tolist() == VALUES
+    assert embedding.model_version == "2.1"
+
+
+def test_float_list_embedding_is_still_accepted():
+    assert decode_embedding(response(json_body={"embedding": VALUES})).vector.dtype == np.float32
+    assert decode_embedding(response(json_body=VALUES)).vector.tolist() == VALUES
+
+
+@pytest.mark.parametrize("resp, message", [
+    (response(RAW, {"content-type": "application/octet-stream", "X-Embedding-Dim": "128"}), "expected 128"),
+    (response(RAW[:-1], {"content-type": "application/octet-stream"}), "whole number"),
+    (response(json_body={"embedding_b64": "not base64!"}), "Invalid base64"),
+    (response(json_body={"status": "ok"}), "No embedding"),
+])
+def test_bad_embeddings_are_rejected(resp, message):
+    with pytest.raises(EmbeddingFormatError, match=message):
+        decode_embedding(resp)
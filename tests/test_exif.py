@@ -0,0 +1,105 @@
+import struct
+import sys
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(ROOT))
+sys.path.insert(1, str(ROOT / "api"))
+
+from ml.exif import read_gps, trustworthy
+from ml.fuse import fuse
+
+
+def dms(value):
+    value = abs(value)
+    degrees = int(value)
+    minutes = int((value - degrees) * 60)
+    seconds = round((value - degrees - minutes / 60) * 3600 * 1000)
+    return [(degrees, 1), (minutes, 1), (seconds, 1000)]
+
+
+def exif_block(lat, lon, order="<", status=None, error_m=None):
+    """A TIFF block with IFD0 pointing at a GPS IFD."""
+    entries, data = [], b""
+    gps_offset = 8 + 2 + 12 + 4
+
+    tags = [(1, b"N\x00" if lat >= 0 else b"S\x00"), (2, dms(lat)),
+            (3, b"E\x00" if lon >= 0 else b"W\x00"), (4, dms(lon))]
+    if status is not None:
+        tags.append((9, status.encode() + b"\x00"))
+    if error_m is not None:
+        # A number, or the raw rationals.
+        tags.append((0x1F, error_m if isinstance(error_m, list) else [(int(error_m * 10), 10)]))
+    data_offset = gps_offset + 2 + 12 * len(tags) + 4
+    for tag, value in tags:
+        if isinstance(value, bytes):
+            entries.append(struct.pack(order + "HHI", tag, 2, len(value)) + value.ljust(4, b"\x00"))
+        else:
+            raw = b"".join(struct.pack(order + "II", n, d) for n, d in value)
+            entries.append(struct.pack(order + "HHII", tag, 5, len(value), data_offset + len(data)))
+            data += raw
+    header = (b"II" if order == "<" else b"MM") + struct.pack(order + "HI", 42, 8)
+    ifd0 = struct.pack(order + "H", 1) + struct.pack(order + "HHII", 0x8825, 4, 1, gps_offset) + b"\x00" * 4
+    gps = struct.pack(order + "H", len(entries)) + b"".join(entries) + b"\x00" * 4
+    return header + ifd0 + gps + data
+
+
+def jpeg(*segments):
+    body = b"".join(
+        b"\xff" + bytes([marker]) + struct.pack(">H", len(payload) + 2) + payload for marker, payload in segments
+    )
+    return b"\xff\xd8" + body + b"\xff\xda\x00\x02" + b"\x12\x34" * 64 + b"\xff\xd9"
+
+
+def with_gps(lat, lon, **kwargs):
+    return jpeg((0xE0, b"JFIF\x00\x01\x01"), (0xE1, b"Exif\x00\x00" + exif_block(lat, lon, **kwargs)))
+
+
+def test_reads_gps_in_both_byte_orders():
+    for order in ("<", ">"):
+        gps = read_gps(with_gps(48.8584, 2.2945, order=order))
+        assert abs(gps["lat"] - 48.8584) < 1e-6
+        assert abs(gps["lon"] - 2.2945) < 1e-6
+
+    gps = read_gps(with_gps(-33.8568, -151.2153, status="A", error_m=12.5))
+    assert gps["lat"] < 0 and gps["lon"] < 0
+    assert gps["status"] == "A"
+    assert gps["error_m"] == 12.5
+
+
+def test_malformed_positioning_error_keeps_the_position():
+    for error_m in ([], [(5, 0)]):
+        gps = read_gps(with_gps(48.8584, 2.2945, status="A", error_m=error_m))
+        assert abs(gps["lat"] - 48.8584) < 1e-6
+        assert abs(gps["lon"] - 2.2945) < 1e-6
+        assert gps["status"] == "A"
+        assert "error_m" not in gps
+
+
+def test_photos_without_gps_have_none():
+    assert read_gps(jpeg((0xE0, b"JFIF\x00\x01\x01"))) is None
+    assert read_gps(jpeg((0xE1, b"http://ns.adobe.com/xap/1.0/\x00<x/>"))) is None
+    assert read_gps(b"\x89PNG\r\n\x1a\n") is None
+    assert read_gps(b"") is None
+
+
+def test_truncated_exif_is_ignored():
+    image = with_gps(48.8584, 2.2945)
+    block = b"Exif\x00\x00" + exif_block(48.8584, 2.2945)[:30]
+    assert read_gps(jpeg((0xE1, block))) is None
+    assert read_gps(image[:40]) is None
+
+
+def test_only_real_precise_fixes_are_trusted():
+    assert trustworthy({"lat": 48.8584, "lon": 2.2945})
+    assert trustworthy({"lat": 48.8584, "lon": 2.2945, "error_m": 30.0, "status": "A"})
+    assert not trustworthy(None)
+    assert not trustworthy({"lat": 0.0, "lon": 0.0})
+    assert not trustworthy({"lat": 48.8584, "lon": 2.2945, "status": "V"})
+    assert not trustworthy({"lat": 48.8584, "lon": 2.2945, "error_m": 5000.0})
+    assert not trustworthy({"lat": 95.0, "lon": 2.2945})
+
+
+def test_fuse_answers_with_a_trustworthy_fix():
+    assert fuse([], [], exif={"lat": 1.0, "lon": 2.0}) == ((1.0, 2.0), 1.0)
+    assert fuse([], [(3.0, 4.0, 0.5)], exif={"lat": 0.0, "lon": 0.0}) == ((3.0, 4.0), 0.5)
@@ -0,0 +1,104 @@
+import sys
+import asyncio
+from pathlib import Path
+from unittest.mock import patch, Mock
+
+ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(ROOT))
+sys.path.insert(1, str(ROOT / "api"))
+
+from api.health import HealthMonitor, check_database, check_torchserve
+
+
+class DummyPool:
+    def __init__(self, fail: bool = False):
+        self.fail = fail
+
+    async def fetchval(self, query):
+        if self.fail:
+            raise RuntimeError("connection refused")
+        return 1
+
+    def get_size(self):
+        return 3
+
+    def get_idle_size(self):
+        return 2
+
+
+def test_snapshot_is_cached_between_polls():
+    calls = []
+
+    async def check():
+        calls.append(1)
+        return {"healthy": True}
+
+    async def run():
+        monitor = HealthMonitor(interval=60)
+        monitor.add_check("dep", check)
+        await monitor.refresh()
+        first = monitor.snapshot
+        # Reading the snapshot must not trigger another check.
+        assert monitor.snapshot is first
+        assert monitor.is_ready()
+        return first
+
+    snapshot = asyncio.run(run())
+    assert len(calls) == 1
+    assert snapshot.checks["dep"]["healthy"] is True
+    assert snapshot.age >= 0
+
+
+def test_slow_check_times_out_without_blocking_others():
+    async def slow():
+        await asyncio.sleep(5)
+        return {"healthy": True}
+
+    async def fast():
+        return {"healthy": True}
+
+    async def run():
+        monitor = HealthMonitor(interval=60, timeout=0.05)
+        monitor.add_check("slow", slow)
+        monitor.add_check("fast", fast)
+        return await monitor.refresh(), monitor.is_ready()
+
+    snapshot, ready = asyncio.run(run())
+    assert snapshot.checks["fast"]["healthy"] is True
+    assert snapshot.checks["slow"]["healthy"] is False
+    assert "timed out" in snapshot.checks["slow"]["status"]
+    assert ready is False
+
+
+def test_stale_snapshot_is_not_ready():
+    async def run():
+        monitor = HealthMonitor(interval=60)
+        monitor.add_check("dep", lambda: asyncio.sleep(0, {"healthy": True}))
+        await monitor.refresh()
+        return monitor.is_ready(max_age=-1)
+
+    assert asyncio.run(run()) is False
+
+
+def test_check_database_reports_pool_stats():
+    result = asyncio.run(check_database(DummyPool()))
+    assert result["healthy"] is True
+    assert result["pool"] == {"size": 3, "idle": 2}
+
+    result = asyncio.run(check_database(DummyPool(fail=True)))
+    assert result["healthy"] is False
+    assert "connection refused" in result["status"]
+
+
+def test_check_torchserve_requires_where_model():
+    response = Mock(status_code=200)
+    response.json.return_value = {"models": [{"modelName": "where"}]}
+    with patch("api.health.requests.get", return_value=response):
+        result = asyncio.run(check_torchserve("http://ts:8081"))
+    assert result["healthy"] is True
+    assert result["status"] == "healthy"
+
+    response.json.return_value = {"models": [{"modelName": "other"}]}
+    with patch("api.health.requests.get", return_value=response):
+        result = asyncio.run(check_torchserve("http://ts:8081"))
+    assert result["healthy"] is False
@@ -0,0 +1,127 @@
+import json
+import sys
+from concurrent import futures
+from pathlib import Path
+from types import SimpleNamespace
+
+import pytest
+
+ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(ROOT))
+sys.path.insert(1, str(ROOT / "api"))
+
+import requests
+from api.inference import (
+    GRPCInferenceClient,
+    HTTPInferenceClient,
+    InferenceError,
+    InferenceUnavailable,
+)
+from api.inference.grpc_client import decode_prediction_response, encode_predictions_request
+
+
+class FakeSession:
+    def __init__(self, response=None, error=None):
+        self.response = response
+        self.error = error
+        self.calls = []
+
+    def post(self, url, **kwargs):
+        self.calls.append((url, kwargs))
+        if self.error is not None:
+            raise self.error
+        return self.response
+
+    def close(self):
+        pass
+
+
+def json_response(body, status_code=200):
+    return SimpleNamespace(status_code=status_code, headers={}, text=json.dumps(body), json=lambda: body)
+
+
+def test_http_client_posts_the_image_and_decodes_the_embedding():
+    session = FakeSession(json_response({"embedding": [1.0, 2.0], "model_version": "1.0"}))
+    client = HTTPInferenceClient("http://torchserve:8080/", session=session)
+
+    embedding = client.embed(b"jpeg", "a.jpg", "image/jpeg")
+
+    assert embedding.vector.tolist() == [1.0, 2.0]
+    assert embedding.model_version == "1.0"
+    url, kwargs = session.calls[0]
+    assert url == "http://torchserve:8080/predictions/where"
+    assert kwargs["files"] == {"data": ("a.jpg", b"jpeg", "image/jpeg")}
+    assert kwargs["headers"]["Accept"].startswith("application/octet-stream")
+
+
+def test_http_client_errors():
+    client = HTTPInferenceClient("http://torchserve:8080", session=FakeSession(json_response("busy", 503)))
+    with pytest.raises(InferenceError) as exc:
+        client.embed(b"jpeg")
+    assert exc.value.status_code == 503
+
+    client = HTTPInferenceClient("http://torchserve:8080", session=FakeSession(error=requests.exceptions.ConnectionError()))
+    with pytest.raises(InferenceUnavailable):
+        client.embed(b"jpeg")
+
+
+def test_predictions_request_encoding():
+    assert encode_predictions_request("where", {"data": b"\xff"}) == (
+        b"\x0a\x05where" + b"\x1a\x09" + b"\x0a\x04data" + b"\x12\x01\xff"
+    )
+
+
+def test_prediction_response_decoding_skips_unknown_fields():
+    # field 2 (varint 150), then field 1 (bytes)
+    assert decode_prediction_response(b"\x10\x96\x01" + b"\x0a\x03abc") == b"abc"
+    with pytest.raises(ValueError):
+        decode_prediction_response(b"\x0a\x05ab")
+
+
+@pytest.fixture
+def grpc_server():
+    grpc = pytest.importorskip("grpc")
+    model_inputs = []
+
+    def predictions(request, context):
+        model_inputs.append(request)
+        if b"missing" in request:
+            context.abort(grpc.StatusCode.NOT_FOUND, "Model not found")
+        data = request[request.index(b"data") + 6:]
+        body = json.dumps({"embedding": [float(len(data))] * 2}).encode()
+        return b"\x0a" + bytes([len(body)]) + body
+
+    server = grpc.server(futures.ThreadPoolExecutor(max_workers=4))
+    server.add_generic_rpc_handlers([grpc.method_handlers_generic_handler(
+        "org.pytorch.serve.grpc.inference.InferenceAPIsService",
+        {"Predictions": grpc.unary_unary_rpc_method_handler(predictions)},
+    )])
+    port = server.add_insecure_port("127.0.0.1:0")
+    server.start()
+    yield f"127.0.0.1:{port}", model_inputs
+    server.stop(None)
+
+
+def test_grpc_client_against_stand_in_server(grpc_server):
+    target, model_inputs = grpc_server
+    client = GRPCInferenceClient(target, timeout=5)
+    try:
+        assert client.embed(b"abc").vector.tolist() == [3.0, 3.0]
+        assert model_inputs[0] == encode_predictions_request("where", {"data": b"abc"})
+
+        results = client.embed_many([(b"a", None, None), (b"missing", None, None), (b"abcd", None, None)])
+        assert results[0].vector.tolist() == [1.0, 1.0]
+        assert isinstance(results[1], InferenceError) and results[1].status_code == 404
+        assert results[2].vector.tolist() == [4.0, 4.0]
+    finally:
+        client.close()
+
+
+def test_grpc_client_reports_unreachable_server():
+    pytest.importorskip("grpc")
+    client = GRPCInferenceClient("127.0.0.1:1", timeout=1)
+    try:
+        with pytest.raises(InferenceUnavailable):
+            client.embed(b"abc")
+    finally:
+        client.close()
@@ -0,0 +1,101 @@
+import asyncio
+import sys
+from pathlib import Path
+from unittest.mock import AsyncMock
+
+import pytest
+from fastapi import HTTPException
+
+ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(ROOT))
+sys.path.insert(1, str(ROOT / "api"))
+
+from api.jobs import FAILED, QUEUED, SUCCEEDED, ClientQueueFull, JobManager, QueueFull
+
+
+def test_job_result_is_kept_after_it_finished():
+    async def scenario():
+        manager = JobManager(workers=1)
+        manager.start()
+        job = manager.submit("1.2.3.4", AsyncMock(return_value={"lat": 1.0}))
+        assert job.status == QUEUED
+        await manager.wait(job, 1)
+        await manager.stop()
+        return manager, job
+
+    manager, job = asyncio.run(scenario())
+    assert job.status == SUCCEEDED
+    assert manager.get(job.id).result == {"lat": 1.0}
+    assert len(manager) == 0
+
+
+def test_failed_job_keeps_its_error():
+    async def scenario():
+        manager = JobManager(workers=1)
+        manager.start()
+        job = manager.submit("1.2.3.4", AsyncMock(side_effect=HTTPException(status_code=503, detail="down")))
+        await manager.wait(job, 1)
+        await manager.stop()
+        return job
+
+    job = asyncio.run(scenario())
+    assert job.status == FAILED
+    assert job.error.status_code == 503
+
+
+def test_unfinished_jobs_are_limited_per_client_and_overall():
+    async def scenario():
+        release = asyncio.Event()
+        manager = JobManager(workers=1, max_pending=3, max_per_client=2)
+        manager.start()
+        manager.submit("a", release.wait)
+        manager.submit("a", release.wait)
+        with pytest.raises(ClientQueueFull):
+            manager.submit("a", release.wait)
+        last = manager.submit("b", release.wait)
+        with pytest.raises(QueueFull):
+            manager.submit("c", release.wait)
+
+        release.set()
+        await manager.wait(last, 1)
+        # Capacity comes back as jobs finish.
+        manager.submit("a", release.wait)
+        await manager.stop()
+
+    asyncio.run(scenario())
+
+
+def test_long_poll_returns_when_the_job_finishes():
+    async def scenario():
+        manager = JobManager(workers=1)
+        manager.start()
+
+        async def slow():
+            await asyncio.sleep(0.05)
+            return "done"
+
+        job = manager.submit("a", slow)
+        early = await manager.wait(job, 0.001)
+        assert early.status in (QUEUED, "running")
+        await manager.wait(job, 5)
+        await manager.stop()
+        return job
+
+    assert asyncio.run(scenario()).result == "done"
+
+
+def test_stop_fails_jobs_that_never_ran():
+    async def scenario():
+        manager = JobManager(workers=1)
+        manager.start()
+        blocker = asyncio.Event()
+        running = manager.submit("a", blocker.wait)
+        queued = manager.submit("b", blocker.wait)
+        await asyncio.sleep(0)
+        await manager.stop()
+        return manager, running, queued
+
+    manager, running, queued = asyncio.run(scenario())
+    assert running.status == FAILED and queued.status == FAILED
+    assert running.done.is_set() and queued.done.is_set()
+    assert len(manager) == 0
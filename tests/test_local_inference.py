@@ -0,0 +1,118 @@
+import io
+import json
+import sys
+import zipfile
+from pathlib import Path
+
+import pytest
+
+ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(ROOT))
+sys.path.insert(1, str(ROOT / "api"))
+
+from api.inference import InferenceError, InferenceUnavailable, create_inference_client
+from api.inference.local import LocalInferenceClient, load_model, model_file, preprocess
+
+
+def write_mar(path: Path, serialized_name: str, model_bytes: bytes) -> Path:
+    manifest = {"model": {"modelName": "where", "serializedFile": serialized_name, "handler": "handler.py"}}
+    with zipfile.ZipFile(path, "w") as archive:
+        archive.writestr("MAR-INF/MANIFEST.json", json.dumps(manifest))
+        archive.writestr(serialized_name, model_bytes)
+        archive.writestr("handler.py", "")
+    return path
+
+
+def test_model_file_extracts_the_serialized_model_from_a_mar(tmp_path):
+    mar = write_mar(tmp_path / "where.mar", "model.onnx", b"onnx bytes")
+
+    extracted = model_file(mar)
+
+    assert extracted.name == "model.onnx"
+    assert extracted.read_bytes() == b"onnx bytes"
+    assert model_file(mar) == extracted
+    assert model_file(tmp_path / "model.pt") == tmp_path / "model.pt"
+
+
+def test_local_backend_needs_an_existing_model(tmp_path):
+    with pytest.raises(ValueError):
+        create_inference_client("local", "", "")
+    with pytest.raises(FileNotFoundError):
+        create_inference_client("local", "", "", model_path=str(tmp_path / "missing.mar"))
+
+
+def onnx_embedding_model(dim: int = 128) -> bytes:
+    """Average pooling followed by a fixed 3 x dim projection."""
+    pytest.importorskip("onnx")
+    from onnx import TensorProto, helper
+
+    weights = helper.make_tensor("w", TensorProto.FLOAT, [3, dim], [(i % 7) / 7.0 for i in range(3 * dim)])
+    graph = helper.make_graph(
+        [
+            helper.make_node("GlobalAveragePool", ["input"], ["pooled"]),
+            helper.make_node("Flatten", ["pooled"], ["flat"]),
+            helper.make_node("MatMul", ["flat", "w"], ["embedding"]),
+        ],
+        "where",
+        [helper.make_tensor_value_info("input", TensorProto.FLOAT, [None, 3, None, None])],
+        [helper.make_tensor_value_info("embedding", TensorProto.FLOAT, [None, dim])],
+        [weights],
+    )
+    model = helper.make_model(graph, opset_imports=[helper.make_opsetid("", 13)])
+    model.ir_version = 8
+    return model.SerializeToString()
+
+
+def png(color) -> bytes:
+    from PIL import Image
+
+    buffer = io.BytesIO()
+    Image.new("RGB", (32, 24), color).save(buffer, format="PNG")
+    return buffer.getvalue()
+
+
+def test_local_client_embeds_in_worker_processes(tmp_path):
+    pytest.importorskip("onnxruntime")
+    pytest.importorskip("PIL")
+    mar = write_mar(tmp_path / "where.mar", "model.onnx", onnx_embedding_model())
+    image = png((200, 30, 60))
+    expected = load_model(mar)(preprocess(image)).reshape(-1)
+
+    client = LocalInferenceClient(mar, workers=2, threads=1)
+    try:
+        embedding = client.embed(image, "red.png", "image/png")
+        results = client.embed_many([(image, "a.png", None), (b"not an image", "b.png", None)])
+    finally:
+        client.close()
+
+    assert embedding.model_version == "where"
+    assert embedding.vector.shape == (128,)
+    assert max(abs(a - b) for a, b in zip(embedding.vector, expected)) < 1e-5
+    assert list(results[0].vector) == list(embedding.vector)
+    assert isinstance(results[1], InferenceError) and results[1].status_code == 400
+
+
+def test_warm_up_starts_every_worker(tmp_path):
+    pytest.importorskip("onnxruntime")
+    pytest.importorskip("PIL")
+    mar = write_mar(tmp_path / "where.mar", "model.onnx", onnx_embedding_model())
+
+    client = LocalInferenceClient(mar, workers=2, threads=1)
+    try:
+        client.warm_up()
+        assert len(client._pool._processes) == 2
+        assert client.embed(png((0, 0, 0))).vector.shape == (128,)
+    finally:
+        client.close()
+
+
+def test_warm_up_reports_a_model_that_cannot_load(tmp_path):
+    pytest.importorskip("onnxruntime")
+    mar = write_mar(tmp_path / "where.mar", "model.onnx", b"not a model")
+
+    client = LocalInferenceClient(mar, workers=1, threads=1)
+    try:
+        with pytest.raises(InferenceUnavailable):
+            client.warm_up()
+    finally:
+        client.close()
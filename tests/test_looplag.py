@@ -0,0 +1,77 @@
+import sys
+import asyncio
+import time
+from pathlib import Path
+from unittest.mock import patch
+
+ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(ROOT))
+sys.path.insert(1, str(ROOT / "api"))
+
+from api import looplag
+from api.looplag import LoopLagMonitor
+
+
+def blocking_handler():
+    time.sleep(0.4)
+
+
+def test_stall_reports_stack_of_blocking_call():
+    stalls = []
+
+    async def run():
+        monitor = LoopLagMonitor(interval=0.02, threshold=0.1, on_stall=lambda d, s: stalls.append((d, s)))
+        monitor.start()
+        await asyncio.sleep(0.05)
+        blocking_handler()
+        await asyncio.sleep(0.05)
+        await monitor.stop()
+        return monitor
+
+    monitor = asyncio.run(run())
+    assert len(stalls) == 1
+    blocked_for, stack = stalls[0]
+    assert blocked_for >= 0.1
+    assert "blocking_handler" in stack
+    assert monitor.max_lag >= 0.3
+
+
+def test_idle_loop_reports_no_stall():
+    stalls = []
+
+    async def run():
+        monitor = LoopLagMonitor(interval=0.01, threshold=0.2, on_stall=lambda d, s: stalls.append(d))
+        monitor.start()
+        await asyncio.sleep(0.1)
+        await monitor.stop()
+        return monitor
+
+    monitor = asyncio.run(run())
+    assert stalls == []
+    assert monitor.max_lag < 0.2
+
+
+class Recorder:
+    def __init__(self):
+        self.values = []
+
+    def observe(self, value):
+        self.values.append(value)
+
+
+def test_stall_metric_records_the_full_block():
+    stalls = Recorder()
+
+    async def run():
+        monitor = LoopLagMonitor(interval=0.02, threshold=0.1, on_stall=lambda d, s: None)
+        monitor.start()
+        await asyncio.sleep(0.05)
+        blocking_handler()
+        await asyncio.sleep(0.05)
+        await monitor.stop()
+
+    with patch.object(looplag, "LOOP_STALLS", stalls):
+        asyncio.run(run())
+
+    assert len(stalls.values) == 1
+    assert 0.35 <= stalls.values[0] <= 0.5
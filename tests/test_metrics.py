@@ -0,0 +1,50 @@
+import os
+import subprocess
+import sys
+from pathlib import Path
+
+import pytest
+
+ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(ROOT))
+sys.path.insert(1, str(ROOT / "api"))
+
+from api import metrics
+
+
+def test_metrics_are_safe_to_call():
+    metrics.observe_stage("torchserve", 0.01)
+    metrics.PREDICTIONS.labels("model").inc()
+    metrics.set_pool_stats({"size": 4, "idle": 1, "max_size": 10})
+    body, content_type = metrics.render()
+    assert isinstance(body, bytes)
+    assert content_type.startswith("text/plain")
+
+
+_WORKER = """
+import sys
+sys.path.insert(0, {root!r})
+from api import metrics
+metrics.PREDICTIONS.labels("openai").inc()
+metrics.observe_stage("nearest", 0.02)
+"""
+
+_SCRAPER = """
+import sys
+sys.path.insert(0, {root!r})
+from api import metrics
+sys.stdout.write(metrics.render()[0].decode())
+"""
+
+
+def test_multiprocess_mode_aggregates_workers(tmp_path):
+    pytest.importorskip("prometheus_client")
+    env = dict(os.environ, PROMETHEUS_MULTIPROC_DIR=str(tmp_path))
+    for _ in range(2):
+        subprocess.run([sys.executable, "-c", _WORKER.format(root=str(ROOT))], env=env, check=True)
+    out = subprocess.run(
+        [sys.executable, "-c", _SCRAPER.format(root=str(ROOT))],
+        env=env, check=True, capture_output=True, text=True,
+    ).stdout
+    assert 'whereisthisplace_predictions_total{source="openai"} 2.0' in out
+    assert 'whereisthisplace_predict_stage_duration_seconds_count{stage="nearest"} 2.0' in out
@@ -0,0 +1,128 @@
+import sys
+import asyncio
+from pathlib import Path
+
+import pytest
+
+ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(ROOT))
+sys.path.insert(1, str(ROOT / "api"))
+
+from api.embedding import Embedding
+from api.inference import CanaryRouter, InferenceClient, InferenceError, ModelRoutingSync
+from scripts.model_rollout import compatibility_problems, latency_regression
+
+
+class FakeClient(InferenceClient):
+    name = "fake"
+
+    def __init__(self, errors=None):
+        self.errors = errors or {}
+        self.calls = []
+
+    def embed(self, image_data, filename=None, content_type=None):
+        self.calls.append(self.version)
+        if self.version in self.errors:
+            raise self.errors[self.version]
+        return Embedding([1.0, 0.0], self.version or "default")
+
+
+class FakePool:
+    def __init__(self, row):
+        self.row = row
+
+    async def fetchrow(self, query, *args):
+        if isinstance(self.row, Exception):
+            raise self.row
+        return self.row
+
+
+class UndefinedTableError(Exception):
+    sqlstate = "42P01"
+
+
+def test_compatible_model_has_no_problems():
+    new = Embedding([0.6, 0.8], "wpca128-v1")
+    assert compatibility_problems(new, 2, "wpca128-v1") == []
+    assert compatibility_problems(Embedding([0.6, 0.8]), 2, "wpca128-v1", declared_version="wpca128-v1") == []
+
+
+@pytest.mark.parametrize("embedding, gallery_dim, gallery_version, declared, message", [
+    (Embedding([1.0, 0.0, 0.0], "v1"), 2, "v1", None, "3 dimensions"),
+    (Embedding([1.0, 0.0], "v2"), 2, "v1", None, "does not match"),
+    (Embedding([1.0, 0.0]), 2, "v1", None, "reports no embedding version"),
+    (Embedding([1.0, 0.0], "v1"), 2, None, None, "no version stamp"),
+    (Embedding([1.0, 0.0], "v2"), 2, "v2", "v1", "not the declared"),
+])
+def test_incompatible_models_are_refused(embedding, gallery_dim, gallery_version, declared, message):
+    problems = compatibility_problems(embedding, gallery_dim, gallery_version, declared)
+    assert any(message in problem for problem in problems)
+
+
+def test_embeddings_must_agree_with_the_current_model_when_asked():
+    new = Embedding([0.0, 1.0], "v1")
+    old = Embedding([1.0, 0.0], "v1")
+    assert compatibility_problems(new, 2, "v1", reference=old) == []
+    assert "cosine similarity" in compatibility_problems(new, 2, "v1", reference=old, min_similarity=0.9)[0]
+
+
+def test_latency_regression():
+    old = [0.020] * 19 + [0.030]
+    assert latency_regression([0.025] * 20, old, max_ratio=1.5) is None
+    assert "p95" in latency_regression([0.020] * 18 + [0.200, 0.200], old, max_ratio=1.5)
+
+
+def test_router_sends_the_canary_share_to_the_new_version():
+    client = FakeClient()
+    router = CanaryRouter(client)
+
+    assert router.embed(b"img").model_version == "default"
+    router.route("2.0", 1.0)
+    assert router.embed(b"img").model_version == "2.0"
+    canary = router.canary
+    router.route("2.0", 0.5)
+    assert router.canary is canary
+    router.route(None, 0.0)
+    assert router.embed(b"img").model_version == "default"
+
+
+def test_router_falls_back_when_the_canary_is_gone():
+    router = CanaryRouter(FakeClient(errors={"2.0": InferenceError(404, "Model version not found")}))
+    router.route("2.0", 1.0)
+    assert router.embed(b"img").model_version == "default"
+
+    failing = CanaryRouter(FakeClient(errors={"2.0": InferenceError(400, "Invalid image")}))
+    failing.route("2.0", 1.0)
+    with pytest.raises(InferenceError):
+        failing.embed(b"img")
+
+
+def test_routing_sync_applies_the_table_row():
+    router = CanaryRouter(FakeClient())
+    sync = ModelRoutingSync(router)
+
+    asyncio.run(sync.refresh(FakePool({"gallery_version": "v1", "canary_version": "2.0", "canary_weight": 0.25})))
+    assert (router.canary.version, router.weight) == ("2.0", 0.25)
+
+    asyncio.run(sync.refresh(FakePool(None)))
+    assert router.canary is None
+
+
+def test_routing_sync_treats_a_missing_table_as_no_canary(capsys):
+    router = CanaryRouter(FakeClient())
+    sync = ModelRoutingSync(router)
+    router.route("2.0", 0.5)
+
+    missing = FakePool(UndefinedTableError('relation "model_routing" does not exist'))
+    asyncio.run(sync.refresh(missing))
+    asyncio.run(sync.refresh(missing))
+    assert sync.table_missing
+    assert router.canary is None
+    assert capsys.readouterr().out.count("does not exist") == 1
+
+    asyncio.run(sync.refresh(FakePool({"gallery_version": "v1", "canary_version": "2.0", "canary_weight": 0.25})))
+    assert not sync.table_missing
+    assert router.canary.version == "2.0"
+
+    with pytest.raises(RuntimeError):
+        asyncio.run(sync.refresh(FakePool(RuntimeError("connection lost"))))
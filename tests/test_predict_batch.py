@@ -0,0 +1,134 @@
+import asyncio
+import sys
+from pathlib import Path
+from types import SimpleNamespace
+from unittest.mock import AsyncMock, patch
+
+import pytest
+from fastapi import HTTPException
+
+ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(ROOT))
+sys.path.insert(1, str(ROOT / "api"))
+
+import numpy as np
+from routes.predict import predict_batch
+from api.repositories.match import nearest_many
+
+
+class DummyUploadFile:
+    def __init__(self, data: bytes, filename: str = "test.jpg", content_type: str = "image/jpeg"):
+        self.data = data
+        self.filename = filename
+        self.content_type = content_type
+
+    async def read(self) -> bytes:
+        return self.data
+
+
+def torchserve(files, **kwargs):
+    """Fake TorchServe: fails for images named bad*, else embeds the bytes' length."""
+    filename, data, _ = files["data"]
+    if filename.startswith("bad"):
+        return SimpleNamespace(status_code=507, text="worker died")
+    return SimpleNamespace(status_code=200, json=lambda: {"embedding": [float(len(data))] * 4})
+
+
+@patch("routes.predict.insert_predictions", new_callable=AsyncMock)
+@patch("routes.predict.nearest_many", new_callable=AsyncMock)
+@patch("routes.predict.requests.post")
+def test_batch_returns_per_item_results(mock_post, mock_nearest_many, mock_insert):
+    mock_post.side_effect = lambda url, files, **kwargs: torchserve(files)
+    mock_nearest_many.return_value = [
+        {"lat": 48.85, "lon": 2.29, "score": 0.8},
+        None,
+    ]
+    photos = [
+        DummyUploadFile(b"a", "one.jpg"),
+        DummyUploadFile(b"gif", "two.gif", "image/gif"),
+        DummyUploadFile(b"ccc", "bad.jpg"),
+        DummyUploadFile(b"dddd", "four.png", "image/png"),
+    ]
+
+    result = asyncio.run(predict_batch(photos=photos, db_pool="mock_pool"))
+
+    assert [r["index"] for r in result["results"]] == [0, 1, 2, 3]
+    assert [r["status"] for r in result["results"]] == ["success", "error", "error", "error"]
+    assert result["results"][0]["prediction"]["lat"] == 48.85
+    assert result["results"][1]["error"]["status_code"] == 400
+    assert result["results"][2]["error"] == {"status_code": 507, "detail": "TorchServe error: worker died"}
+    assert result["results"][3]["error"]["status_code"] == 404
+    assert (result["succeeded"], result["failed"]) == (1, 3)
+
+    # One search for every embedded image, one insert for every match.
+    mock_nearest_many.assert_awaited_once()
+    vecs = mock_nearest_many.await_args.args[0]
+    assert [v[0] for v in vecs] == [1.0, 4.0]
+    mock_insert.assert_awaited_once_with("mock_pool", [(48.85, 2.29, 0.8, None, "model")])
+
+
+@patch("routes.predict.insert_predictions", new_callable=AsyncMock)
+@patch("routes.predict.nearest_many", new_callable=AsyncMock)
+@patch("routes.predict.requests.post")
+def test_batch_applies_bias_detection(mock_post, mock_nearest_many, mock_insert):
+    mock_post.side_effect = lambda url, files, **kwargs: torchserve(files)
+    mock_nearest_many.return_value = [{"lat": 40.7, "lon": -74.0, "score": 0.95}]
+
+    result = asyncio.run(predict_batch(photos=[DummyUploadFile(b"x", "eiffel.jpg")], db_pool=None))
+
+    prediction = result["results"][0]["prediction"]
+    assert "European landmark" in prediction["bias_warning"]
+    assert prediction["original_score"] == 0.95
+    mock_insert.assert_not_awaited()
+
+
+@patch("routes.predict.BATCH_MAX_IMAGES", 2)
+def test_batch_rejects_too_many_images():
+    photos = [DummyUploadFile(b"x") for _ in range(3)]
+    with pytest.raises(HTTPException) as exc:
+        asyncio.run(predict_batch(photos=photos, db_pool=None))
+    assert exc.value.status_code == 413
+
+
+def test_batch_charges_each_image_against_the_rate_limit():
+    charged = []
+
+    def charge(amount):
+        charged.append(amount)
+        return 120
+
+    request = SimpleNamespace(state=SimpleNamespace(rate_limit_charge=charge))
+    photos = [DummyUploadFile(b"x") for _ in range(3)]
+    with pytest.raises(HTTPException) as exc:
+        asyncio.run(predict_batch(photos=photos, db_pool=None, request=request))
+    assert exc.value.status_code == 429
+    assert exc.value.headers == {"Retry-After": "120"}
+    assert charged == [2]
+
+
+class FetchPool:
+    def __init__(self, rows):
+        self.rows = rows
+        self.calls = []
+
+    async def fetch(self, query, *args):
+        self.calls.append((query, args))
+        return self.rows
+
+
+def test_nearest_many_runs_one_query_and_keeps_order():
+    pool = FetchPool([
+        {"idx": 1, "lat": 1.0, "lon": 2.0, "score": 0.5},
+        {"idx": 2, "lat": None, "lon": None, "score": None},
+        {"idx": 3, "lat": 5.0, "lon": 6.0, "score": 0.7},
+    ])
+
+    matches = asyncio.run(nearest_many([np.array([0.5, 1.0])] * 3, pool=pool))
+
+    assert matches == [
+        {"lat": 1.0, "lon": 2.0, "score": 0.5},
+        None,
+        {"lat": 5.0, "lon": 6.0, "score": 0.7},
+    ]
+    assert len(pool.calls) == 1
+    assert pool.calls[0][1] == (["[0.5,1.0]"] * 3,)
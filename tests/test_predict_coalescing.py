@@ -0,0 +1,76 @@
+import asyncio
+import sys
+import types
+from pathlib import Path
+from unittest.mock import AsyncMock, patch
+
+import pytest
+from fastapi import HTTPException
+
+ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(ROOT))
+sys.path.insert(1, str(ROOT / "api"))
+
+from routes.predict import predict
+
+
+class DummyUploadFile:
+    def __init__(self, data: bytes, filename: str = "test.jpg", content_type: str = "image/jpeg"):
+        self.data = data
+        self.filename = filename
+        self.content_type = content_type
+
+    async def read(self) -> bytes:
+        return self.data
+
+
+def request_with(headers):
+    app = types.SimpleNamespace(state=types.SimpleNamespace())
+    return types.SimpleNamespace(headers=headers, app=app)
+
+
+def slow_nearest():
+    async def nearest(vec, pool=None):
+        await asyncio.sleep(0.01)
+        return {"lat": 1.0, "lon": 2.0, "score": 0.5}
+    return nearest
+
+
+@patch("routes.predict.insert_prediction", new_callable=AsyncMock)
+@patch("routes.predict.requests.post")
+def test_concurrent_identical_uploads_run_once(mock_post, mock_insert):
+    mock_post.return_value.status_code = 200
+    mock_post.return_value.json.return_value = {"embedding": [0.0] * 128}
+
+    async def main():
+        return await asyncio.gather(*(
+            predict(photo=DummyUploadFile(b"same image"), mode="model", db_pool="pool")
+            for _ in range(3)
+        ))
+
+    with patch("routes.predict.nearest", new=slow_nearest()):
+        results = asyncio.run(main())
+
+    assert mock_post.call_count == 1
+    assert mock_insert.await_count == 1
+    assert results[0] == results[1] == results[2]
+
+
+@patch("routes.predict.insert_prediction", new_callable=AsyncMock)
+@patch("routes.predict.nearest", new_callable=AsyncMock)
+@patch("routes.predict.requests.post")
+def test_idempotency_key_replays_completed_result(mock_post, mock_nearest, mock_insert):
+    mock_post.return_value.status_code = 200
+    mock_post.return_value.json.return_value = {"embedding": [0.0] * 128}
+    mock_nearest.return_value = {"lat": 1.0, "lon": 2.0, "score": 0.5}
+    request = request_with({"idempotency-key": "retry-123"})
+
+    first = asyncio.run(predict(photo=DummyUploadFile(b"img"), mode="model", db_pool=None, request=request))
+    second = asyncio.run(predict(photo=DummyUploadFile(b"img"), mode="model", db_pool=None, request=request))
+
+    assert first == second
+    assert mock_post.call_count == 1
+
+    with pytest.raises(HTTPException) as exc:
+        asyncio.run(predict(photo=DummyUploadFile(b"other"), mode="model", db_pool=None, request=request))
+    assert exc.value.status_code == 422
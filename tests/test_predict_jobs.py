@@ -0,0 +1,95 @@
+import asyncio
+import sys
+import time
+import types
+from pathlib import Path
+from unittest.mock import AsyncMock, patch
+
+import pytest
+from fastapi import HTTPException
+
+ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(ROOT))
+sys.path.insert(1, str(ROOT / "api"))
+
+from api.jobs import JobManager
+import routes.predict as predict_module
+from routes.predict import get_prediction_job, submit_prediction_job
+
+
+class DummyUploadFile:
+    def __init__(self, data: bytes, filename: str = "test.jpg", content_type: str = "image/jpeg"):
+        self.data = data
+        self.filename = filename
+        self.content_type = content_type
+
+    async def read(self) -> bytes:
+        return self.data
+
+
+def request_from(host):
+    app = types.SimpleNamespace(state=types.SimpleNamespace())
+    return types.SimpleNamespace(headers={}, app=app, client=types.SimpleNamespace(host=host))
+
+
+@patch("routes.predict.insert_prediction", new_callable=AsyncMock)
+@patch("routes.predict.nearest", new_callable=AsyncMock)
+@patch("routes.predict.requests.post")
+def test_prediction_job_routes(mock_post, mock_nearest, mock_insert):
+    mock_post.return_value.status_code = 200
+    mock_post.return_value.json.return_value = {"embedding": [0.0] * 128}
+    mock_nearest.return_value = {"lat": 5.0, "lon": 6.0, "score": 0.7}
+
+    async def scenario():
+        manager = JobManager(workers=1, max_per_client=1)
+        with patch.object(predict_module, "prediction_jobs", manager):
+            manager.start()
+            accepted = await submit_prediction_job(
+                photo=DummyUploadFile(b"job"), mode="model", db_pool=None, request=request_from("1.2.3.4"))
+            with pytest.raises(HTTPException) as exc:
+                await submit_prediction_job(
+                    photo=DummyUploadFile(b"job2"), mode="model", db_pool=None, request=request_from("1.2.3.4"))
+            assert exc.value.status_code == 429
+            status = await get_prediction_job(accepted["job_id"], wait=5)
+            with pytest.raises(HTTPException) as missing:
+                await get_prediction_job("nope")
+            await manager.stop()
+        return accepted, status, missing.value
+
+    accepted, status, missing = asyncio.run(scenario())
+    assert accepted["status"] == "queued"
+    assert accepted["status_url"] == f"/predict/jobs/{accepted['job_id']}"
+    assert status["status"] == "succeeded"
+    assert status["result"]["prediction"]["lat"] == 5.0
+    assert missing.status_code == 404
+
+
+@patch("routes.predict.insert_prediction", new_callable=AsyncMock)
+@patch("routes.predict.nearest", new_callable=AsyncMock)
+@patch("routes.predict.requests.post")
+def test_polls_are_answered_while_a_slow_job_runs(mock_post, mock_nearest, mock_insert):
+    def slow_torchserve(*args, **kwargs):
+        time.sleep(0.5)
+        return types.SimpleNamespace(status_code=200, json=lambda: {"embedding": [0.0] * 128})
+
+    mock_post.side_effect = slow_torchserve
+    mock_nearest.return_value = {"lat": 5.0, "lon": 6.0, "score": 0.7}
+
+    async def scenario():
+        manager = JobManager(workers=1)
+        with patch.object(predict_module, "prediction_jobs", manager):
+            manager.start()
+            accepted = await submit_prediction_job(
+                photo=DummyUploadFile(b"slow job"), mode="model", db_pool=None, request=request_from("1.2.3.4"))
+            await asyncio.sleep(0.05)
+            start = time.monotonic()
+            polled = await get_prediction_job(accepted["job_id"])
+            poll_seconds = time.monotonic() - start
+            finished = await get_prediction_job(accepted["job_id"], wait=5)
+            await manager.stop()
+        return polled, poll_seconds, finished
+
+    polled, poll_seconds, finished = asyncio.run(scenario())
+    assert polled["status"] == "running"
+    assert poll_seconds < 0.1
+    assert finished["status"] == "succeeded"
@@ -0,0 +1,111 @@
+import asyncio
+import json
+import sys
+import time
+import types
+from pathlib import Path
+from unittest.mock import AsyncMock, patch
+
+ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(ROOT))
+sys.path.insert(1, str(ROOT / "api"))
+
+from routes.predict import predict_stream
+
+
+class DummyUploadFile:
+    def __init__(self, data: bytes, filename: str = "test.jpg", content_type: str = "image/jpeg"):
+        self.data = data
+        self.filename = filename
+        self.content_type = content_type
+
+    async def read(self) -> bytes:
+        return self.data
+
+
+def openai_answering(place, delay=0.0):
+    def create(**kwargs):
+        time.sleep(delay)
+        message = types.SimpleNamespace(content=place)
+        return types.SimpleNamespace(choices=[types.SimpleNamespace(message=message)])
+    completions = types.SimpleNamespace(create=create)
+    client = types.SimpleNamespace(chat=types.SimpleNamespace(completions=completions))
+    return types.SimpleNamespace(OpenAI=lambda api_key: client)
+
+
+def stream_events(**kwargs):
+    async def collect():
+        response = await predict_stream(photo=DummyUploadFile(b"stream"), **kwargs)
+        assert response.media_type == "application/x-ndjson"
+        return [json.loads(chunk) async for chunk in response.body_iterator]
+    return asyncio.run(collect())
+
+
+@patch("routes.predict.insert_prediction", new_callable=AsyncMock)
+@patch("routes.predict.nearest", new_callable=AsyncMock)
+@patch("routes.predict.requests.post")
+def test_model_mode_streams_one_final_event(mock_post, mock_nearest, mock_insert):
+    mock_post.return_value.status_code = 200
+    mock_post.return_value.json.return_value = {"embedding": [0.0] * 128}
+    mock_nearest.return_value = {"lat": 5.0, "lon": 6.0, "score": 0.7}
+
+    events = stream_events(mode="model", db_pool="mock_pool")
+
+    assert [(e["event"], e["final"]) for e in events] == [("model", True)]
+    assert events[0]["prediction"]["lat"] == 5.0
+    mock_insert.assert_awaited_once()
+
+
+@patch("routes.predict.insert_prediction", new_callable=AsyncMock)
+@patch("routes.predict.OPENAI_API_KEY", "test_key")
+@patch("routes.predict.requests.get")
+@patch("routes.predict.openai", new=openai_answering("Paris, France"))
+@patch("routes.predict.nearest", new_callable=AsyncMock)
+@patch("routes.predict.requests.post")
+def test_model_answer_comes_before_openai_refinement(mock_post, mock_nearest, mock_get, mock_insert):
+    mock_post.return_value.status_code = 200
+    mock_post.return_value.json.return_value = {"embedding": [0.0] * 128}
+    mock_nearest.return_value = {"lat": 5.0, "lon": 6.0, "score": 0.7}
+    mock_get.return_value.status_code = 200
+    mock_get.return_value.json.return_value = [{"lat": "48.8", "lon": "2.3"}]
+
+    events = stream_events(db_pool="mock_pool")
+
+    assert [(e["event"], e["final"]) for e in events] == [("model", False), ("refined", True)]
+    assert events[0]["prediction"]["source"] == "model"
+    assert events[1]["prediction"]["source"] == "openai"
+    assert events[1]["prediction"]["lat"] == 48.8
+    # Only the final answer is logged.
+    mock_insert.assert_awaited_once()
+    assert mock_insert.await_args.args[5] == "openai"
+
+
+@patch("routes.predict.insert_prediction", new_callable=AsyncMock)
+@patch("routes.predict.OPENAI_STREAM_TIMEOUT", 0.05)
+@patch("routes.predict.OPENAI_API_KEY", "test_key")
+@patch("routes.predict.openai", new=openai_answering("Paris, France", delay=0.5))
+@patch("routes.predict.nearest", new_callable=AsyncMock)
+@patch("routes.predict.requests.post")
+def test_slow_openai_falls_back_to_model_answer(mock_post, mock_nearest, mock_insert):
+    mock_post.return_value.status_code = 200
+    mock_post.return_value.json.return_value = {"embedding": [0.0] * 128}
+    mock_nearest.return_value = {"lat": 5.0, "lon": 6.0, "score": 0.7}
+
+    with patch("routes.predict.requests.get") as mock_get:
+        mock_get.return_value.status_code = 404
+        events = stream_events(db_pool=None)
+
+    refined = events[-1]
+    assert refined["event"] == "refined"
+    assert refined["prediction"]["source"] == "model"
+    assert refined["prediction"]["bias_warning"] == "OpenAI unavailable: timed out"
+
+
+@patch("routes.predict.requests.post")
+def test_torchserve_failure_is_an_error_event(mock_post):
+    mock_post.return_value.status_code = 503
+    mock_post.return_value.text = "no workers"
+
+    events = stream_events(mode="model", db_pool=None)
+
+    assert events == [{"event": "error", "final": True, "status_code": 503, "detail": "TorchServe error: no workers"}]
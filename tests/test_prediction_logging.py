@@ -9,6 +9,7 @@ sys.path.insert(0, str(ROOT))
 sys.path.insert(1, str(ROOT / "api"))
 
 from routes.predict import predict
+from test_exif import with_gps
 
 class DummyUploadFile:
     def __init__(self, data: bytes, filename: str = "test.jpg", content_type: str = "image/jpeg"):
@@ -33,3 +34,38 @@ def test_prediction_logged(mock_post, mock_nearest, mock_insert):
 
     assert result["status"] == "success"
     mock_insert.assert_awaited_once()
+
+
+@patch("routes.predict.SEARCH_AND_LOG", True)
+@patch("routes.predict.insert_prediction", new_callable=AsyncMock)
+@patch("routes.predict.nearest", new_callable=AsyncMock)
+@patch("routes.predict.nearest_and_log", new_callable=AsyncMock)
+@patch("routes.predict.requests.post")
+def test_model_prediction_searched_and_logged_in_one_statement(mock_post, mock_search_and_log, mock_nearest, mock_insert):
+    mock_post.return_value.status_code = 200
+    mock_post.return_value.json.return_value = {"embedding": [0.0]*128}
+    mock_search_and_log.return_value = {"lat": 40.7, "lon": -74.0, "score": 0.95}
+
+    file = DummyUploadFile(b"search and log", filename="eiffel.jpg")
+    result = asyncio.run(predict(photo=file, mode="model", db_pool="mock_pool"))
+
+    mock_search_and_log.assert_awaited_once()
+    mock_nearest.assert_not_awaited()
+    mock_insert.assert_not_awaited()
+    kwargs = mock_search_and_log.await_args.kwargs
+    # The SQL gets the same reason the response reports.
+    assert kwargs["filename_reason"] == result["prediction"]["bias_warning"]
+    assert abs(result["prediction"]["score"] - 0.95 * kwargs["score_factor"]) < 1e-9
+
+
+@patch("routes.predict.insert_prediction", new_callable=AsyncMock)
+@patch("routes.predict.nearest", new_callable=AsyncMock)
+@patch("routes.predict.requests.post")
+def test_exif_gps_answers_without_inference(mock_post, mock_nearest, mock_insert):
+    result = asyncio.run(predict(photo=DummyUploadFile(with_gps(48.8584, 2.2945)), db_pool="mock_pool"))
+
+    assert result["prediction"]["source"] == "exif"
+    assert abs(result["prediction"]["lat"] - 48.8584) < 1e-6
+    mock_post.assert_not_called()
+    mock_nearest.assert_not_awaited()
+    assert mock_insert.await_args.args[-1] == "exif"
@@ -0,0 +1,161 @@
+import asyncio
+import sys
+import threading
+from pathlib import Path
+from unittest.mock import AsyncMock, patch
+
+ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(ROOT))
+sys.path.insert(1, str(ROOT / "api"))
+
+from api import shadow
+from api.embedding import Embedding
+from api.inference import InferenceClient
+from api.shadow import ShadowMirror, distance_km
+
+PRIMARY = {"lat": 48.8584, "lon": 2.2945, "score": 0.9, "source": "model"}
+
+
+class FakeClient(InferenceClient):
+    name = "fake"
+
+    def __init__(self, release=None):
+        self.release = release
+        self.calls = 0
+
+    def embed(self, image_data, filename=None, content_type=None):
+        self.calls += 1
+        if self.release is not None:
+            self.release.wait(5)
+        return Embedding([1.0, 0.0])
+
+
+class Recorder:
+    def __init__(self):
+        self.values = []
+
+    def labels(self, *labels):
+        self.labels_seen = labels
+        return self
+
+    def inc(self, amount=1):
+        self.values.append(self.labels_seen[0])
+
+    def observe(self, value):
+        self.values.append(value)
+
+
+async def london(vec, pool=None):
+    return {"lat": 51.5007, "lon": -0.1246, "score": 0.8}
+
+
+def test_distance_km():
+    assert distance_km(1.0, 2.0, 1.0, 2.0) == 0.0
+    assert 335 < distance_km(48.8584, 2.2945, 51.5007, -0.1246) < 345
+
+
+def test_mirror_is_off_without_a_candidate():
+    mirror = ShadowMirror(None, sample_rate=1.0)
+    assert not mirror.enabled
+    assert not mirror.sampled()
+    assert ShadowMirror(FakeClient(), sample_rate=1.0).sampled()
+
+
+def test_run_records_the_distance_to_the_answer():
+    requests, distances = Recorder(), Recorder()
+    mirror = ShadowMirror(FakeClient(), sample_rate=1.0)
+    with patch.object(shadow, "nearest", new=london), \
+            patch.object(shadow, "SHADOW_REQUESTS", requests), \
+            patch.object(shadow, "SHADOW_DISTANCE", distances):
+        asyncio.run(mirror.run(b"img", "eiffel.jpg", "image/jpeg", PRIMARY, pool="pool"))
+    mirror.close()
+
+    assert requests.values == ["compared"]
+    assert 335 < distances.values[0] < 345
+    assert distances.labels_seen == ("model",)
+
+
+def test_busy_mirror_drops_instead_of_queueing():
+    release = threading.Event()
+    requests = Recorder()
+    client = FakeClient(release)
+    mirror = ShadowMirror(client, sample_rate=1.0, max_concurrency=1)
+
+    async def main():
+        first = asyncio.create_task(mirror.run(b"a", None, None, PRIMARY, None))
+        await asyncio.sleep(0.05)
+        await mirror.run(b"b", None, None, PRIMARY, None)
+        release.set()
+        await first
+
+    with patch.object(shadow, "nearest", new=london), patch.object(shadow, "SHADOW_REQUESTS", requests):
+        asyncio.run(main())
+    mirror.close()
+
+    assert client.calls == 1
+    assert requests.values == ["dropped", "compared"]
+
+
+def test_timed_out_call_keeps_its_slot_until_the_candidate_answers():
+    release = threading.Event()
+    requests = Recorder()
+    mirror = ShadowMirror(FakeClient(release), sample_rate=1.0, max_concurrency=1, timeout=0.05)
+
+    async def main():
+        await mirror.run(b"a", None, None, PRIMARY, None)
+        await mirror.run(b"b", None, None, PRIMARY, None)
+        release.set()
+        await asyncio.sleep(0.1)
+        await mirror.run(b"c", None, None, PRIMARY, None)
+
+    with patch.object(shadow, "nearest", new=london), patch.object(shadow, "SHADOW_REQUESTS", requests):
+        asyncio.run(main())
+    mirror.close()
+
+    assert requests.values == ["timeout", "dropped", "compared"]
+
+
+class DummyUploadFile:
+    def __init__(self, data: bytes, filename: str = "test.jpg", content_type: str = "image/jpeg"):
+        self.data = data
+        self.filename = filename
+        self.content_type = content_type
+
+    async def read(self) -> bytes:
+        return self.data
+
+
+class DummyBackgroundTasks:
+    def __init__(self):
+        self.tasks = []
+
+    def add_task(self, func, *args):
+        self.tasks.append((func, args))
+
+
+@patch("routes.predict.insert_prediction", new_callable=AsyncMock)
+@patch("routes.predict.requests.post")
+def test_predict_mirrors_sampled_requests_after_the_response(mock_post, mock_insert):
+    from routes import predict as predict_module
+
+    mock_post.return_value.status_code = 200
+    mock_post.return_value.json.return_value = {"embedding": [0.0] * 128}
+    background = DummyBackgroundTasks()
+    mirror = ShadowMirror(FakeClient(), sample_rate=1.0)
+
+    async def nearest(vec, pool=None):
+        return {"lat": 1.0, "lon": 2.0, "score": 0.5}
+
+    with patch.object(predict_module, "nearest", new=nearest), \
+            patch.object(predict_module, "shadow_mirror", mirror):
+        result = asyncio.run(predict_module.predict(
+            photo=DummyUploadFile(b"mirrored image"), mode="model", db_pool="pool",
+            background_tasks=background,
+        ))
+
+    assert result["status"] == "success"
+    [(func, args)] = background.tasks
+    assert func == mirror.run
+    assert args[0] == b"mirrored image"
+    assert args[3] == result["prediction"]
+    assert args[4] == "pool"
@@ -0,0 +1,66 @@
+import sys
+import asyncio
+import time
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(ROOT))
+sys.path.insert(1, str(ROOT / "api"))
+
+from api import timing
+
+
+def test_stage_is_noop_without_recorder():
+    with timing.stage("torchserve"):
+        pass
+    timing.lap("multipart")
+    assert timing.current() is None
+
+
+def test_stages_recorded_and_formatted():
+    timings, token = timing.begin()
+    try:
+        with timing.stage("torchserve"):
+            time.sleep(0.01)
+        with timing.stage("nearest"):
+            pass
+        with timing.stage("nearest"):
+            pass
+    finally:
+        timing.end(token)
+
+    assert timing.current() is None
+    assert timings.stages["torchserve"] >= 0.01
+    assert set(timings.stages) == {"torchserve", "nearest"}
+    header = timings.server_timing(timings.total())
+    assert header.startswith("torchserve;dur=")
+    assert "nearest;dur=" in header
+    assert header.split(", ")[-1].startswith("total;dur=")
+
+
+def test_lap_measures_since_checkpoint():
+    timings, token = timing.begin()
+    try:
+        time.sleep(0.02)
+        timing.checkpoint()
+        timing.lap("multipart")
+    finally:
+        timing.end(token)
+    assert timings.stages["multipart"] < 0.02
+
+
+def test_timed_decorator_on_coroutine():
+    @timing.timed("openai")
+    async def call():
+        await asyncio.sleep(0)
+        return 42
+
+    async def run():
+        timings, token = timing.begin()
+        try:
+            assert await call() == 42
+        finally:
+            timing.end(token)
+        return timings
+
+    assert "openai" in asyncio.run(run()).stages
@@ -0,0 +1,86 @@
+import json
+import sys
+import zipfile
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(ROOT))
+
+from scripts.torchserve_config import (
+    GIB,
+    PROFILES,
+    Host,
+    detect_host,
+    model_version,
+    plan,
+    read_plan,
+    read_properties,
+    render,
+    render_env,
+)
+
+
+def test_plan_uses_every_core_of_a_large_host():
+    host = Host(cpus=32, memory_bytes=128 * GIB)
+
+    throughput = plan(host, PROFILES["throughput"])
+    assert throughput.workers == 32
+    assert throughput.threads_per_worker == 1
+    assert throughput.batch_size == 8
+    assert throughput.job_queue_size == 32 * 8 * 4
+
+    latency = plan(host, PROFILES["latency"])
+    assert latency.workers * latency.threads_per_worker == 32
+    assert latency.batch_size == 1 and latency.max_batch_delay_ms == 0
+
+
+def test_plan_is_capped_by_memory_and_small_hosts():
+    assert plan(Host(cpus=32, memory_bytes=8 * GIB), PROFILES["throughput"]).workers == 6
+    small = plan(Host(cpus=1, memory_bytes=2 * GIB), PROFILES["latency"])
+    assert (small.workers, small.threads_per_worker) == (1, 1)
+    assert small.job_queue_size == 100
+
+
+def test_numa_hosts_enable_the_cpu_launcher():
+    p = plan(Host(cpus=64, memory_bytes=256 * GIB, numa_nodes=2), PROFILES["balanced"])
+    assert p.cpu_launcher
+    assert render_env(p) == ""
+    assert "OMP_NUM_THREADS=2" in render_env(plan(Host(cpus=8, memory_bytes=0), PROFILES["balanced"]))
+
+
+def test_detect_host_reads_cgroup_limits(tmp_path):
+    (tmp_path / "proc").mkdir()
+    (tmp_path / "proc/meminfo").write_text("MemTotal:       65536000 kB\nMemFree: 1 kB\n")
+    cgroup = tmp_path / "sys/fs/cgroup"
+    cgroup.mkdir(parents=True)
+    (cgroup / "cpu.max").write_text("100000 100000\n")
+    (cgroup / "memory.max").write_text(str(4 * GIB))
+    for node in ("node0", "node1"):
+        (tmp_path / "sys/devices/system/node" / node).mkdir(parents=True)
+
+    host = detect_host(tmp_path)
+
+    assert host == Host(cpus=1, memory_bytes=4 * GIB, numa_nodes=2)
+
+
+def test_render_keeps_the_base_config_and_registers_the_model(tmp_path):
+    base = tmp_path / "base.properties"
+    base.write_text("# comment\ninference_address=http://0.0.0.0:8080\ndefault_workers_per_model=1\n")
+    mar = tmp_path / "where.mar"
+    with zipfile.ZipFile(mar, "w") as archive:
+        archive.writestr("MAR-INF/MANIFEST.json", json.dumps({"model": {"modelVersion": "2.1"}}))
+    p = plan(Host(cpus=16, memory_bytes=64 * GIB), PROFILES["balanced"])
+
+    config = tmp_path / "config.properties"
+    config.write_text(render(p, read_properties(base), "where", model_version(mar)))
+
+    properties = read_properties(config)
+    assert properties["inference_address"] == "http://0.0.0.0:8080"
+    assert properties["default_workers_per_model"] == "8"
+    assert properties["metrics_mode"] == "prometheus"
+    registration = json.loads(properties["models"])["where"]["2.1"]
+    assert registration["batchSize"] == 4
+    assert registration["maxBatchDelay"] == 10
+    assert registration["minWorkers"] == registration["maxWorkers"] == 8
+    assert read_plan(config) == p
+    assert model_version(tmp_path / "missing.mar") == "1.0"